@@ -0,0 +1,203 @@
+"""
+本機的合成 HLS 來源：ffmpeg testsrc2 + sine 產生影音，以 ThreadingHTTPServer 提供。
+- live：ffmpeg -re 即時產生，滑動視窗的 playlist（delete_segments），模擬直播
+- vod：預先產生完整的 playlist（#EXT-X-ENDLIST），模擬可全速下載的節目
+- looped：每種 bitrate 只預先產生一段循環素材，playlist 依時鐘動態產生；
+  不需要每個頻道各跑一個編碼器，數百個頻道也不會吃掉壓測主機的 CPU
+bench/pipeline.py 與 bench/soak.py 以它作為錄影來源。
+"""
+import os
+import re
+import time
+import shutil
+import threading
+import subprocess
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+SEGMENT_SECONDS = 2
+LIVE_WINDOW = 6          # 直播 playlist 保留的分段數
+LOOP_SECONDS = 60        # looped 頻道循環素材的長度
+LOOPED_PLAYLIST_RE = re.compile(r"^/([^/]+)/index\.m3u8$")
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    origin = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        m = LOOPED_PLAYLIST_RE.match(self.path.split("?")[0])
+        if m and self.origin is not None and m.group(1) in self.origin._looped:
+            body = self.origin._looped_playlist(m.group(1))
+            if body is None:
+                self.send_error(404, "offline")
+                return
+            data = body.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/vnd.apple.mpegurl")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        super().do_GET()
+
+    def end_headers(self):
+        # playlist 會一直更新，不能被快取
+        if self.path.endswith(".m3u8"):
+            self.send_header("Cache-Control", "no-cache")
+        super().end_headers()
+
+
+def _source_args(duration: float = None, size: str = "1280x720", fps: int = 30, realtime: bool = False) -> list[str]:
+    limit = ["-t", str(duration)] if duration else []
+    re_ = ["-re"] if realtime else []   # -re 只作用於緊接的輸入
+    return [
+        "ffmpeg", "-hide_banner", "-v", "error", "-y",
+        *re_, "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={fps}",
+        *re_, "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000",
+        *limit,
+    ]
+
+
+def _encode_args(bitrate_kbps: int, fps: int) -> list[str]:
+    return [
+        "-c:v", "libx264", "-preset", "veryfast", "-tune", "zerolatency",
+        "-b:v", f"{bitrate_kbps}k", "-maxrate", f"{bitrate_kbps}k", "-bufsize", f"{bitrate_kbps * 2}k",
+        "-g", str(fps * SEGMENT_SECONDS), "-keyint_min", str(fps * SEGMENT_SECONDS), "-sc_threshold", "0",
+        "-c:a", "aac", "-b:a", "128k",
+    ]
+
+
+def make_ts(path: str, duration: float, bitrate_kbps: int = 4000, size: str = "1280x720", fps: int = 30) -> str:
+    """產生一個合成的 TS 檔（轉檔 / 縮圖 / remux 的輸入）"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    cmd = _source_args(duration, size, fps) + _encode_args(bitrate_kbps, fps) + ["-f", "mpegts", path]
+    subprocess.run(cmd, check=True)
+    return path
+
+
+class Origin:
+    """在 root 目錄下提供多個 HLS 頻道，url(name) 回傳 streamlink 可用的 hls:// URL"""
+
+    def __init__(self, root: str, host: str = "127.0.0.1", port: int = 0):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        handler = partial(type("OriginHandler", (_QuietHandler,), {"origin": self}), directory=root)
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address[:2]
+        self._live = {}    # name -> ffmpeg Popen
+        self._loops = {}   # bitrate -> 循環素材的分段檔名
+        self._looped = {}  # name -> {"bitrate", "live_since"}
+        self._looped_lock = threading.Lock()
+        threading.Thread(target=self.server.serve_forever, name="BenchOrigin", daemon=True).start()
+
+    def url(self, name: str, host: str = None) -> str:
+        """host 為其他機器連到這個來源用的位址（來源綁在 0.0.0.0 時）"""
+        return f"hls://http://{host or self.host}:{self.port}/{name}/index.m3u8"
+
+    def _channel_dir(self, name: str) -> str:
+        path = os.path.join(self.root, name)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        return path
+
+    def _hls_args(self, path: str, vod: bool) -> list[str]:
+        flags = ["-hls_playlist_type", "vod"] if vod else ["-hls_list_size", "6", "-hls_flags", "delete_segments"]
+        return ["-f", "hls", "-hls_time", str(SEGMENT_SECONDS), *flags,
+                "-hls_segment_filename", os.path.join(path, "seg%05d.ts"), os.path.join(path, "index.m3u8")]
+
+    def add_vod(self, name: str, duration: float, bitrate_kbps: int = 4000, size: str = "1280x720", fps: int = 30) -> str:
+        path = self._channel_dir(name)
+        cmd = _source_args(duration, size, fps) + _encode_args(bitrate_kbps, fps) + self._hls_args(path, vod=True)
+        subprocess.run(cmd, check=True)
+        return self.url(name)
+
+    def start_live(self, name: str, bitrate_kbps: int = 4000, size: str = "1280x720", fps: int = 30,
+                   wait: float = 15) -> str:
+        """開始直播；等到 playlist 至少有一個分段才回傳（超過 wait 秒仍沒有就拋出 TimeoutError）"""
+        self.stop_live(name)
+        path = self._channel_dir(name)
+        cmd = _source_args(None, size, fps, realtime=True) + _encode_args(bitrate_kbps, fps) + self._hls_args(path, vod=False)
+        self._live[name] = subprocess.Popen(cmd, stdin=subprocess.DEVNULL)
+        playlist = os.path.join(path, "index.m3u8")
+        deadline = time.time() + wait
+        while not os.path.exists(playlist):
+            if time.time() > deadline:
+                self.stop_live(name)
+                raise TimeoutError(f"直播來源 {name} 在 {wait} 秒內沒有產生 playlist")
+            time.sleep(0.1)
+        return self.url(name)
+
+    def stop_live(self, name: str):
+        proc = self._live.pop(name, None)
+        if proc and proc.poll() is None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        # 停播後移除 playlist，streamlink 會看到「沒有直播」
+        shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def is_live(self, name: str) -> bool:
+        proc = self._live.get(name)
+        return proc is not None and proc.poll() is None
+
+    def _loop_segments(self, bitrate_kbps: int, size: str, fps: int) -> list[str]:
+        if bitrate_kbps not in self._loops:
+            path = self._channel_dir(f"_loop{bitrate_kbps}")
+            cmd = (_source_args(LOOP_SECONDS, size, fps) + _encode_args(bitrate_kbps, fps)
+                   + self._hls_args(path, vod=True))
+            subprocess.run(cmd, check=True)
+            self._loops[bitrate_kbps] = sorted(f for f in os.listdir(path) if f.endswith(".ts"))
+        return self._loops[bitrate_kbps]
+
+    def add_looped(self, name: str, bitrate_kbps: int = 4000, size: str = "1280x720", fps: int = 30) -> str:
+        """新增一個 looped 頻道（預設未開播），以 set_live 控制開關"""
+        self._loop_segments(bitrate_kbps, size, fps)
+        with self._looped_lock:
+            self._looped[name] = {"bitrate": bitrate_kbps, "live_since": None}
+        return self.url(name)
+
+    def set_live(self, name: str, live: bool):
+        with self._looped_lock:
+            channel = self._looped[name]
+            if live and channel["live_since"] is None:
+                channel["live_since"] = time.time()
+            elif not live:
+                channel["live_since"] = None
+
+    def live_since(self, name: str):
+        with self._looped_lock:
+            return self._looped[name]["live_since"]
+
+    def _looped_playlist(self, name: str):
+        """依開播後經過的時間產生滑動視窗 playlist；素材循環時插入 EXT-X-DISCONTINUITY。未開播回傳 None"""
+        with self._looped_lock:
+            channel = self._looped.get(name)
+            if channel is None or channel["live_since"] is None:
+                return None
+            bitrate, since = channel["bitrate"], channel["live_since"]
+        segments = self._loops[bitrate]
+        n = len(segments)
+        latest = int((time.time() - since) // SEGMENT_SECONDS)
+        first = max(0, latest - LIVE_WINDOW + 1)
+        lines = [
+            "#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}",
+            f"#EXT-X-MEDIA-SEQUENCE:{first}",
+            f"#EXT-X-DISCONTINUITY-SEQUENCE:{first // n}",
+        ]
+        for seq in range(first, latest + 1):
+            if seq > first and seq % n == 0:
+                lines.append("#EXT-X-DISCONTINUITY")
+            lines += [f"#EXTINF:{SEGMENT_SECONDS:.3f},", f"/_loop{bitrate}/{segments[seq % n]}"]
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        for name in list(self._live):
+            self.stop_live(name)
+        self.server.shutdown()
+        self.server.server_close()
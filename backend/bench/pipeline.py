@@ -0,0 +1,252 @@
+"""
+端到端效能基準：在暫存目錄中以本機合成 HLS 來源（bench/origin.py）驅動真實的
+record_stream / ts_to_mp4 / generate_thumbnail / stream_ts_to_mp4 / start_hls_stream。
+
+    cd backend
+    python -m bench.pipeline --out bench-results/$(git rev-parse --short HEAD).json
+    python -m bench.pipeline --compare bench-results/<舊 commit>.json
+
+需要 ffmpeg、ffprobe、streamlink。輸出為 JSON：commit、環境、設定與各項指標（多次執行取中位數），
+--compare 會列出與基準檔的差異。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+import subprocess
+
+from bench.origin import Origin, make_ts
+
+BENCH_TASK_DIR = "bench"
+POLL = 0.05
+
+
+def _load_main(work_dir: str):
+    """把 main 的各資料目錄指到 work_dir 下再匯入，不會碰到正式的 /data、/recordings"""
+    for env, name in (("DATA_DIR", "data"), ("RECORDINGS_DIR", "recordings"),
+                      ("HLS_DIR", "hls"), ("THUMBNAILS_DIR", "thumbnails")):
+        os.environ[env] = os.path.join(work_dir, name)
+    import main
+    return main
+
+
+def _wait_for(predicate, timeout: float) -> float:
+    """等 predicate() 為真，回傳經過秒數；逾時拋出 TimeoutError"""
+    start = time.time()
+    while not predicate():
+        if time.time() - start > timeout:
+            raise TimeoutError
+        time.sleep(POLL)
+    return time.time() - start
+
+
+def _size(path) -> int:
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
+
+
+def _task(main, name: str, url: str, **fields):
+    task = main.Task(id=f"bench-{name}", name=f"bench_{name}", url=url, interval=60, save_dir=BENCH_TASK_DIR, **fields)
+    tasks = [t for t in main.get_tasks() if t["id"] != task.id] + [task.dict()]
+    main.save_tasks(tasks)
+    return task
+
+
+def bench_record(main, url: str, name: str, seconds: float = None, timeout: float = 120) -> dict:
+    """
+    錄影：time-to-first-byte（呼叫 record_stream 到輸出檔出現資料）與 ingest 吞吐量。
+    seconds 為 None 時（VOD）錄到串流結束，否則錄 seconds 秒後中止（直播）。
+    """
+    task = _task(main, name, url)
+    start = time.time()
+    thread = threading.Thread(target=main.record_stream, args=(task,), daemon=True)
+    thread.start()
+    ttfb = _wait_for(lambda: _size(main.recording_outputs.get(task.id)) > 0, timeout)
+    out_file = main.recording_outputs[task.id]
+    first_byte = time.time()
+    if seconds is not None:
+        time.sleep(max(0.0, seconds - (first_byte - start)))
+        proc = main.active_recordings.get(task.id)
+        if proc is not None:
+            proc.terminate()
+    _wait_for(lambda: task.id not in main.active_recordings, timeout)
+    ingest = time.time() - first_byte
+    size = _size(out_file)
+    thread.join(timeout)
+    return {
+        "ttfb_s": round(ttfb, 3),
+        "bytes": size,
+        "ingest_s": round(ingest, 3),
+        "throughput_mbps": round(size * 8 / ingest / 1e6, 3) if ingest > 0 else None,
+    }
+
+
+def bench_convert(main, source: str, media_seconds: float, quality: str) -> dict:
+    """ts_to_mp4：speed factor = 媒體時長 / 實際耗時（> 1 表示比即時快）"""
+    src = os.path.join(os.path.dirname(source), "convert_input.ts")
+    shutil.copyfile(source, src)
+    key = "bench_convert"
+    start = time.time()
+    output = main.ts_to_mp4(src, quality, task_key_override=key)
+    wall = time.time() - start
+    status = main.conversion_tasks.get(key) or {}
+    if output and os.path.exists(output):
+        os.remove(output)
+    return {
+        "ok": bool(output),
+        "path": status.get("path"),
+        "wall_s": round(wall, 3),
+        "speed_factor": round(media_seconds / wall, 3) if output else None,
+        "saved_ratio": round(status["saved_bytes"] / _size(source), 3) if status.get("saved_bytes") else None,
+    }
+
+
+def bench_thumbnail(main, source: str) -> dict:
+    start = time.time()
+    out_dir = main.generate_thumbnail(source)
+    latency = time.time() - start
+    count = len(os.listdir(out_dir)) if out_dir else 0
+    if out_dir:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return {"latency_s": round(latency, 3), "count": count}
+
+
+def bench_remux(main, task_id: str, filename: str) -> dict:
+    """stream_ts_to_mp4：第一個 fragmented mp4 區塊送出的時間（播放器可開始解碼）與完整 remux 時間"""
+    async def _consume(response):
+        start = time.time()
+        first, total = None, 0
+        async for chunk in response.body_iterator:
+            if first is None:
+                first = time.time() - start
+            total += len(chunk)
+        return first, time.time() - start, total
+
+    response = main.stream_ts_to_mp4(task_id, filename)
+    first, wall, total = asyncio.run(_consume(response))
+    return {"ttff_s": round(first, 3) if first is not None else None, "wall_s": round(wall, 3), "bytes": total}
+
+
+def bench_hls(main, url: str, timeout: float = 60) -> dict:
+    """start_hls_stream：到 stream.m3u8 出現（第一個分段完成）的時間"""
+    task = _task(main, "hls", url, hls_enable=True)
+    playlist = os.path.join(main.HLS_DIR, task.id, "stream.m3u8")
+    start = time.time()
+    main.start_hls_stream(task)
+    try:
+        ready = _wait_for(lambda: os.path.exists(playlist), timeout)
+    finally:
+        main.stop_hls_stream(task.id)
+    return {"time_to_playlist_s": round(ready, 3), "startup_s": round(time.time() - start - ready, 3)}
+
+
+def run_once(main, origin: Origin, args) -> dict:
+    results = {}
+    live_url = origin.start_live("live", bitrate_kbps=args.bitrate)
+    try:
+        results["record_live"] = bench_record(main, live_url, "live", seconds=args.record_seconds)
+        results["hls_start"] = bench_hls(main, live_url)
+    finally:
+        origin.stop_live("live")
+    results["record_vod"] = bench_record(main, origin.url("vod"), "vod")
+
+    save_dir = os.path.join(main.RECORDINGS_DIR, BENCH_TASK_DIR)
+    source = os.path.join(save_dir, "bench_source.ts")
+    if not os.path.exists(source):
+        make_ts(source, args.convert_seconds, args.bitrate)
+    results["thumbnail"] = bench_thumbnail(main, source)
+    results["remux"] = bench_remux(main, _task(main, "remux", origin.url("vod")).id, os.path.basename(source))
+    results["convert"] = bench_convert(main, source, args.convert_seconds, args.quality)
+    return results
+
+
+def _flatten(results: dict) -> dict:
+    return {f"{stage}.{k}": v for stage, metrics in results.items() for k, v in metrics.items()}
+
+
+def _median(runs: list[dict]) -> dict:
+    merged = {}
+    for key in runs[0]:
+        values = [r[key] for r in runs if isinstance(r.get(key), (int, float)) and not isinstance(r.get(key), bool)]
+        merged[key] = statistics.median(values) if values else runs[-1][key]
+    return merged
+
+
+def _git(*cmd) -> str:
+    try:
+        return subprocess.run(["git", *cmd], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(current: dict, baseline: dict):
+    print(f"{'metric':32} {'baseline':>12} {'current':>12} {'delta':>8}")
+    for key, value in current["results"].items():
+        old = baseline.get("results", {}).get(key)
+        if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or isinstance(value, bool):
+            continue
+        delta = f"{(value - old) / old * 100:+.1f}%" if old else "-"
+        print(f"{key:32} {old:>12.3f} {value:>12.3f} {delta:>8}")
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="錄影 / 轉檔流程的端到端效能基準")
+    parser.add_argument("--work-dir", default=os.environ.get("BENCH_DIR"), help="暫存目錄（預設新建後刪除）")
+    parser.add_argument("--repeat", type=int, default=3, help="重複次數，各指標取中位數")
+    parser.add_argument("--record-seconds", type=float, default=20, help="直播錄影長度")
+    parser.add_argument("--vod-seconds", type=float, default=120, help="VOD 節目長度")
+    parser.add_argument("--convert-seconds", type=float, default=60, help="轉檔 / 縮圖 / remux 輸入長度")
+    parser.add_argument("--bitrate", type=int, default=4000, help="合成來源的影像 bitrate（kbps）")
+    parser.add_argument("--quality", default="high", choices=["extreme", "high", "medium", "low"])
+    parser.add_argument("--out", help="結果 JSON 寫入路徑")
+    parser.add_argument("--compare", help="與這個結果 JSON 比較")
+    args = parser.parse_args(argv)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="streamlink-bench-")
+    cleanup = not args.work_dir
+    main = _load_main(work_dir)
+    origin = Origin(os.path.join(work_dir, "origin"))
+    try:
+        origin.add_vod("vod", args.vod_seconds, bitrate_kbps=args.bitrate)
+        runs = []
+        for i in range(args.repeat):
+            print(f"[Bench] 第 {i + 1}/{args.repeat} 次")
+            runs.append(_flatten(run_once(main, origin, args)))
+    finally:
+        origin.close()
+        if cleanup:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain")),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "work_dir")},
+        "results": _median(runs),
+        "runs": runs,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
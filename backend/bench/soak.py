@@ -0,0 +1,358 @@
+"""
+容量 / 長時間壓測：對一個執行中的 backend 透過 /tasks API 建立 N 個任務，指向本機的假直播來源
+（bench/origin.py 的 looped 頻道），依開播模式切換各頻道的直播狀態，長時間量測：
+- 錯過的開播（開播後 interval + grace 內沒有開始錄影，或下播前都沒錄到）
+- 開播到開始錄影的延遲與超過排程 interval 的部分（scheduler lag）
+- 錄影中斷（頻道仍在直播、已經錄到過，卻不在 active_recordings 的時間）
+- API 延遲 p50 / p99、backend 程序樹 RSS 成長、磁碟寫入量
+
+    cd backend
+    python -m bench.soak --channels 200 --hours 4 --out soak-200.json
+    python -m bench.soak --ramp 50,100,200,400 --step-minutes 30 --pattern periodic:600:300
+
+--ramp 依序提高頻道數，每一階量測 step-minutes，最後以仍「健康」的最大頻道數作為容量。
+backend 需要能連到來源：來源預設綁 0.0.0.0，--advertise-host 為 backend 看到的壓測主機位址。
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+import urllib.request
+import urllib.error
+
+import psutil
+
+from bench.origin import Origin
+
+GO_LIVE_GRACE_SECONDS = 30
+
+
+def _percentile(values: list[float], pct: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class Api:
+    """backend HTTP API；每次呼叫記錄延遲"""
+
+    def __init__(self, base: str, timeout: float = 30):
+        self.base = base.rstrip("/")
+        self.timeout = timeout
+        self.latency = {}   # endpoint -> [ms]
+        self.errors = {}    # endpoint -> 次數
+
+    def call(self, method: str, path: str, body: dict = None, label: str = None):
+        label = label or path
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(f"{self.base}{path}", data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+        start = time.time()
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                payload = resp.read()
+        except (urllib.error.URLError, TimeoutError) as e:
+            self.errors[label] = self.errors.get(label, 0) + 1
+            print(f"[Soak] {method} {path} 失敗: {e}")
+            return None
+        finally:
+            self.latency.setdefault(label, []).append((time.time() - start) * 1000)
+        return json.loads(payload) if payload else None
+
+    def stats(self) -> dict:
+        return {
+            label: {
+                "count": len(v),
+                "errors": self.errors.get(label, 0),
+                "p50_ms": round(statistics.median(v), 1),
+                "p99_ms": round(_percentile(v, 99), 1),
+                "max_ms": round(max(v), 1),
+            }
+            for label, v in self.latency.items() if v
+        }
+
+    def reset(self):
+        self.latency, self.errors = {}, {}
+
+
+class Pattern:
+    """
+    開播模式：
+    - always：一直開播
+    - periodic:ON:OFF：開播 ON 秒、下播 OFF 秒循環，各頻道相位隨機
+    - random:ON:OFF：開播 / 下播時間為平均 ON / OFF 秒的指數分布
+    """
+
+    def __init__(self, spec: str, rng: random.Random):
+        kind, *params = spec.split(":")
+        if kind not in ("always", "periodic", "random") or (kind != "always" and len(params) != 2):
+            raise ValueError(f"不支援的開播模式: {spec}")
+        self.kind = kind
+        self.on, self.off = (float(p) for p in params) if params else (0.0, 0.0)
+        self.rng = rng
+
+    def initial(self, now: float) -> tuple[bool, float]:
+        """回傳 (是否開播, 下次切換時間)"""
+        if self.kind == "always":
+            return True, float("inf")
+        if self.kind == "periodic":
+            phase = self.rng.uniform(0, self.on + self.off)
+            return (True, now + self.on - phase) if phase < self.on else (False, now + self.on + self.off - phase)
+        live = self.rng.random() < self.on / (self.on + self.off)
+        return live, now + self.rng.expovariate(1 / (self.on if live else self.off))
+
+    def next(self, live: bool, now: float) -> float:
+        """從 live 狀態切換出去之後，下一次切換的時間"""
+        if self.kind == "periodic":
+            return now + (self.off if live else self.on)
+        return now + self.rng.expovariate(1 / (self.off if live else self.on))
+
+
+class Channel:
+    def __init__(self, name: str, url: str, bitrate: int):
+        self.name = name
+        self.url = url
+        self.bitrate = bitrate
+        self.task_id = None
+        self.live = False
+        self.next_toggle = float("inf")
+        self.live_since = None
+        self.caught = False       # 這次開播是否已經開始錄影
+        self.missed_counted = False
+
+
+class Soak:
+    def __init__(self, api: Api, origin: Origin, args):
+        self.api = api
+        self.origin = origin
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.pattern = Pattern(args.pattern, self.rng)
+        self.channels: list[Channel] = []
+        self._bitrates = [int(b) for b in args.bitrates.split(",")]
+
+    # —— 任務建立 / 移除 ——
+    def grow(self, count: int):
+        now = time.time()
+        while len(self.channels) < count:
+            i = len(self.channels)
+            name = f"soak{i:04d}"
+            bitrate = self._bitrates[i % len(self._bitrates)]
+            self.origin.add_looped(name, bitrate)
+            ch = Channel(name, self.origin.url(name, self.args.advertise_host), bitrate)
+            task = self.api.call("POST", "/tasks", {
+                "name": name, "url": ch.url, "interval": self.args.interval,
+                "save_dir": f"{self.args.save_prefix}/{name}", "params": "",
+            }, label="POST /tasks")
+            if not task:
+                raise RuntimeError(f"建立任務 {name} 失敗")
+            ch.task_id = task["id"]
+            live, ch.next_toggle = self.pattern.initial(now)
+            self._set_live(ch, live, now)
+            self.channels.append(ch)
+
+    def cleanup(self):
+        for ch in self.channels:
+            self.origin.set_live(ch.name, False)
+            if ch.task_id and not self.args.keep_tasks:
+                self.api.call("DELETE", f"/tasks/{ch.task_id}", label="DELETE /tasks")
+
+    def _set_live(self, ch: Channel, live: bool, now: float):
+        ch.live = live
+        self.origin.set_live(ch.name, live)
+        ch.live_since = now if live else None
+        ch.caught = False
+        ch.missed_counted = False
+
+    # —— 量測 ——
+    def run_step(self, channels: int, seconds: float) -> dict:
+        self.grow(channels)
+        self.api.reset()
+        proc = _backend_process(self.args.backend_pid)
+        disk_start = psutil.disk_io_counters()
+        rss = []
+        # 這一階觀察到的開播：開始時已在直播但還沒錄到的，加上之後每次開播
+        go_lives = sum(1 for ch in self.channels if ch.live and not ch.caught)
+        missed = 0
+        catch_latency, gap_seconds, covered_seconds = [], 0.0, 0.0
+        sample = self.args.sample_seconds
+        deadline_grace = self.args.interval * 60 + GO_LIVE_GRACE_SECONDS
+        start = last = time.time()
+        print(f"[Soak] {channels} 個頻道，量測 {seconds / 60:.0f} 分鐘")
+
+        while time.time() - start < seconds:
+            time.sleep(max(0.0, sample - (time.time() - last)))
+            now = time.time()
+            dt, last = now - last, now
+
+            # 切換直播狀態；下播前都沒錄到的開播算錯過
+            for ch in self.channels:
+                if now >= ch.next_toggle:
+                    if ch.live and not ch.caught and not ch.missed_counted:
+                        missed += 1
+                    if not ch.live:
+                        go_lives += 1
+                    self._set_live(ch, not ch.live, now)
+                    ch.next_toggle = self.pattern.next(not ch.live, now)
+
+            active = set(self.api.call("GET", "/tasks/active_recordings") or [])
+            self.api.call("GET", "/tasks")
+            self.api.call("GET", "/conversion_status")
+
+            for ch in self.channels:
+                if not ch.live:
+                    continue
+                recording = ch.task_id in active
+                if recording and not ch.caught:
+                    ch.caught = True
+                    catch_latency.append(now - ch.live_since)
+                elif ch.caught:
+                    covered_seconds += dt
+                    if not recording:
+                        gap_seconds += dt
+                elif not ch.missed_counted and now - ch.live_since > deadline_grace:
+                    ch.missed_counted = True
+                    missed += 1
+
+            if proc is not None:
+                rss.append((now - start, _tree_rss(proc)))
+
+        disk_end = psutil.disk_io_counters()
+        elapsed = time.time() - start
+        lag = [max(0.0, c - self.args.interval * 60) for c in catch_latency]
+        rss_growth = None
+        if len(rss) >= 2 and rss[-1][0] > rss[0][0]:
+            rss_growth = (rss[-1][1] - rss[0][1]) / (rss[-1][0] - rss[0][0]) * 3600
+        report = {
+            "channels": channels,
+            "seconds": round(elapsed),
+            "go_lives": go_lives,
+            "missed_go_lives": missed,
+            "catch_latency_p50_s": _round(_percentile(catch_latency, 50)),
+            "catch_latency_p99_s": _round(_percentile(catch_latency, 99)),
+            "scheduler_lag_p99_s": _round(_percentile(lag, 99)),
+            "scheduler_lag_max_s": _round(max(lag) if lag else None),
+            "gap_seconds": round(gap_seconds, 1),
+            "gap_ratio": round(gap_seconds / covered_seconds, 4) if covered_seconds else 0.0,
+            "api": self.api.stats(),
+            "rss_mb_start": _round(rss[0][1] / 1e6 if rss else None),
+            "rss_mb_end": _round(rss[-1][1] / 1e6 if rss else None),
+            "rss_growth_mb_per_hour": _round(rss_growth / 1e6 if rss_growth is not None else None),
+            "disk_write_mbps": round((disk_end.write_bytes - disk_start.write_bytes) * 8 / elapsed / 1e6, 2),
+            "expected_ingest_mbps": round(sum(ch.bitrate + 128 for ch in self.channels) / 1000, 2),
+        }
+        report["missed_ratio"] = round(missed / report["go_lives"], 4) if report["go_lives"] else 0.0
+        report["healthy"] = self._healthy(report)
+        return report
+
+    def _healthy(self, report: dict) -> bool:
+        api_p99 = max((s["p99_ms"] for s in report["api"].values()), default=0)
+        return (report["missed_ratio"] <= self.args.max_missed
+                and report["gap_ratio"] <= self.args.max_gap
+                and api_p99 <= self.args.max_api_p99_ms)
+
+
+def _round(value, digits: int = 2):
+    return round(value, digits) if value is not None else None
+
+
+def _backend_process(pid: int = None):
+    """--backend-pid 未指定時找本機的 uvicorn main:app"""
+    if pid:
+        return psutil.Process(pid)
+    for p in psutil.process_iter(["cmdline"]):
+        cmdline = " ".join(p.info["cmdline"] or [])
+        if "uvicorn" in cmdline and "main:app" in cmdline:
+            return p
+    print("[Soak] 找不到 backend 程序，不量測 RSS（可用 --backend-pid 指定）")
+    return None
+
+
+def _tree_rss(proc) -> int:
+    """backend 與其子程序（streamlink / ffmpeg）的 RSS 總和"""
+    total = 0
+    try:
+        for p in [proc, *proc.children(recursive=True)]:
+            try:
+                total += p.memory_info().rss
+            except psutil.Error:
+                pass
+    except psutil.Error:
+        pass
+    return total
+
+
+def _print_report(steps: list[dict], capacity):
+    print(f"\n{'channels':>8} {'missed':>8} {'gap%':>7} {'lag p99':>8} {'api p99':>8} {'rss MB/h':>9} {'disk Mb/s':>10} ok")
+    for s in steps:
+        api_p99 = max((a["p99_ms"] for a in s["api"].values()), default=0)
+        print(f"{s['channels']:>8} {s['missed_go_lives']:>8} {s['gap_ratio'] * 100:>6.2f}% "
+              f"{s['scheduler_lag_p99_s'] or 0:>8.1f} {api_p99:>8.0f} {s['rss_growth_mb_per_hour'] or 0:>9.1f} "
+              f"{s['disk_write_mbps']:>10.1f} {'✓' if s['healthy'] else '✗'}")
+    print(f"\n容量：{capacity if capacity is not None else '沒有任何一階是健康的'} 個頻道")
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="多頻道長時間壓測，產生容量報告")
+    parser.add_argument("--api", default=os.environ.get("SOAK_API", "http://127.0.0.1:8800"))
+    parser.add_argument("--channels", type=int, default=100, help="頻道數（未指定 --ramp 時）")
+    parser.add_argument("--hours", type=float, default=1.0, help="量測時間（未指定 --ramp 時）")
+    parser.add_argument("--ramp", help="逐步提高的頻道數，例如 50,100,200")
+    parser.add_argument("--step-minutes", type=float, default=30, help="--ramp 每一階的量測時間")
+    parser.add_argument("--bitrates", default="2000,4000,6000", help="各頻道輪流使用的 bitrate（kbps）")
+    parser.add_argument("--pattern", default="periodic:1800:600", help="always | periodic:ON:OFF | random:ON:OFF（秒）")
+    parser.add_argument("--interval", type=int, default=1, help="任務的檢查間隔（分鐘）")
+    parser.add_argument("--save-prefix", default="soak", help="錄影存放的 save_dir 前綴")
+    parser.add_argument("--origin-root", default=os.environ.get("SOAK_ORIGIN_DIR", "/tmp/streamlink-soak-origin"))
+    parser.add_argument("--origin-bind", default="0.0.0.0")
+    parser.add_argument("--origin-port", type=int, default=0)
+    parser.add_argument("--advertise-host", default="127.0.0.1", help="backend 連到來源用的位址")
+    parser.add_argument("--backend-pid", type=int)
+    parser.add_argument("--sample-seconds", type=float, default=5)
+    parser.add_argument("--max-missed", type=float, default=0.01, help="健康：錯過開播比例上限")
+    parser.add_argument("--max-gap", type=float, default=0.01, help="健康：錄影中斷比例上限")
+    parser.add_argument("--max-api-p99-ms", type=float, default=1000, help="健康：API p99 上限")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep-tasks", action="store_true", help="結束後不刪除建立的任務")
+    parser.add_argument("--out", help="容量報告 JSON 寫入路徑")
+    args = parser.parse_args(argv)
+
+    steps_plan = ([(int(n), args.step_minutes * 60) for n in args.ramp.split(",")]
+                  if args.ramp else [(args.channels, args.hours * 3600)])
+    origin = Origin(args.origin_root, host=args.origin_bind, port=args.origin_port)
+    soak = Soak(Api(args.api), origin, args)
+    steps = []
+    try:
+        for channels, seconds in steps_plan:
+            step = soak.run_step(channels, seconds)
+            steps.append(step)
+            print(json.dumps(step, ensure_ascii=False))
+    except KeyboardInterrupt:
+        print("[Soak] 中止，輸出已完成的階段")
+    finally:
+        soak.cleanup()
+        origin.close()
+
+    healthy = [s["channels"] for s in steps if s["healthy"]]
+    # 容量：第一個不健康的階段之前，最大的健康頻道數
+    first_bad = next((s["channels"] for s in steps if not s["healthy"]), None)
+    capacity = max((c for c in healthy if first_bad is None or c < first_bad), default=None)
+    _print_report(steps, capacity)
+    report = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "capacity_channels": capacity,
+        "steps": steps,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if capacity is not None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
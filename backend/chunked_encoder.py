@@ -0,0 +1,179 @@
+import os
+import re
+import json
+import glob
+import shutil
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+import media_info
+from ts_segmenter import stitch
+from proc_output import OutputCapture
+
+# 超過這個長度（秒）的錄影才切塊平行編碼
+MIN_DURATION = float(os.environ.get("CHUNKED_ENCODE_MIN_SECONDS", "1800"))
+MIN_CHUNK_SECONDS = 300
+# 同時編碼的區塊數，預設為核心數的一半（x265 本身也會用多執行緒）
+WORKERS = int(os.environ.get("CHUNKED_ENCODE_WORKERS", "0") or 0) or max(1, (os.cpu_count() or 2) // 2)
+DURATION_TOLERANCE = 2.0      # 合併後時長與來源的誤差上限（秒）
+OUT_TIME_RE = re.compile(r"out_time_(?:us|ms)=(\d+)")
+STATE_NAME = "state.json"     # 切塊結果，程序中斷後重新轉檔時據此沿用
+
+
+class ChunkedEncodeError(Exception):
+    pass
+
+
+def should_use(path: str) -> bool:
+    if WORKERS < 2:
+        return False
+    duration = (media_info.get_info(path) or {}).get("duration")
+    return bool(duration and duration >= MIN_DURATION)
+
+
+def _split(src: str, work_dir: str, chunk_seconds: float) -> list[str]:
+    """不重新編碼，以 segment muxer 在關鍵幀把 TS 切成約 chunk_seconds 秒的區塊"""
+    pattern = os.path.join(work_dir, "chunk%04d.ts")
+    cmd = [
+        "ffmpeg", "-hide_banner", "-v", "error", "-y",
+        "-i", src,
+        "-map", "0:v:0", "-map", "0:a?", "-c", "copy",
+        "-f", "segment", "-segment_time", f"{chunk_seconds:.3f}",
+        "-segment_format", "mpegts", "-reset_timestamps", "1",
+        pattern,
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise ChunkedEncodeError(f"切塊失敗: {result.stderr.strip()[-500:]}")
+    return sorted(glob.glob(os.path.join(work_dir, "chunk*.ts")))
+
+
+def _source_key(src: str, crf: int) -> dict:
+    st = os.stat(src)
+    return {"size": st.st_size, "mtime": st.st_mtime, "crf": crf}
+
+
+def _resume(work_dir: str, source: dict) -> list[str]:
+    """上次中斷留下的區塊（來源與 crf 都沒變）就沿用，不必重新切塊"""
+    try:
+        with open(os.path.join(work_dir, STATE_NAME), encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return []
+    if state.get("source") != source:
+        return []
+    chunks = [os.path.join(work_dir, name) for name in state.get("chunks", [])]
+    return chunks if chunks and all(os.path.exists(c) for c in chunks) else []
+
+
+def _encoded(chunk: str, output: str, duration: float) -> bool:
+    """區塊已編碼完成：輸出存在且時長相符（中斷時寫到一半的 mp4 無法探測）"""
+    if not os.path.exists(output):
+        return False
+    encoded = (media_info.get_info(output) or {}).get("duration")
+    return encoded is not None and abs(encoded - duration) <= DURATION_TOLERANCE
+
+
+def _encode_chunk(src: str, dst: str, crf: int, threads: int, on_time: Callable[[float], None]):
+    cmd = [
+        "ffmpeg", "-hide_banner", "-v", "error", "-nostats", "-y",
+        "-progress", "pipe:1",
+        "-i", src,
+        "-map", "0:v:0", "-map", "0:a?",
+        "-c:v", "libx265", "-crf", str(crf), "-preset", "medium",
+        "-x265-params", f"pools={threads}:log-level=error",
+        "-c:a", "copy",
+        dst,
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    stderr = OutputCapture(proc, streams=("stderr",), name="chunk-encode")
+    for line in proc.stdout:
+        m = OUT_TIME_RE.search(line)
+        if m:
+            on_time(int(m.group(1)) / 1_000_000)
+    stderr.wait()
+    if proc.returncode != 0 or not os.path.exists(dst):
+        raise ChunkedEncodeError(f"{os.path.basename(src)} 編碼失敗: {stderr.text()[-500:]}")
+
+
+def encode(src: str, dst: str, crf: int, on_progress: Callable[[float, list], None] = None,
+           workers: int = WORKERS) -> bool:
+    """
+    長錄影的平行編碼：
+    1. 以 stream copy 在關鍵幀把來源切成 N 個區塊（N 約為 workers 的兩倍，讓較快的 worker 能接著做）；
+       程序被強制終止（SIGKILL、當機）後重新轉檔時沿用上次的區塊與已編碼完成的輸出
+    2. workers 個 ffmpeg/x265 同時編碼，每個分到 cores / workers 條執行緒；on_progress(總進度, 各區塊進度) 回報
+    3. concat demuxer stream copy 合併，並檢查合併後時長與各區塊時長
+    成功回傳 True；任何錯誤都清掉暫存並回傳 False，由呼叫端改走單一 ffmpeg。
+    """
+    info = media_info.get_info(src) or {}
+    total = info.get("duration")
+    if not total:
+        return False
+    work_dir = f"{dst}.chunks"
+    # 只要還在這個函式裡結束（成功或任何例外）就清掉暫存；只有程序被直接終止時才會留下給下次沿用
+    try:
+        source = _source_key(src, crf)
+        chunks = _resume(work_dir, source)
+        if not chunks:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            os.makedirs(work_dir)
+        chunk_seconds = max(MIN_CHUNK_SECONDS, total / (workers * 2))
+        if not chunks:
+            chunks = _split(src, work_dir, chunk_seconds)
+            with open(os.path.join(work_dir, STATE_NAME), "w", encoding="utf-8") as f:
+                json.dump({"source": source, "chunks": [os.path.basename(c) for c in chunks]}, f)
+        durations = [(media_info.get_info(c) or {}).get("duration") or chunk_seconds for c in chunks]
+        outputs = [os.path.join(work_dir, f"enc{i:04d}.mp4") for i in range(len(chunks))]
+        reused = [_encoded(c, o, d) for c, o, d in zip(chunks, outputs, durations)]
+        done = [d if r else 0.0 for d, r in zip(durations, reused)]
+        if any(reused):
+            print(f"[ChunkedEncoder] {os.path.basename(src)}: 沿用上次已編碼的 {sum(reused)}/{len(chunks)} 個區塊")
+        lock = threading.Lock()
+        threads = max(1, (os.cpu_count() or workers) // workers)
+        print(f"[ChunkedEncoder] {os.path.basename(src)}: {len(chunks)} 個區塊，{workers} 個 worker，每個 {threads} 執行緒")
+
+        def _report(index: int, seconds: float):
+            with lock:
+                done[index] = min(seconds, durations[index])
+                progress = sum(done) / sum(durations) * 100
+                per_chunk = [round(d / durations[i] * 100, 1) for i, d in enumerate(done)]
+            if on_progress:
+                on_progress(progress, per_chunk)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_encode_chunk, c, o, crf, threads, lambda t, i=i: _report(i, t))
+                for i, (c, o) in enumerate(zip(chunks, outputs)) if not reused[i]
+            ]
+            try:
+                for fut in futures:
+                    fut.result()
+            except Exception:
+                for fut in futures:
+                    fut.cancel()
+                raise
+
+        # 每個區塊編碼後的時長要與來源區塊相符，避免靜默掉幀
+        for c, o, d in zip(chunks, outputs, durations):
+            encoded = (media_info.get_info(o) or {}).get("duration")
+            if encoded is None or abs(encoded - d) > DURATION_TOLERANCE:
+                raise ChunkedEncodeError(f"{os.path.basename(c)} 時長不符：{d} -> {encoded}")
+
+        if not stitch(outputs, dst):
+            raise ChunkedEncodeError("合併區塊失敗")
+        final = (media_info.get_info(dst) or {}).get("duration")
+        if final is None or abs(final - total) > max(DURATION_TOLERANCE, total * 0.005):
+            os.remove(dst)
+            raise ChunkedEncodeError(f"合併後時長不符：{total} -> {final}")
+        return True
+    except ChunkedEncodeError as e:
+        print(f"[ChunkedEncoder] {e}")
+        return False
+    except Exception as e:
+        # OSError（切塊、寫 state、Popen 找不到 ffmpeg）、JSON 錯誤等：一樣交給呼叫端改走單一 ffmpeg
+        print(f"[ChunkedEncoder] {os.path.basename(src)} 平行編碼失敗: {type(e).__name__}: {e}")
+        return False
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,76 @@
+import os
+from typing import Optional
+from media_info import get_info
+
+# 預估 x265 在各品質下能達到的 bits-per-pixel（每個像素每一幀的位元數）
+TARGET_BPP = {"extreme": 0.02, "high": 0.035, "medium": 0.05, "low": 0.08}
+# 已經是高效率編碼的來源，重新壓縮通常只會更大或畫質更差
+EFFICIENT_CODECS = {"hevc", "av1", "vp9"}
+# 重新編碼預估至少要省下這個比例的空間才值得花 CPU
+MIN_SAVING = float(os.environ.get("CONVERSION_MIN_SAVING", "0.2"))
+
+def _video_bitrate(info: dict) -> Optional[float]:
+    """TS 的串流常沒有 bit_rate，改以整體大小 / 時長扣掉音訊估算"""
+    video = info["video"]
+    if video.get("bit_rate"):
+        return video["bit_rate"]
+    total = info.get("bit_rate")
+    if not total and info.get("duration"):
+        total = info["size"] * 8 / info["duration"]
+    if not total:
+        return None
+    audio = sum(a.get("bit_rate") or 128000 for a in info["audio"])
+    return max(total - audio, total * 0.5)
+
+
+def decide(path: str, quality: str = "high") -> dict:
+    """
+    決定轉檔方式：
+    - "audio"：沒有影像，只把音訊 remux 成 mp4
+    - "copy"：已是 HEVC/AV1/VP9，或依 bits-per-pixel 預估重新編碼省不到 MIN_SAVING，直接 stream copy
+    - "encode"：以 libx265 重新編碼
+    回傳 {"action", "reason", "expected_saving"}。探測失敗時保守地回到原本的 "encode"。
+    """
+    info = get_info(path)
+    if info is None:
+        return {"action": "encode", "reason": "無法探測檔案，沿用重新編碼", "expected_saving": None}
+    video = info["video"]
+    if video is None:
+        if info["audio"]:
+            return {"action": "audio", "reason": "只有音訊", "expected_saving": 0.0}
+        return {"action": "encode", "reason": "沒有可辨識的串流", "expected_saving": None}
+    if video["codec"] in EFFICIENT_CODECS:
+        return {"action": "copy", "reason": f"來源已是 {video['codec']}", "expected_saving": 0.0}
+
+    bitrate = _video_bitrate(info)
+    pixels = video["width"] * video["height"] * (video["fps"] or 30)
+    if not bitrate or not pixels:
+        return {"action": "encode", "reason": "無法估算 bitrate，沿用重新編碼", "expected_saving": None}
+    bpp = bitrate / pixels
+    target = TARGET_BPP.get(quality, TARGET_BPP["high"])
+    saving = 1 - target / bpp
+    if saving < MIN_SAVING:
+        return {
+            "action": "copy",
+            "reason": f"bpp {bpp:.3f} 已接近目標 {target}，預估只省 {max(saving, 0) * 100:.0f}%",
+            "expected_saving": round(max(saving, 0.0), 3),
+        }
+    return {
+        "action": "encode",
+        "reason": f"{video['codec']} bpp {bpp:.3f}，預估可省 {saving * 100:.0f}%",
+        "expected_saving": round(saving, 3),
+    }
+
+
+def build_cmd(action: str, src: str, dst: str, crf: int) -> list[str]:
+    base = ["ffmpeg", "-hide_banner", "-y", "-stats", "-i", src]
+    if action == "audio":
+        return base + ["-map", "0:a", "-vn", "-c:a", "copy", dst]
+    if action == "copy":
+        cmd = base + ["-map", "0:v:0", "-map", "0:a?", "-c", "copy"]
+        video = (get_info(src) or {}).get("video") or {}
+        if video.get("codec") == "hevc":
+            # hvc1 tag 讓 Safari / QuickTime 也能播放 HEVC
+            cmd += ["-tag:v", "hvc1"]
+        return cmd + [dst]
+    return base + ["-c:v", "libx265", "-crf", str(crf), "-preset", "medium", "-c:a", "copy", dst]
@@ -0,0 +1,98 @@
+import os
+from datetime import datetime
+from state_store import SharedMap
+from ledger import is_ledger_file
+from ts_segmenter import MANIFEST_SUFFIX
+
+# /dashboard 的資料來源：不在每次請求時掃描目錄，而是在錄影結束、轉檔結束、刪除錄影、保留規則清理時
+# 重新統計受影響的那一個目錄，保留規則的定期清理（開機時也會跑）順便對所有目錄校正一次
+_dirs = SharedMap("dashboard_dirs")      # save_dir 絕對路徑 -> {count, bytes, last_mtime}
+_events = SharedMap("dashboard_events")  # task id -> 最後一筆 log {time, event, msg}
+
+ACTIVE_CONVERSION_STATUSES = ("queued", "processing")
+# 不當成卡片上「最後紀錄」的事件（診斷用，會蓋掉 no_stream / error / end）
+IGNORED_EVENTS = ("timing",)
+
+
+def is_recording_file(name: str) -> bool:
+    """錄影清單要列出的檔案（排除 recorded.jsonl 與分段 manifest）"""
+    return not is_ledger_file(name) and not name.endswith(MANIFEST_SUFFIX)
+
+
+def scan(save_path: str) -> dict:
+    count, total, last = 0, 0, None
+    try:
+        with os.scandir(save_path) as it:
+            for e in it:
+                if not e.is_file() or not is_recording_file(e.name):
+                    continue
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                count += 1
+                total += st.st_size
+                last = max(last or 0, st.st_mtime)
+    except OSError:
+        pass
+    return {"count": count, "bytes": total, "last_mtime": last}
+
+
+def refresh(save_path: str):
+    """save_path 內的錄影有增減或改變後呼叫"""
+    try:
+        _dirs[save_path] = scan(save_path)
+    except Exception as e:
+        print(f"[Dashboard] 更新 {save_path} 統計失敗: {e}")
+
+
+def reconcile(save_paths):
+    """重新統計所有任務目錄，並移除已沒有任務使用的目錄"""
+    save_paths = set(save_paths)
+    for path in save_paths:
+        refresh(path)
+    for path in set(_dirs) - save_paths:
+        _dirs.pop(path, None)
+
+
+def note_event(task_id: str, event: str, msg: str, when: str):
+    if event in IGNORED_EVENTS:
+        return
+    try:
+        _events[task_id] = {"time": when, "event": event, "msg": msg}
+    except Exception as e:
+        print(f"[Dashboard] 記錄事件失敗: {e}")
+
+
+def forget(task_id: str):
+    _events.pop(task_id, None)
+
+
+def version() -> tuple:
+    return _dirs.version, _events.version
+
+
+def build(tasks: list, save_path_of, active: set, conversions: dict) -> dict:
+    """
+    {task id: {active, recordings, total_bytes, last_recording, conversions, last_event}}
+    conversions 為 /conversion_status 的內容（key 為 "{task id}_{檔名}"）
+    """
+    dirs = _dirs.snapshot()
+    events = _events.snapshot()
+    result = {}
+    for t in tasks:
+        stats = dirs.get(save_path_of(t)) or {}
+        prefix = f"{t['id']}_"
+        result[t["id"]] = {
+            "active": t["id"] in active,
+            "recordings": stats.get("count", 0),
+            "total_bytes": stats.get("bytes", 0),
+            "last_recording": datetime.fromtimestamp(stats["last_mtime"]).isoformat() if stats.get("last_mtime") else None,
+            "conversions": [
+                {"file": key[len(prefix):], "status": c.get("status"), "progress": c.get("progress", 0)}
+                for key, c in conversions.items()
+                if key.startswith(prefix) and c.get("status") in ACTIVE_CONVERSION_STATUSES
+            ],
+            "last_event": events.get(t["id"]),
+        }
+    return result
@@ -0,0 +1,111 @@
+import re
+import asyncio
+import urllib.parse
+import httpx
+from typing import Optional
+from lxml import etree, html as lxml_html
+from handlers.http_client import DEFAULT_HEADERS
+
+CRAWL_CONCURRENCY = 6      # 同時抓取的分頁數上限
+CRAWL_TIMEOUT = 15         # 秒
+PREV_PAGE_TEXT = "上一頁"
+PAGE_NUM_RE = re.compile(r"/page/(\d+)/?$")
+
+_ENTRY_XPATH = '//*[contains(concat(" ", normalize-space(@class), " "), " entry-title ")]//a'
+
+
+class BrowserRequired(Exception):
+    """頁面無法以純 HTTP 取得（例如被擋或內容需要 JS），需改用瀏覽器"""
+
+
+def parse_category_page(text: str, base_url: str) -> tuple[list[dict], Optional[str]]:
+    """
+    解析一個分類分頁：
+    回傳 ([{"title", "href"}, ...], 上一頁連結或 None)
+    """
+    # 空白或無法解析的回應（例如被擋時回 200 但內容是空的）也改用瀏覽器
+    if not text or not text.strip():
+        raise BrowserRequired(f"{base_url} 回應內容為空")
+    try:
+        doc = lxml_html.fromstring(text)
+    except (etree.ParserError, ValueError) as e:
+        raise BrowserRequired(f"{base_url} 無法解析: {e}")
+    entries = []
+    for a in doc.xpath(_ENTRY_XPATH):
+        href = a.get("href")
+        if not href:
+            continue
+        entries.append({
+            "title": a.text_content().strip(),
+            "href": urllib.parse.urljoin(base_url, href),
+        })
+    prev_href = None
+    for a in doc.xpath("//a[@href]"):
+        if PREV_PAGE_TEXT in a.text_content():
+            prev_href = urllib.parse.urljoin(base_url, a.get("href"))
+            break
+    return entries, prev_href
+
+
+async def _fetch_page(client: httpx.AsyncClient, sem: asyncio.Semaphore, url: str):
+    """抓取單一分頁；404 代表超出最後一頁，回傳 None"""
+    async with sem:
+        resp = await client.get(url)
+    if resp.status_code == 404:
+        return None
+    if resp.status_code != 200:
+        raise BrowserRequired(f"{url} 回應 {resp.status_code}")
+    return parse_category_page(resp.text, str(resp.url))
+
+
+async def crawl_category(category_url: str) -> list[dict]:
+    """
+    以 HTTP 平行抓取 anime1 分類的所有分頁：
+    1. 抓首頁，從「上一頁」連結推出 /page/N 的網址樣板。
+    2. 以 CRAWL_CONCURRENCY 為一批，同時抓取後續分頁，直到某頁 404 或不再有「上一頁」。
+    3. 依頁碼順序（新到舊）回傳所有 entry。
+    無法以 HTTP 完成時丟出 BrowserRequired。
+    """
+    limits = httpx.Limits(max_connections=CRAWL_CONCURRENCY, max_keepalive_connections=CRAWL_CONCURRENCY)
+    sem = asyncio.Semaphore(CRAWL_CONCURRENCY)
+    async with httpx.AsyncClient(
+        headers=DEFAULT_HEADERS,
+        limits=limits,
+        timeout=CRAWL_TIMEOUT,
+        follow_redirects=True,
+    ) as client:
+        first = await _fetch_page(client, sem, category_url)
+        if not first or not first[0]:
+            raise BrowserRequired(f"{category_url} 沒有可解析的 .entry-title a")
+        pages = {1: first[0]}
+        prev_href = first[1]
+
+        if prev_href:
+            m = PAGE_NUM_RE.search(urllib.parse.urlparse(prev_href).path)
+            if not m:
+                raise BrowserRequired(f"無法辨識分頁網址格式: {prev_href}")
+            start = int(m[1])
+            template = prev_href.replace(f"/page/{m[1]}", "/page/{}", 1)
+
+            page_no = start
+            finished = False
+            while not finished:
+                batch = list(range(page_no, page_no + CRAWL_CONCURRENCY))
+                results = await asyncio.gather(
+                    *(_fetch_page(client, sem, template.format(n)) for n in batch)
+                )
+                for n, result in zip(batch, results):
+                    if result is None or not result[0]:
+                        finished = True
+                        break
+                    pages[n] = result[0]
+                    if not result[1]:
+                        finished = True
+                        break
+                page_no += CRAWL_CONCURRENCY
+
+    print(f"[DEBUG] crawl_category(): 以 HTTP 取得 {len(pages)} 個分頁")
+    entries = []
+    for n in sorted(pages):
+        entries.extend(pages[n])
+    return entries
@@ -1,8 +1,8 @@
 print("[DEBUG] anime1_handler.py 已 import")
-from configparser import NoOptionError
 import os
 import re
 import requests
+import httpx
 import json
 import urllib.parse
 from bs4 import BeautifulSoup
@@ -16,31 +16,76 @@ import time
 import shutil
 from pathlib import Path
 from urllib.parse import urlparse
-from handlers.base_handler import BrowserManager
+from handlers.browser_manager import BrowserManager, AD_TRACKER_HOSTS
+from handlers.browser_loop import BrowserLoop
+from handlers.metadata_cache import metadata_cache
+from handlers.http_client import get_session
+from handlers.anime1_crawler import crawl_category, BrowserRequired
+from handlers.ranged_downloader import download_file
 
 CONTEXT_ID = "anime1"
 
+# 列表頁只讀 .entry-title a，影片頁只讀 video.src：圖片、字型、媒體本體與廣告追蹤都不需要
+BrowserManager.set_route_profile(
+    CONTEXT_ID,
+    block_types={"image", "font", "media"},
+    block_hosts=AD_TRACKER_HOSTS,
+)
+
 @register_handler(r"^https?:\/\/(?:www\.)?anime1\.me.*")
 class Anime1Handler(StreamHandler):
     def __init__(self):
         super().__init__()
         print("[DEBUG] Anime1Handler.__init__(): 初始化 Handler")
-        self.page = NoOptionError
+        self.page = None
 
     async def init_browser(self, target_url: str):
         self.page = await BrowserManager.new_page(CONTEXT_ID, target_url)
 
     async def close_browser(self):
-        if self.page and self.context:
-            await BrowserManager.save_session(CONTEXT_ID)
-            await self.page.close()
-            self.page = None
+        if self.page:
+            page, self.page = self.page, None
+            try:
+                await BrowserManager.save_session(CONTEXT_ID)
+            finally:
+                await page.close()
 
     async def get_episode_urls_async(self, category_url: str) -> list[str]:
+        """
+        取得分類下所有集數連結（依 [集數] 升序）：
+        先以 HTTP 平行抓取所有分頁，頁面需要瀏覽器時才退回 Playwright 逐頁爬取。
+        """
         print(f"[DEBUG] get_episode_urls_async() called with category_url = {category_url}")
+        try:
+            items = await crawl_category(category_url)
+        except (BrowserRequired, httpx.HTTPError) as e:
+            print(f"[WARNING] HTTP 爬取失敗，改用瀏覽器: {e}")
+            items = await self._get_entries_via_browser(category_url)
+
         episodes = {}
+        for item in items:
+            title = item.get("title", "")
+            href = item.get("href", "")
+            m = re.search(r'\[(\d+)\]', title)
+            if m:
+                num = int(m[1])
+                # 同集多次出現時以較新的分頁為準
+                if num not in episodes:
+                    episodes[num] = href
+            else:
+                print(f"[DEBUG] 標題 '{title}' 未找到集次，跳過。")
+
+        sorted_nums = sorted(episodes.keys())
+        print(f"[DEBUG] 共找到 {len(sorted_nums)} 集，集數排序: {sorted_nums}")
+        result_urls = [episodes[n] for n in sorted_nums]
+        print(f"[DEBUG] 回傳 URL 列表: {result_urls}")
+        return result_urls
+
+    async def _get_entries_via_browser(self, category_url: str) -> list[dict]:
+        """瀏覽器備援：在同一個 page 中沿著「上一頁」逐頁擷取 .entry-title a"""
+        entries = []
         next_page = category_url
-        
+
         # 初始化瀏覽器
         await self.init_browser(next_page)
         try:
@@ -56,21 +101,7 @@ class Anime1Handler(StreamHandler):
                     }))"""
                 )
                 print(f"[DEBUG] 擷取到 {len(data)} 個 <a> 標籤。")
-
-                for item in data:
-                    title = item.get("title", "")
-                    href = item.get("href", "")
-                    print(f"[DEBUG] 解析項目: title='{title}', href='{href}'")
-                    m = re.search(r'\[(\d+)\]', title)
-                    if m:
-                        num = int(m[1])
-                        if num not in episodes:
-                            episodes[num] = href
-                            print(f"[DEBUG] 新增第 {num} 集: {href}")
-                        else:
-                            print(f"[DEBUG] 第 {num} 集已存在，跳過。")
-                    else:
-                        print(f"[DEBUG] 標題 '{title}' 未找到集次，跳過。")
+                entries.extend(data)
 
                 # 嘗試找「上一頁」連結
                 print("[DEBUG] 嘗試尋找『上一頁』按鈕...")
@@ -91,14 +122,10 @@ class Anime1Handler(StreamHandler):
             print(f"[ERROR] 取得集數清單時發生例外: {e}")
             raise
         finally:
-            print("[DEBUG] get_episode_urls_async() finally 區塊, 準備關閉瀏覽器...")
+            print("[DEBUG] _get_entries_via_browser() finally 區塊, 準備關閉瀏覽器...")
             await self.close_browser()
 
-        sorted_nums = sorted(episodes.keys())
-        print(f"[DEBUG] 共找到 {len(sorted_nums)} 集，集數排序: {sorted_nums}")
-        result_urls = [episodes[n] for n in sorted_nums]
-        print(f"[DEBUG] 回傳 URL 列表: {result_urls}")
-        return result_urls
+        return entries
 
     def get_ext(self):
         return "mp4"
@@ -112,9 +139,15 @@ class Anime1Handler(StreamHandler):
         """
         print(f"[DEBUG] get_filename() called with url = {url}")
 
+        title_key = f"{CONTEXT_ID}:{urlparse(url).path.strip('/')}"
+        cached_title = metadata_cache.get_title(title_key)
+        if cached_title:
+            print(f"[DEBUG] get_filename(): 使用快取标题 = {cached_title}")
+            return self._safe_filename(cached_title)
+
         try:
             # 1. 发送 HTTP GET 请求获取 HTML
-            resp = requests.get(url, timeout=15)
+            resp = get_session().get(url, timeout=15)
             resp.raise_for_status()
             html = resp.text
             print(f"[DEBUG] get_filename(): 成功获取页面 HTML (长度 {len(html)} 字符)")
@@ -153,8 +186,14 @@ class Anime1Handler(StreamHandler):
             last_segment = parsed.path.strip("/").replace("/", "_") or "anime1_video"
             title = last_segment
             print(f"[DEBUG] get_filename(): fallback 使用 URL 最后一段作为标题: {title}")
+        else:
+            metadata_cache.put_title(title_key, title)
 
-        # 6. 进行文件名合法化
+        return self._safe_filename(title)
+
+    @staticmethod
+    def _safe_filename(title: str) -> str:
+        # 进行文件名合法化
         #    Windows/macOS/Linux 常见不能用的字符: \ / : * ? " < > |
         safe_title = re.sub(r'[\\\/\:\*\?\"<>\|]', "_", title)
         # 将多余的空格折成 underscore
@@ -164,17 +203,25 @@ class Anime1Handler(StreamHandler):
         print(f"[DEBUG] get_filename(): 最终生成 filename = {filename}")
         return filename
 
+    @staticmethod
+    def _entry_links(html: str):
+        """从分类首页的静态 HTML 取出 .entry-title a 连结，作为快取指纹来源；取不到视为无法验证"""
+        soup = BeautifulSoup(html, "html.parser")
+        links = [a.get("href", "").strip() for a in soup.select(".entry-title a")]
+        return links or None
+
     def parse_urls(self, start_url: str) -> list[str]:
         print(f"[DEBUG] parse_urls() called with start_url = {start_url}")
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            urls = loop.run_until_complete(self.get_episode_urls_async(start_url))
-            print(f"[DEBUG] parse_urls() 完成，取得 URL 數量: {len(urls)}")
-            return urls
-        finally:
-            print("[DEBUG] parse_urls() 正在關閉 event loop。")
-            loop.close()
+        # 首頁沒有變化（304 或指紋相同）就直接使用快取，不再逐頁重爬
+        cached_urls, validators = metadata_cache.check_episodes(start_url, self._entry_links)
+        if cached_urls is not None:
+            return cached_urls
+
+        urls = BrowserLoop.run(self.get_episode_urls_async(start_url))
+        print(f"[DEBUG] parse_urls() 完成，取得 URL 數量: {len(urls)}")
+        if urls and validators:
+            metadata_cache.put_episodes(start_url, urls, validators)
+        return urls
 
     def get_new_url(self, urls: list[str], records: set[str]):
         print(f"[DEBUG] get_new_url() called.")
@@ -220,8 +267,8 @@ class Anime1Handler(StreamHandler):
 
     def build_method(self, url: str, task, out_file: str):
         """
-        這個版本示範直接點按播放器上的「下載按鈕」，然後用 Playwright 自帶的 download 事件
-        把影片存到 out_file。所有關鍵點都加上 print，方便觀察執行情況。
+        用 Playwright 點擊播放取得 video.src 與對應的 Cookie/UA/Referer，
+        再回傳一個下載函數，交給 multiprocessing.Process 以多連線分段方式下載到 out_file。
         """
 
         print(f"[DEBUG] build_method() called with url={url}, task={task}, out_file={out_file}")
@@ -323,33 +370,20 @@ class Anime1Handler(StreamHandler):
                 user_agent = ""
                 referer = ""
 
-            # # 7. 關閉 Playwright
-            # print("[DEBUG] 關閉 Playwright context…")
-            # await browser.close()
-            # await playwright.stop()
-            # print("[DEBUG] Playwright 已關閉。")
+            # 7. 已取得下載所需資訊，釋放頁面
+            await self.close_browser()
 
             return actual_mp4_url, user_agent, referer, cookie_header
 
         # —— 同步部分：呼叫上面的 async func 得到 video_url + headers —— 
-        print("[DEBUG] build_method(): 啟動 event loop 取得 video_url + headers …")
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
         try:
-            video_url, ua, ref, cookie_str = loop.run_until_complete(_get_video_info_and_cookies())
+            video_url, ua, ref, cookie_str = BrowserLoop.run(_get_video_info_and_cookies())
             print(f"[DEBUG] 拿到 video_url = '{video_url}'")
         except Exception as e:
             print(f"[ERROR] build_method(): _get_video_info_and_cookies() 拋出異常: {e}")
-            loop.close()
-            print("[DEBUG] build_method(): event loop 已關閉。")
             return
-        finally:
-            if not loop.is_closed():
-                loop.close()
-            print("[DEBUG] build_method(): event loop 已關閉。")
 
-        # 8. 用 requests 一次性下載 MP4，帶上完整 Cookie/UA/Referer
-        print(f"[DEBUG] Python: 開始用 requests 下載 MP4 → '{out_file}'")
+        # 8. 組出下載用的 Cookie/UA/Referer
         headers = {}
         if ua:
             headers["User-Agent"] = ua
@@ -357,52 +391,30 @@ class Anime1Handler(StreamHandler):
             headers["Referer"] = ref
         if cookie_str:
             headers["Cookie"] = cookie_str
-        # 你也可酌情加上 Accept、Accept-Language、Accept-Encoding 等
         headers.setdefault("Accept", "video/mp4,*/*")
         headers.setdefault("Accept-Language", "zh-TW,zh;q=0.9")
+        print(f"[DEBUG] 將發送以下 Header 給下載器: {headers}")
 
-        print(f"[DEBUG] 將發送以下 Header 給 requests: {headers}")
-
-        try:
-            resp = requests.get(video_url, headers=headers, timeout=60, stream=True)
-        except Exception as e:
-            print(f"[ERROR] requests.get() 發生例外: {e}")
-            return
-
-        status = resp.status_code
-        print(f"[DEBUG] requests.get() 返回狀態碼: {status}")
-        if status != 200:
-            print(f"[ERROR] 目標伺服器回 {status}，下載失敗！")
-            return
-
-        # 9. 逐塊寫入讓你能看到進度
-        try:
-            Path(os.path.dirname(out_file)).mkdir(parents=True, exist_ok=True)
-            total_written = 0
-            with open(out_file, "wb") as f:
-                for chunk in resp.iter_content(chunk_size=1024 * 1024):  # 每次 1MB
-                    if chunk:
-                        f.write(chunk)
-                        total_written += len(chunk)
-                        print(f"[DEBUG] 已下載 {total_written} bytes …")
-            final_size = os.path.getsize(out_file)
-            print(f"[DEBUG] 寫檔完成，本地檔案大小: {final_size} bytes")
-        except Exception as e:
-            print(f"[ERROR] 寫入本地檔案時發生例外: {e}")
-            return
+        # 9. 回傳給 multiprocessing.Process 執行的下載函數：多連線分段下載，可續傳、可中止
+        def _download(terminated):
+            try:
+                final_size = download_file(video_url, out_file, headers=headers, stop_event=terminated)
+            except Exception as e:
+                print(f"[ERROR] 下載 {video_url} 失敗: {e}")
+                return
+            filename = os.path.basename(out_file)
+            print(f"+ 已下載並儲存：{filename}（{final_size/1024/1024:.2f} MB）")
+            print(f"  來源 URL：{video_url}")
 
-        # 10. 印出最終結果
-        filename = os.path.basename(out_file)
-        print(f"+ 已下載並儲存：{filename}（{final_size/1024/1024:.2f} MB）")
-        print(f"  來源 URL：{video_url}")
+        return _download
 
     def __del__(self):
         print("[DEBUG] Anime1Handler.__del__()：析構方法被呼叫。")
         if self.page:
             print("[DEBUG] __del__(): 偵測到 page 尚未關閉，嘗試關閉...")
             try:
-                asyncio.run(self.close_browser())
-                print("[DEBUG] __del__(): page 關閉完成。")
+                BrowserLoop.submit(self.close_browser())
+                print("[DEBUG] __del__(): 已排程關閉 page。")
             except Exception as e:
                 print(f"[WARNING] __del__(): 關閉 page 時發生例外: {e}")
         else:
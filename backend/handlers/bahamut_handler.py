@@ -7,6 +7,7 @@ from bs4 import BeautifulSoup
 from datetime import datetime
 from handlers.base_handler import StreamHandler, register_handler
 from playwright.async_api import async_playwright, Page, BrowserContext, Download
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 import asyncio
 import multiprocessing
 from subprocess import PIPE
@@ -14,9 +15,21 @@ import time
 import shutil
 from pathlib import Path
 from urllib.parse import urlparse
-from handlers.base_handler import BrowserManager
+from handlers.browser_manager import BrowserManager, AD_TRACKER_HOSTS
+from handlers.browser_loop import BrowserLoop
+from handlers.metadata_cache import metadata_cache
+from handlers.hls_downloader import resolve_media_playlist, is_supported, download_vod
 
 CONTEXT_ID = "bahamut"
+M3U8_CAPTURE_TIMEOUT = 40  # 秒，等待目標 .m3u8 請求的總期限
+
+# 只需要讓播放器發出 m3u8 請求：圖片、字型與廣告追蹤一律不載入
+# （media 保留，片頭廣告播不出來時播放器不會請求正片 m3u8）
+BrowserManager.set_route_profile(
+    CONTEXT_ID,
+    block_types={"image", "font"},
+    block_hosts=AD_TRACKER_HOSTS,
+)
 
 @register_handler(r"^https?:\/\/(?:www\.)?ani\.gamer\.com\.tw.*")
 class BahamutHandler(StreamHandler):
@@ -24,6 +37,7 @@ class BahamutHandler(StreamHandler):
         super().__init__()
         print("[DEBUG] BahamutHandler.__init__(): 初始化 Handler")
         self.page = None
+        self._native_jobs = {}  # out_file -> (MediaPlaylist, headers)，由 build_cmd 交給 build_method
 
     async def init_browser(self, target_url: str):
         print(f"[DEBUG] init_browser() called with target_url = {target_url}")
@@ -31,10 +45,12 @@ class BahamutHandler(StreamHandler):
         print("[DEBUG] init_browser(): Playwright 已初始化。")
 
     async def close_browser(self):
-        if self.page and self.context:
-            await BrowserManager.save_session(CONTEXT_ID)
-            await self.page.close()
-            self.page = None
+        if self.page:
+            page, self.page = self.page, None
+            try:
+                await BrowserManager.save_session(CONTEXT_ID)
+            finally:
+                await page.close()
 
     def get_ext(self):
         return "ts"
@@ -59,18 +75,21 @@ class BahamutHandler(StreamHandler):
             fallback_name = "anime_video"
         print(f"[DEBUG] get_filename(): 解析到 sn (fallback) = {fallback_name}")
 
+        title_key = f"{CONTEXT_ID}:{fallback_name}"
+        cached_title = metadata_cache.get_title(title_key) if sn_values else None
+        if cached_title:
+            print(f"[DEBUG] get_filename(): 使用快取标题 = {cached_title}")
+            return self._safe_filename(cached_title)
+
         # 异步函数：用 Playwright 抓取 .anime_name > h1 文本
         async def _fetch_dynamic_title():
             title_text = None
             print("[DEBUG] _fetch_dynamic_title(): 使用 Playwright 抓取 .anime_name > h1")
 
-            playwright = None
-            browser = None
+            page = None
             try:
-                playwright = await async_playwright().start()
-                browser = await playwright.firefox.launch(headless=True)
-                page = await browser.new_page()
-                await page.goto(url, wait_until="load")
+                # 重用 BrowserManager 的 context（含资源拦截规则），不再另外启动浏览器
+                page = await BrowserManager.new_page(CONTEXT_ID, url)
 
                 selector = ".anime_name > h1"
                 print(f"[DEBUG] _fetch_dynamic_title(): 等待元素出现：{selector}")
@@ -83,35 +102,22 @@ class BahamutHandler(StreamHandler):
                 print(f"[WARNING] _fetch_dynamic_title(): 无法通过 Playwright 抓取标题: {e}")
                 title_text = None
             finally:
-                if browser:
-                    try:
-                        await browser.close()
-                        print("[DEBUG] _fetch_dynamic_title(): 已关闭浏览器")
-                    except Exception as e:
-                        print(f"[WARNING] _fetch_dynamic_title(): 关闭浏览器时异常: {e}")
-                if playwright:
+                if page:
                     try:
-                        await playwright.stop()
-                        print("[DEBUG] _fetch_dynamic_title(): 已停止 Playwright")
+                        await page.close()
                     except Exception as e:
-                        print(f"[WARNING] _fetch_dynamic_title(): 停止 Playwright 时异常: {e}")
+                        print(f"[WARNING] _fetch_dynamic_title(): 关闭页面时异常: {e}")
             return title_text
 
         # —— 在同步函数里调用上面的 async 来获取动态标题 —— 
         title = None
         print("[DEBUG] get_filename(): 尝试用 Playwright 获取 .anime_name > h1")
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
         try:
-            title = loop.run_until_complete(_fetch_dynamic_title())
+            title = BrowserLoop.run(_fetch_dynamic_title())
             print(f"[DEBUG] get_filename(): Playwright 返回 title = {title}")
         except Exception as e:
             print(f"[ERROR] get_filename(): _fetch_dynamic_title() 异常: {e}")
             title = None
-        finally:
-            if not loop.is_closed():
-                loop.close()
-            print("[DEBUG] get_filename(): Playwright 相关 event loop 已关闭。")
 
         # 2. 如果 playright 没拿到，再用 requests+BS 抓 <meta> 或 <title>
         if not title:
@@ -139,19 +145,31 @@ class BahamutHandler(StreamHandler):
                 print(f"[WARNING] get_filename(): 请求页面解析时异常: {e}")
                 title = None
 
-        # 3. 如果仍然没有，就使用 sn 作为标题
+        # 3. 如果仍然没有，就使用 sn 作为标题；拿到真实标题则写入快取
         if not title:
             title = fallback_name
             print(f"[DEBUG] get_filename(): 使用 fallback sn 作为标题: {title}")
+        elif sn_values:
+            metadata_cache.put_title(title_key, title)
 
-        # 4. 做文件名合法化
+        return self._safe_filename(title)
+
+    @staticmethod
+    def _safe_filename(title: str) -> str:
+        # 做文件名合法化
         safe_title = re.sub(r'[\\\/\:\*\?\"<>\|]', "_", title)
         safe_title = re.sub(r"\s+", "_", safe_title.strip())
         filename = f"{safe_title}.mp4"
         print(f"[DEBUG] get_filename(): 最终生成 filename = {filename}")
-
         return filename
 
+    @staticmethod
+    def _season_links(html: str):
+        """从静态 HTML 中取出 season 区块的集数连结，作为快取指纹来源；取不到（无 season 区块或由 JS 产生）视为无法验证"""
+        soup = BeautifulSoup(html, "html.parser")
+        links = [a.get("href", "").strip() for a in soup.select("section.season a")]
+        return links or None
+
 
     def parse_urls(self, start_url: str) -> list[str]:
         """
@@ -163,6 +181,11 @@ class BahamutHandler(StreamHandler):
         """
         print(f"[DEBUG] parse_urls() called with start_url = {start_url}")
 
+        # 先以一次 HTTP 请求重新验证快取，没变就不启动浏览器
+        cached_urls, validators = metadata_cache.check_episodes(start_url, self._season_links)
+        if cached_urls is not None:
+            return cached_urls
+
         async def _parse_urls_async():
             print("[DEBUG] _parse_urls_async(): 開始執行，啟動 Playwright...")
             await self.init_browser(start_url)
@@ -220,20 +243,16 @@ class BahamutHandler(StreamHandler):
 
             return urls
 
-        # 同步部分：在新 event loop 裡呼叫 _parse_urls_async()
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        # 同步部分：交給常駐的瀏覽器 event loop 執行 _parse_urls_async()
         try:
-            urls = loop.run_until_complete(_parse_urls_async())
+            urls = BrowserLoop.run(_parse_urls_async())
             print(f"[DEBUG] parse_urls(): _parse_urls_async() 回傳 {len(urls)} 個 URL。")
         except Exception as e:
             print(f"[ERROR] parse_urls(): 呼叫 _parse_urls_async() 發生例外: {e}")
             urls = []
-        finally:
-            if not loop.is_closed():
-                loop.close()
-            print("[DEBUG] parse_urls(): event loop 已關閉。")
 
+        if urls and validators:
+            metadata_cache.put_episodes(start_url, urls, validators)
         return urls
 
 
@@ -256,14 +275,15 @@ class BahamutHandler(StreamHandler):
         这版示范：
         1. 先从传入的 URL (e.g. https://ani.gamer.com.tw/animeVideo.php?sn=43389) 中
            解析出查询参数 sn 的值 (如“43389”)。
-        2. 用 Playwright 点击「同意」(id="adult")，让广告开始播放。
-        3. 等待最多 40 秒，监听所有响应，只捕获同时满足：
+        2. 在点击「同意」(id="adult") 之前先挂上 request 谓词等待，
+           只匹配同时满足以下条件的请求：
            - URL 中包含 “.m3u8”
            - URL 中包含解析到的 sn 值 (e.g. “43389”)
-           并将那次请求的 headers 读出。
-        4. 关闭浏览器。
-        5. 将 headers 转成 Streamlink 要求的 `--http-header Key=Value` 格式。
-        6. 调用 Streamlink，下载并合并为 `out_file` (.ts)。
+        3. 一旦匹配的请求发出就立即返回（总期限 M3U8_CAPTURE_TIMEOUT 秒），
+           读取该请求的 headers 并马上关闭页面。
+        4. 若为 VOD 清单，回传 None，改由 build_method 以内建分段下载器平行下载。
+        5. 否则将 headers 转成 Streamlink 要求的 `--http-header Key=Value` 格式，
+           调用 Streamlink，下载并合并为 `out_file` (.ts)。
         """
 
         async def _grab_m3u8_and_headers():
@@ -275,103 +295,67 @@ class BahamutHandler(StreamHandler):
             qs = urllib.parse.parse_qs(parsed_page.query)
             sn_values = qs.get("sn", [])
             if not sn_values:
-                await self.close_browser()
                 raise RuntimeError("[ERROR] _grab_m3u8_and_headers(): 无法从 URL 中解析出 sn 参数，请确认 URL 格式。")
             sn = sn_values[0]
             print(f"[DEBUG] _grab_m3u8_and_headers(): 解析到 sn = {sn}")
 
-            # --- 2. 启动 Playwright 并打开页面 ---
-            print("[DEBUG] _grab_m3u8_and_headers(): 调用 init_browser() 启动 Playwright ...")
+            # --- 2. 打开页面（BrowserManager.new_page 已完成导航，不再重复 goto） ---
             await self.init_browser(url)
             page: Page = self.page
-            print("[DEBUG] _grab_m3u8_and_headers(): Playwright 启动完成。")
+            started = time.monotonic()
 
-            print(f"[DEBUG] _grab_m3u8_and_headers(): 导航到影片页面：{url}")
-            await page.goto(url, wait_until="load")
-            print("[DEBUG] _grab_m3u8_and_headers(): 页面加载完成。")
+            def _is_target(request) -> bool:
+                # 热路径上不做任何输出，只判断 URL
+                req_url = request.url
+                return ".m3u8" in req_url and sn in req_url
 
-            # --- 3. 点击「同意」按钮 (#adult) 让广告开始播放 ---
             try:
-                print("[DEBUG] _grab_m3u8_and_headers(): 尝试点击同意按钮 (#adult) ...")
-                await page.click("#adult")
-                print("[DEBUG] _grab_m3u8_and_headers(): 同意按钮已点击。")
-            except Exception as e:
-                print(f"[ERROR] _grab_m3u8_and_headers(): 点击 #adult 同意按钮失败: {e}")
-                await self.close_browser()
-                raise RuntimeError(f"找不到或无法点击 #adult 同意按钮: {e}") from e
-
-            # --- 4. 监听页面所有 response，只捕获同时含 .m3u8 且包含 sn 的 URL ---
-            m3u8_url = None
-            m3u8_headers = None
-
-            def _on_response(response):
-                nonlocal m3u8_url, m3u8_headers
-                resp_url = response.url
-                # 每个 response 都打印出来，便于调试
-                print(f"[DEBUG] _on_response(): 收到 response URL = {resp_url}")
-
-                # 判断条件：URL 中包含 ".m3u8" 且包含 sn
-                if m3u8_url is None and (".m3u8" in resp_url) and (sn in resp_url):
-                    m3u8_url = resp_url
-                    print(f"[DEBUG] _on_response(): 匹配到目标 .m3u8 (包含 sn={sn})，m3u8_url = {m3u8_url}")
-                    # 读取此次 request 的 headers
+                # --- 3. 先挂上谓词等待，再点击「同意」，请求一出现就立即返回 ---
+                async with page.expect_request(
+                    _is_target, timeout=M3U8_CAPTURE_TIMEOUT * 1000
+                ) as request_info:
                     try:
-                        req_hdrs = response.request.headers
-                        m3u8_headers = dict(req_hdrs)
-                        print(f"[DEBUG] _on_response(): 读取到 headers_dict = {m3u8_headers}")
+                        await page.click("#adult")
+                        print("[DEBUG] _grab_m3u8_and_headers(): 同意按钮已点击。")
                     except Exception as e:
-                        print(f"[WARNING] _on_response(): 读取 request.headers 失败: {e}")
-                        m3u8_headers = {}
-
-            page.on("response", _on_response)
-            print("[DEBUG] _grab_m3u8_and_headers(): 已设置 response 监听器。")
-
-            # --- 5. 等待最多 40 秒，或一旦捕获到 m3u8_url 就立即跳出 ---
-            print("[DEBUG] _grab_m3u8_and_headers(): 开始等待最多 40 秒来捕获 .m3u8 请求 ...")
-            elapsed = 0.0
-            interval = 0.5  # 每 0.5 秒检查一次
-            while elapsed < 40.0:
-                if m3u8_url:
-                    print(f"[DEBUG] _grab_m3u8_and_headers(): 成功在 {elapsed:.1f} 秒内捕获到目标 .m3u8")
-                    break
-                await asyncio.sleep(interval)
-                elapsed += interval
-            else:
-                print(f"[WARNING] _grab_m3u8_and_headers(): 已等待 40 秒，仍未捕获到包含 sn={sn} 的 .m3u8")
-
-            # --- 6. 关闭 Playwright 浏览器 ---
-            print("[DEBUG] _grab_m3u8_and_headers(): 开始关闭 Playwright 浏览器 ...")
-            await self.close_browser()
-            print("[DEBUG] _grab_m3u8_and_headers(): Playwright 已关闭。")
+                        print(f"[ERROR] _grab_m3u8_and_headers(): 点击 #adult 同意按钮失败: {e}")
+                        raise RuntimeError(f"找不到或无法点击 #adult 同意按钮: {e}") from e
+                request = await request_info.value
+                m3u8_url = request.url
+                m3u8_headers = dict(await request.all_headers())
+            except PlaywrightTimeoutError as e:
+                raise RuntimeError(
+                    f"在 {M3U8_CAPTURE_TIMEOUT} 秒内未检测到任何包含 sn 参数的 .m3u8 请求，可能广告未发出或按钮点击失败。"
+                ) from e
+            finally:
+                # --- 4. 无论成功与否，立即释放页面 ---
+                await self.close_browser()
 
-            # --- 7. 检查结果 ---
-            if not m3u8_url:
-                raise RuntimeError("在 40 秒内未检测到任何包含 sn 参数的 .m3u8 请求，可能广告未发出或按钮点击失败。")
+            print(f"[DEBUG] _grab_m3u8_and_headers(): {time.monotonic() - started:.2f} 秒内捕获到 m3u8_url = {m3u8_url}")
             if not m3u8_headers:
                 raise RuntimeError("捕获到 .m3u8 URL，但无法读取对应 request 的 headers。")
-
-            print(f"[DEBUG] _grab_m3u8_and_headers(): 返回 m3u8_url = {m3u8_url}")
-            print(f"[DEBUG] _grab_m3u8_and_headers(): 返回 headers_dict = {m3u8_headers}")
             return m3u8_url, m3u8_headers
 
         # ——— 同步部分：调用上面的 async func 捕获 m3u8_url 和 headers ———
-        print("[DEBUG] build_method(): 启动新的 event loop 来执行 _grab_m3u8_and_headers() ...")
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
         try:
-            m3u8_url, headers_dict = loop.run_until_complete(_grab_m3u8_and_headers())
-            print("[DEBUG] build_method(): _grab_m3u8_and_headers() 返回成功。")
+            m3u8_url, headers_dict = BrowserLoop.run(_grab_m3u8_and_headers())
+            print("[DEBUG] build_cmd(): _grab_m3u8_and_headers() 返回成功。")
         except Exception as e:
-            print(f"[ERROR] build_method(): _grab_m3u8_and_headers() 抛出异常: {e}")
-            loop.close()
-            print("[DEBUG] build_method(): event loop 已关闭。")
+            print(f"[ERROR] build_cmd(): _grab_m3u8_and_headers() 抛出异常: {e}")
             return
-        finally:
-            if not loop.is_closed():
-                loop.close()
-            print("[DEBUG] build_method(): event loop 已关闭。")
 
-        # --- 8. 将 headers_dict 转成 Streamlink 所需的 --http-header 参数列表 ---
+        # --- 8. VOD 清单改由内建的平行分段下载器处理（build_cmd 回传 None，交给 build_method） ---
+        try:
+            playlist = resolve_media_playlist(m3u8_url, headers_dict)
+            if is_supported(playlist):
+                print(f"[DEBUG] build_cmd(): VOD 清单共 {len(playlist.segments)} 个分段 ({playlist.duration:.0f}s)，使用内建下载器")
+                self._native_jobs[out_file] = (playlist, headers_dict)
+                return None
+            print("[DEBUG] build_cmd(): 非 VOD 或不支援的清单格式，交给 Streamlink")
+        except Exception as e:
+            print(f"[WARNING] build_cmd(): 解析 m3u8 失败，交给 Streamlink: {e}")
+
+        # --- 9. 将 headers_dict 转成 Streamlink 所需的 --http-header 参数列表 ---
         print("[DEBUG] build_method(): 开始将 headers_dict 转成 header_args ...")
         header_args = []
         for key, val in headers_dict.items():
@@ -393,7 +377,19 @@ class BahamutHandler(StreamHandler):
 
 
     def build_method(self, url: str, task, out_file: str):
-        return None
+        """build_cmd 判定为 VOD 时，回传以内建 HLS 分段下载器下载的函数"""
+        job = self._native_jobs.pop(out_file, None)
+        if not job:
+            return None
+        playlist, headers = job
+
+        def _download(terminated):
+            try:
+                asyncio.run(download_vod(playlist, out_file, headers, stop_event=terminated))
+            except Exception as e:
+                print(f"[ERROR] build_method(): HLS 分段下载失败: {e}")
+
+        return _download
 
 
     def __del__(self):
@@ -401,8 +397,8 @@ class BahamutHandler(StreamHandler):
         if self.page:
             print("[DEBUG] __del__(): 偵測到 page 尚未關閉，嘗試關閉...")
             try:
-                asyncio.run(self.close_browser())
-                print("[DEBUG] __del__(): page 關閉完成。")
+                BrowserLoop.submit(self.close_browser())
+                print("[DEBUG] __del__(): 已排程關閉 page。")
             except Exception as e:
                 print(f"[WARNING] __del__(): 關閉 page 時發生例外: {e}")
         else:
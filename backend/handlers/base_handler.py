@@ -3,147 +3,32 @@ from abc import ABC, abstractmethod
 import multiprocessing
 from subprocess import PIPE
 import subprocess
-import os, json, asyncio
+import importlib
+import threading
 from urllib.parse import urlparse
-from playwright.async_api import async_playwright, Page, Browser, BrowserContext
-        
-_registry = []
+
+# hostname -> "module:Class"。handler 模組（以及 Playwright）只在第一次需要時才 import。
+# 其他套件可透過 entry point 群組 HANDLER_ENTRY_POINT_GROUP 註冊，name 為 hostname，value 為 "module:Class"。
+HANDLER_SPECS = {
+    "ani.gamer.com.tw": "handlers.bahamut_handler:BahamutHandler",
+    "anime1.me": "handlers.anime1_handler:Anime1Handler",
+}
+DEFAULT_HANDLER_SPEC = "handlers.streamlink_handler:StreamlinkHandler"
+HANDLER_ENTRY_POINT_GROUP = "streamlink_webrecorder.handlers"
+
+_host_index = None
+_instances = {}
+_registry_lock = threading.Lock()
+
 
 def register_handler(pattern):
+    """標記 handler 可處理的 URL 樣式；hostname 命中後再以此樣式確認"""
     def deco(cls):
-        _registry.append((re.compile(pattern), cls()))
+        cls.url_pattern = re.compile(pattern)
         return cls
     return deco
 
 
-import asyncio
-import os
-import json
-from urllib.parse import urlparse
-from playwright.async_api import async_playwright, Browser, BrowserContext, Page
-
-STORAGE_PATH = "/playwright"
-
-class BrowserManager:
-    _semaphore = asyncio.Semaphore(1)
-    _playwright = None
-    _browser: Browser = None
-    _contexts: dict[str, BrowserContext] = {}
-    _lock = asyncio.Lock()
-    _persistent_mode = False
-
-    @classmethod
-    async def init(cls, persistent: bool = False, headless: bool = False):
-        cls._persistent_mode = persistent
-
-        async with cls._lock:
-            if cls._playwright is None:
-                cls._playwright = await async_playwright().start()
-
-            if persistent:
-                # 使用 persistent_context -> 不需要 browser 物件
-                return
-
-            if cls._browser is None:
-                cls._browser = await cls._playwright.firefox.launch(
-                    headless=headless,
-                    args=["--no-sandbox", "--disable-dev-shm-usage"]
-                )
-
-    @classmethod
-    async def get_context(cls, context_id: str, headless: bool = False) -> BrowserContext:
-        print(f"[BrowserManager] get_context({context_id})")
-        if context_id in cls._contexts:
-            print(f"[BrowserManager] context 已存在：{context_id}")
-            return cls._contexts[context_id]
-
-        print(f"[BrowserManager] context 不存在：{context_id}")
-        base_dir = f"{STORAGE_PATH}/{context_id}"
-        os.makedirs(base_dir, exist_ok=True)
-        print(f"[BrowserManager] base_dir: {base_dir}")
-
-        if cls._persistent_mode:
-            print(f"[BrowserManager] persistent 模式，使用 launch_persistent_context")
-            context = await cls._playwright.firefox.launch_persistent_context(
-                user_data_dir=base_dir,
-                headless=headless,
-                args=["--no-sandbox", "--disable-dev-shm-usage"]
-            )
-            print(f"[BrowserManager] launch_persistent_context 成功")
-        else:
-            print(f"[BrowserManager] 非 persistent 模式，使用 new_context")
-            storage_path = os.path.join(base_dir, "state.json")
-            print(f"[BrowserManager] storage_path: {storage_path}")
-            print(f"[DEBUG] browser = {cls._browser}")
-            if os.path.exists(storage_path):
-                context = await cls._browser.new_context(storage_state=storage_path)
-            else:
-                context = await cls._browser.new_context()
-            print(f"[BrowserManager] new_context 成功")
-
-        cls._contexts[context_id] = context
-        print(f"[BrowserManager] context 已儲存：{context_id}")
-        return context
-
-    @classmethod
-    async def new_page(cls, context_id: str, target_url: str, headless: bool = False):
-        print(f"[BrowserManager] 開啟 {target_url} for {context_id} (persistent={cls._persistent_mode})")
-        async with cls._semaphore:
-            print(f"[BrowserManager] semaphore acquired for {context_id}")
-            context = await cls.get_context(context_id, headless=headless)
-            print(f"[BrowserManager] context acquired for {context_id}")
-            page = await context.new_page()
-            print(f"[BrowserManager] page acquired for {context_id}")
-            try:
-                print(f"[BrowserManager] 前往 {target_url}")
-                await page.goto(target_url, timeout=15000)
-                print(f"[BrowserManager] 前往 {target_url} 成功")
-                return page
-            except Exception as e:
-                print(f"[BrowserManager] page.goto() 失敗: {e}")
-                await page.close()
-                raise
-
-    @classmethod
-    async def save_session(cls, context_id: str):
-        if cls._persistent_mode:
-            print(f"[BrowserManager] persistent 模式不需手動 save_session")
-            return
-
-        context = cls._contexts.get(context_id)
-        if not context:
-            print(f"[BrowserManager] 無對應 context: {context_id}")
-            return
-
-        storage_path = f"{STORAGE_PATH}/{context_id}/state.json"
-        await context.storage_state(path=storage_path)
-        print(f"[BrowserManager] 儲存狀態至 {storage_path}")
-
-    @classmethod
-    async def close(cls):
-        if not cls._persistent_mode:
-            for context_id, context in cls._contexts.items():
-                try:
-                    storage_path = f"{STORAGE_PATH}/{context_id}/state.json"
-                    await context.storage_state(path=storage_path)
-                    print(f"[BrowserManager] 自動儲存 {context_id} 狀態至 {storage_path}")
-                except Exception as e:
-                    print(f"[BrowserManager] 儲存 {context_id} 狀態失敗: {e}")
-
-        for context in cls._contexts.values():
-            await context.close()
-        cls._contexts.clear()
-
-        if cls._browser:
-            await cls._browser.close()
-            cls._browser = None
-
-        if cls._playwright:
-            await cls._playwright.stop()
-            cls._playwright = None
-
-
-
 class StreamHandler(ABC):
     @abstractmethod
     def parse_urls(self, start_url: str) -> list[str]:
@@ -180,15 +65,28 @@ class StreamHandler(ABC):
         """建構錄影方法，回傳一個可被 multiprocessing.Process 執行的函數"""
         pass
 
-    def start_recording(self, url: str, task, out_file: str):
-        """統一的錄影啟動介面，優先使用 build_cmd"""
+    def start_recording(self, url: str, task, out_file: str, to_stdout: bool = False):
+        """
+        統一的錄影啟動介面，優先使用 build_cmd。
+        to_stdout=True 時把命令中的 `-o out_file` 換成 streamlink 的 `-O`，由呼叫端從 proc.stdout 讀取串流；
+        回傳的 proc.to_stdout 表示是否真的改為輸出到 stdout（命令沒有 `-o out_file` 時維持寫檔）。
+        """
         cmd = self.build_cmd(url, task, out_file)
         if cmd:
-            return subprocess.Popen(
+            piped = False
+            if to_stdout:
+                for i in range(len(cmd) - 1):
+                    if cmd[i] in ("-o", "--output") and cmd[i + 1] == out_file:
+                        cmd = cmd[:i] + ["-O"] + cmd[i + 2:]
+                        piped = True
+                        break
+            proc = subprocess.Popen(
                 cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE
             )
+            proc.to_stdout = piped
+            return proc
         
         # 如果沒有 cmd 才使用 build_method
         terminated = multiprocessing.Event()
@@ -200,21 +98,68 @@ class StreamHandler(ABC):
         proc.stdout = PIPE
         proc.stderr = PIPE
         proc.terminate = lambda: terminated.set()
+        proc.to_stdout = False
         proc.start()
         return proc
 
-from handlers.streamlink_handler import StreamlinkHandler
-from handlers.bahamut_handler import BahamutHandler
-from handlers.anime1_handler import Anime1Handler
+
+def _load_entry_points() -> dict:
+    try:
+        from importlib.metadata import entry_points
+        eps = entry_points()
+        if hasattr(eps, "select"):
+            eps = eps.select(group=HANDLER_ENTRY_POINT_GROUP)
+        else:
+            eps = eps.get(HANDLER_ENTRY_POINT_GROUP, [])
+        return {ep.name.lower(): ep.value for ep in eps}
+    except Exception as e:
+        print(f"[WARNING] 讀取 handler entry points 失敗: {e}")
+        return {}
+
+
+def _get_host_index() -> dict:
+    global _host_index
+    if _host_index is None:
+        index = dict(HANDLER_SPECS)
+        index.update(_load_entry_points())
+        _host_index = index
+    return _host_index
+
+
+def _lookup_spec(url: str):
+    """依 hostname（含上層網域，例如 www.anime1.me -> anime1.me）查出 handler spec"""
+    host = (urlparse(url).hostname or "").lower()
+    index = _get_host_index()
+    while host:
+        spec = index.get(host)
+        if spec:
+            return spec
+        _, _, host = host.partition(".")
+    return None
+
+
+def _load_handler(spec: str) -> StreamHandler:
+    handler = _instances.get(spec)
+    if handler is not None:
+        return handler
+    with _registry_lock:
+        handler = _instances.get(spec)
+        if handler is None:
+            module_name, _, attr = spec.partition(":")
+            cls = getattr(importlib.import_module(module_name), attr)
+            handler = cls()
+            _instances[spec] = handler
+            print(f"[DEBUG] 已載入 handler：{spec}")
+    return handler
+
 
 def get_handler(task) -> StreamHandler:
     # 依 tool 選擇預設 handler
     if task.tool == 'custom':
-        # 先匹配專屬 handler
-        for pattern, handler in _registry:
-            print(f"[DEBUG] 匹配專屬 handler：{pattern} for {task.url}")
-            if pattern.search(task.url):
-                print(f"[DEBUG] 匹配到專屬 handler：{handler} for {task.url}")
+        spec = _lookup_spec(task.url)
+        if spec:
+            handler = _load_handler(spec)
+            pattern = getattr(type(handler), "url_pattern", None)
+            if pattern is None or pattern.search(task.url):
                 return handler
-    print(f"[DEBUG] 使用預設 handler：StreamlinkHandler for {task.url}")
-    return StreamlinkHandler()
\ No newline at end of file
+    return _load_handler(DEFAULT_HANDLER_SPEC)
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import concurrent.futures
+
+
+class BrowserLoop:
+    """
+    所有 handler 的瀏覽器工作都跑在這個常駐的 event loop 執行緒上：
+    Playwright 物件只在同一個 loop 建立與重用，同步程式碼透過 submit()/run() 把 coroutine 丟進來。
+    """
+    _loop: asyncio.AbstractEventLoop = None
+    _thread: threading.Thread = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_loop(cls) -> asyncio.AbstractEventLoop:
+        if cls._loop is None or cls._thread is None or not cls._thread.is_alive():
+            with cls._lock:
+                if cls._loop is None or cls._thread is None or not cls._thread.is_alive():
+                    loop = asyncio.new_event_loop()
+                    ready = threading.Event()
+
+                    def _run():
+                        asyncio.set_event_loop(loop)
+                        loop.call_soon(ready.set)
+                        loop.run_forever()
+
+                    thread = threading.Thread(target=_run, name="browser-loop", daemon=True)
+                    thread.start()
+                    ready.wait()
+                    cls._loop, cls._thread = loop, thread
+                    print("[BrowserLoop] 瀏覽器 event loop 執行緒已啟動")
+        return cls._loop
+
+    @classmethod
+    def in_loop(cls) -> bool:
+        return cls._thread is not None and threading.current_thread() is cls._thread
+
+    @classmethod
+    def submit(cls, coro) -> concurrent.futures.Future:
+        """把 coroutine 丟到瀏覽器 loop 上執行，回傳 concurrent.futures.Future（執行緒安全）"""
+        return asyncio.run_coroutine_threadsafe(coro, cls.get_loop())
+
+    @classmethod
+    def run(cls, coro, timeout: float = None):
+        """同步等待 coroutine 在瀏覽器 loop 上執行完成並回傳結果"""
+        if cls.in_loop():
+            coro.close()
+            raise RuntimeError("BrowserLoop.run() 不可在瀏覽器 loop 執行緒內呼叫，請直接 await")
+        future = cls.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    @classmethod
+    def stop(cls):
+        with cls._lock:
+            loop, thread = cls._loop, cls._thread
+            cls._loop, cls._thread = None, None
+        if loop is not None and loop.is_running():
+            loop.call_soon_threadsafe(loop.stop)
+            if thread is not None:
+                thread.join(timeout=5)
+            print("[BrowserLoop] 瀏覽器 event loop 執行緒已停止")
@@ -0,0 +1,297 @@
+import asyncio
+import os
+import json
+import time
+from typing import Optional
+from urllib.parse import urlparse
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page
+
+STORAGE_PATH = "/playwright"
+BROWSER_IDLE_TIMEOUT = int(os.environ.get("BROWSER_IDLE_TIMEOUT", "300"))  # 秒，閒置多久後關閉瀏覽器
+REAPER_INTERVAL = 30  # 秒
+
+# 常見的廣告 / 分析第三方網域，handler 只需要 DOM 或媒體請求，這些一律不載入
+AD_TRACKER_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googletagservices.com",
+    "googlesyndication.com",
+    "doubleclick.net",
+    "adservice.google.com",
+    "facebook.net",
+    "facebook.com",
+    "scorecardresearch.com",
+    "criteo.com",
+    "criteo.net",
+    "hotjar.com",
+    "clarity.ms",
+    "cloudflareinsights.com",
+)
+
+
+def _host_matches(host: str, suffixes) -> bool:
+    return any(host == s or host.endswith("." + s) for s in suffixes)
+
+
+class BrowserManager:
+    _semaphore = asyncio.Semaphore(1)
+    _playwright = None
+    _browser: Browser = None
+    _contexts: dict[str, BrowserContext] = {}
+    _lock = asyncio.Lock()
+    _persistent_mode = False
+    _route_profiles: dict[str, dict] = {}
+    _route_stats: dict[str, dict] = {}
+    _open_pages = 0
+    _last_used = 0.0
+    _reaper_task: asyncio.Task = None
+    _lifecycle = {
+        "cold_starts": 0,
+        "last_cold_start_seconds": None,
+        "total_cold_start_seconds": 0.0,
+        "idle_reaps": 0,
+        "last_reap_at": None,
+        "launched_at": None,
+    }
+
+    @classmethod
+    def set_route_profile(cls, context_id: str, block_types=(), block_hosts=(), allow_hosts=None):
+        """
+        為指定 context 設定資源攔截規則（於建立 context 時以 context.route 套用）：
+        - block_types: 要中止的 resource_type，例如 {"image", "font", "media"}
+        - block_hosts: 要中止的網域（含子網域）
+        - allow_hosts: 若有設定，不在清單內的第三方網域一律中止
+        主框架的導航請求永遠放行。
+        """
+        cls._route_profiles[context_id] = {
+            "block_types": frozenset(block_types),
+            "block_hosts": tuple(block_hosts),
+            "allow_hosts": tuple(allow_hosts) if allow_hosts else None,
+        }
+
+    @classmethod
+    def route_stats(cls) -> dict:
+        """回傳每個 context 的攔截統計（allowed / blocked 以及依原因、類型分類的次數）"""
+        return {
+            context_id: {
+                "allowed": stats["allowed"],
+                "blocked": stats["blocked"],
+                "blocked_by_type": dict(stats["blocked_by_type"]),
+                "blocked_by_host": dict(stats["blocked_by_host"]),
+            }
+            for context_id, stats in cls._route_stats.items()
+        }
+
+    @classmethod
+    def _block_reason(cls, profile: dict, request) -> Optional[str]:
+        if request.is_navigation_request() and request.frame.parent_frame is None:
+            return None
+        resource_type = request.resource_type
+        if resource_type in profile["block_types"]:
+            return "type"
+        host = urlparse(request.url).hostname or ""
+        if _host_matches(host, profile["block_hosts"]):
+            return "host"
+        if profile["allow_hosts"] is not None and not _host_matches(host, profile["allow_hosts"]):
+            return "host"
+        return None
+
+    @classmethod
+    async def _install_routes(cls, context_id: str, context: BrowserContext):
+        profile = cls._route_profiles.get(context_id)
+        if not profile:
+            return
+        stats = cls._route_stats.setdefault(context_id, {
+            "allowed": 0,
+            "blocked": 0,
+            "blocked_by_type": {},
+            "blocked_by_host": {},
+        })
+
+        async def _route(route):
+            request = route.request
+            reason = cls._block_reason(profile, request)
+            if reason is None:
+                stats["allowed"] += 1
+                await route.continue_()
+                return
+            stats["blocked"] += 1
+            if reason == "type":
+                key, bucket = request.resource_type, stats["blocked_by_type"]
+            else:
+                key, bucket = urlparse(request.url).hostname or "", stats["blocked_by_host"]
+            bucket[key] = bucket.get(key, 0) + 1
+            await route.abort("blockedbyclient")
+
+        await context.route("**/*", _route)
+        print(f"[BrowserManager] 已套用資源攔截規則：{context_id}")
+
+    @classmethod
+    async def init(cls, persistent: bool = False, headless: bool = False):
+        cls._persistent_mode = persistent
+
+        async with cls._lock:
+            started = time.monotonic()
+            cold = False
+            if cls._playwright is None:
+                cls._playwright = await async_playwright().start()
+                cold = True
+
+            # 使用 persistent_context -> 不需要 browser 物件
+            if not persistent and cls._browser is None:
+                cls._browser = await cls._playwright.firefox.launch(
+                    headless=headless,
+                    args=["--no-sandbox", "--disable-dev-shm-usage"]
+                )
+                cold = True
+
+            if cold:
+                elapsed = time.monotonic() - started
+                cls._lifecycle["cold_starts"] += 1
+                cls._lifecycle["last_cold_start_seconds"] = round(elapsed, 3)
+                cls._lifecycle["total_cold_start_seconds"] += elapsed
+                cls._lifecycle["launched_at"] = time.time()
+                print(f"[BrowserManager] 冷啟動完成，耗時 {elapsed:.2f}s")
+            cls._last_used = time.monotonic()
+            if cls._reaper_task is None or cls._reaper_task.done():
+                cls._reaper_task = asyncio.get_running_loop().create_task(cls._reap_when_idle())
+
+    @classmethod
+    async def _reap_when_idle(cls):
+        """沒有開啟中的 page 且閒置超過 BROWSER_IDLE_TIMEOUT 時，儲存狀態並完整關閉瀏覽器"""
+        while cls._playwright is not None:
+            await asyncio.sleep(REAPER_INTERVAL)
+            if cls._open_pages > 0 or time.monotonic() - cls._last_used < BROWSER_IDLE_TIMEOUT:
+                continue
+            async with cls._semaphore:
+                # 取得 semaphore 後再確認一次，避免與剛開始的 new_page 競爭
+                if cls._open_pages > 0 or time.monotonic() - cls._last_used < BROWSER_IDLE_TIMEOUT:
+                    continue
+                idle = time.monotonic() - cls._last_used
+                print(f"[BrowserManager] 已閒置 {idle:.0f}s，關閉瀏覽器釋放記憶體")
+                await cls.close(reaping=True)
+                cls._lifecycle["idle_reaps"] += 1
+                cls._lifecycle["last_reap_at"] = time.time()
+                return
+
+    @classmethod
+    def lifecycle_stats(cls) -> dict:
+        stats = dict(cls._lifecycle)
+        stats["total_cold_start_seconds"] = round(stats["total_cold_start_seconds"], 3)
+        stats["running"] = cls._playwright is not None
+        stats["open_pages"] = cls._open_pages
+        stats["contexts"] = list(cls._contexts.keys())
+        stats["idle_seconds"] = round(time.monotonic() - cls._last_used, 1) if stats["running"] else None
+        stats["idle_timeout"] = BROWSER_IDLE_TIMEOUT
+        return stats
+
+    @classmethod
+    def _on_page_closed(cls, _page):
+        cls._open_pages = max(0, cls._open_pages - 1)
+        cls._last_used = time.monotonic()
+
+    @classmethod
+    async def get_context(cls, context_id: str, headless: bool = False) -> BrowserContext:
+        print(f"[BrowserManager] get_context({context_id})")
+        if cls._playwright is None or (not cls._persistent_mode and cls._browser is None):
+            # 瀏覽器只在第一次需要時啟動，閒置回收後也在這裡透明地重新啟動
+            await cls.init(persistent=cls._persistent_mode)
+        cls._last_used = time.monotonic()
+        if context_id in cls._contexts:
+            print(f"[BrowserManager] context 已存在：{context_id}")
+            return cls._contexts[context_id]
+
+        print(f"[BrowserManager] context 不存在：{context_id}")
+        base_dir = f"{STORAGE_PATH}/{context_id}"
+        os.makedirs(base_dir, exist_ok=True)
+        print(f"[BrowserManager] base_dir: {base_dir}")
+
+        if cls._persistent_mode:
+            print(f"[BrowserManager] persistent 模式，使用 launch_persistent_context")
+            context = await cls._playwright.firefox.launch_persistent_context(
+                user_data_dir=base_dir,
+                headless=headless,
+                args=["--no-sandbox", "--disable-dev-shm-usage"]
+            )
+            print(f"[BrowserManager] launch_persistent_context 成功")
+        else:
+            print(f"[BrowserManager] 非 persistent 模式，使用 new_context")
+            storage_path = os.path.join(base_dir, "state.json")
+            print(f"[BrowserManager] storage_path: {storage_path}")
+            print(f"[DEBUG] browser = {cls._browser}")
+            if os.path.exists(storage_path):
+                context = await cls._browser.new_context(storage_state=storage_path)
+            else:
+                context = await cls._browser.new_context()
+            print(f"[BrowserManager] new_context 成功")
+
+        await cls._install_routes(context_id, context)
+        cls._contexts[context_id] = context
+        print(f"[BrowserManager] context 已儲存：{context_id}")
+        return context
+
+    @classmethod
+    async def new_page(cls, context_id: str, target_url: str, headless: bool = False):
+        print(f"[BrowserManager] 開啟 {target_url} for {context_id} (persistent={cls._persistent_mode})")
+        async with cls._semaphore:
+            print(f"[BrowserManager] semaphore acquired for {context_id}")
+            context = await cls.get_context(context_id, headless=headless)
+            print(f"[BrowserManager] context acquired for {context_id}")
+            page = await context.new_page()
+            cls._open_pages += 1
+            page.on("close", cls._on_page_closed)
+            print(f"[BrowserManager] page acquired for {context_id}")
+            try:
+                print(f"[BrowserManager] 前往 {target_url}")
+                await page.goto(target_url, timeout=15000)
+                print(f"[BrowserManager] 前往 {target_url} 成功")
+                return page
+            except Exception as e:
+                print(f"[BrowserManager] page.goto() 失敗: {e}")
+                await page.close()
+                raise
+
+    @classmethod
+    async def save_session(cls, context_id: str):
+        if cls._persistent_mode:
+            print(f"[BrowserManager] persistent 模式不需手動 save_session")
+            return
+
+        context = cls._contexts.get(context_id)
+        if not context:
+            print(f"[BrowserManager] 無對應 context: {context_id}")
+            return
+
+        storage_path = f"{STORAGE_PATH}/{context_id}/state.json"
+        await context.storage_state(path=storage_path)
+        print(f"[BrowserManager] 儲存狀態至 {storage_path}")
+        stats = cls._route_stats.get(context_id)
+        if stats:
+            print(f"[BrowserManager] {context_id} 資源攔截統計: allowed={stats['allowed']} blocked={stats['blocked']}")
+
+    @classmethod
+    async def close(cls, reaping: bool = False):
+        if cls._reaper_task is not None and not reaping:
+            cls._reaper_task.cancel()
+        cls._reaper_task = None
+        if not cls._persistent_mode:
+            for context_id, context in cls._contexts.items():
+                try:
+                    storage_path = f"{STORAGE_PATH}/{context_id}/state.json"
+                    await context.storage_state(path=storage_path)
+                    print(f"[BrowserManager] 自動儲存 {context_id} 狀態至 {storage_path}")
+                except Exception as e:
+                    print(f"[BrowserManager] 儲存 {context_id} 狀態失敗: {e}")
+
+        for context in cls._contexts.values():
+            await context.close()
+        cls._contexts.clear()
+
+        if cls._browser:
+            await cls._browser.close()
+            cls._browser = None
+
+        if cls._playwright:
+            await cls._playwright.stop()
+            cls._playwright = None
+        cls._open_pages = 0
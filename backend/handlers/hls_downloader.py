@@ -0,0 +1,280 @@
+import os
+import asyncio
+import urllib.parse
+from typing import Optional
+import httpx
+from handlers.http_client import get_session
+
+try:
+    # streamlink 本身依賴 pycryptodome，AES-128 分段直接沿用
+    from Crypto.Cipher import AES
+except ImportError:  # pragma: no cover
+    AES = None
+
+SEGMENT_CONCURRENCY = 8       # 同時下載的分段數
+REORDER_WINDOW = 32           # 最多領先寫入位置幾個分段，限制重排緩衝的記憶體
+SEGMENT_RETRIES = 5
+SEGMENT_TIMEOUT = 30
+
+# 不轉送給分段請求的 header（pseudo-header 另外排除）
+_SKIP_HEADERS = {"host", "content-length", "connection", "accept-encoding", "range"}
+
+
+class HlsDownloadError(Exception):
+    pass
+
+
+class MediaPlaylist:
+    def __init__(self, url: str):
+        self.url = url
+        self.segments: list[dict] = []   # {"uri", "duration", "key": {...} | None, "seq"}
+        self.endlist = False
+        self.has_map = False
+        self.key_methods: set[str] = set()
+
+    @property
+    def duration(self) -> float:
+        return sum(s["duration"] for s in self.segments)
+
+
+def _parse_attributes(value: str) -> dict:
+    attrs = {}
+    key, buf, in_quotes = None, "", False
+    for ch in value + ",":
+        if ch == '"':
+            in_quotes = not in_quotes
+        elif ch == "=" and not in_quotes and key is None:
+            key, buf = buf.strip(), ""
+        elif ch == "," and not in_quotes:
+            if key is not None:
+                attrs[key] = buf.strip().strip('"')
+            key, buf = None, ""
+        else:
+            buf += ch
+    return attrs
+
+
+def _parse_master(text: str, base_url: str) -> Optional[str]:
+    """若是 master playlist，回傳頻寬最高的 variant URL；否則回傳 None"""
+    best_url, best_bw = None, -1
+    pending_bw = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-STREAM-INF:"):
+            attrs = _parse_attributes(line.split(":", 1)[1])
+            pending_bw = int(attrs.get("BANDWIDTH", "0") or 0)
+        elif line and not line.startswith("#") and pending_bw is not None:
+            if pending_bw > best_bw:
+                best_url, best_bw = urllib.parse.urljoin(base_url, line), pending_bw
+            pending_bw = None
+    return best_url
+
+
+def parse_media_playlist(text: str, url: str) -> MediaPlaylist:
+    playlist = MediaPlaylist(url)
+    seq = 0
+    key = None
+    duration = 0.0
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            seq = int(line.split(":", 1)[1])
+        elif line.startswith("#EXTINF:"):
+            duration = float(line.split(":", 1)[1].split(",", 1)[0] or 0)
+        elif line.startswith("#EXT-X-KEY:"):
+            attrs = _parse_attributes(line.split(":", 1)[1])
+            method = attrs.get("METHOD", "NONE")
+            playlist.key_methods.add(method)
+            if method == "NONE":
+                key = None
+            else:
+                key = {
+                    "method": method,
+                    "uri": urllib.parse.urljoin(url, attrs.get("URI", "")),
+                    "iv": attrs.get("IV"),
+                }
+        elif line.startswith("#EXT-X-MAP:"):
+            playlist.has_map = True
+        elif line.startswith("#EXT-X-ENDLIST"):
+            playlist.endlist = True
+        elif not line.startswith("#"):
+            playlist.segments.append({
+                "uri": urllib.parse.urljoin(url, line),
+                "duration": duration,
+                "key": key,
+                "seq": seq,
+            })
+            seq += 1
+            duration = 0.0
+    return playlist
+
+
+def clean_headers(headers: dict) -> dict:
+    return {
+        k: v for k, v in (headers or {}).items()
+        if not k.startswith(":") and k.lower() not in _SKIP_HEADERS
+    }
+
+
+def resolve_media_playlist(m3u8_url: str, headers: dict) -> MediaPlaylist:
+    """抓取 m3u8；若為 master playlist 則選擇頻寬最高的 variant，回傳解析後的 media playlist"""
+    session = get_session()
+    headers = clean_headers(headers)
+    resp = session.get(m3u8_url, headers=headers, timeout=SEGMENT_TIMEOUT)
+    resp.raise_for_status()
+    variant = _parse_master(resp.text, resp.url)
+    if variant:
+        print(f"[HlsDownloader] master playlist，選擇最高頻寬 variant: {variant}")
+        resp = session.get(variant, headers=headers, timeout=SEGMENT_TIMEOUT)
+        resp.raise_for_status()
+    return parse_media_playlist(resp.text, resp.url)
+
+
+def is_supported(playlist: MediaPlaylist) -> bool:
+    """只處理 VOD（有 ENDLIST）、MPEG-TS 分段、無加密或 AES-128 的清單，其餘交給 streamlink"""
+    if not playlist.endlist or playlist.has_map or not playlist.segments:
+        return False
+    methods = playlist.key_methods - {"NONE"}
+    if not methods:
+        return True
+    return methods == {"AES-128"} and AES is not None
+
+
+async def download_vod(playlist: MediaPlaylist, out_file: str, headers: dict,
+                       concurrency: int = SEGMENT_CONCURRENCY, stop_event=None) -> int:
+    """
+    平行下載 VOD 的所有分段，並依序寫入單一 TS：
+    - `concurrency` 個 worker 共用一個 keep-alive 的 httpx.AsyncClient，帶上擷取到的 headers
+    - 每個分段各自重試 SEGMENT_RETRIES 次
+    - 下載完成的分段放進重排緩衝，由 writer 依序寫入 <out_file>.part，完成後改名為 out_file
+    回傳寫入的位元組數。
+    """
+    segments = playlist.segments
+    total = len(segments)
+    part_file = f"{out_file}.part"
+    os.makedirs(os.path.dirname(out_file) or ".", exist_ok=True)
+
+    buffer: dict[int, bytes] = {}
+    cond = asyncio.Condition()
+    next_write = 0
+    next_fetch = 0
+    failure: list[BaseException] = []
+    keys: dict[str, asyncio.Future] = {}
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(
+        headers=clean_headers(headers),
+        limits=limits,
+        timeout=SEGMENT_TIMEOUT,
+        follow_redirects=True,
+    ) as client:
+
+        def _cancelled() -> bool:
+            return bool(failure) or (stop_event is not None and stop_event.is_set())
+
+        async def _get_key(uri: str) -> bytes:
+            # 同一把 key 只抓一次；失敗時移除，讓下一次重試重新抓
+            if uri not in keys:
+                keys[uri] = asyncio.ensure_future(client.get(uri))
+            try:
+                resp = await keys[uri]
+                resp.raise_for_status()
+            except httpx.HTTPError:
+                keys.pop(uri, None)
+                raise
+            return resp.content
+
+        async def _fetch(index: int) -> bytes:
+            seg = segments[index]
+            last_error = None
+            for attempt in range(1, SEGMENT_RETRIES + 1):
+                if _cancelled():
+                    raise HlsDownloadError("下載已中止")
+                try:
+                    resp = await client.get(seg["uri"])
+                    resp.raise_for_status()
+                    data = resp.content
+                    key = seg["key"]
+                    if key:
+                        key_bytes = await _get_key(key["uri"])
+                        if key["iv"]:
+                            iv = bytes.fromhex(key["iv"][2:] if key["iv"].lower().startswith("0x") else key["iv"])
+                        else:
+                            iv = seg["seq"].to_bytes(16, "big")
+                        data = AES.new(key_bytes, AES.MODE_CBC, iv).decrypt(data)
+                        data = data[: -data[-1]] if data and 0 < data[-1] <= 16 else data
+                    return data
+                except (httpx.HTTPError, ValueError) as e:
+                    last_error = e
+                    await asyncio.sleep(min(2 ** attempt, 15))
+            raise HlsDownloadError(f"分段 {index} 重試 {SEGMENT_RETRIES} 次仍失敗: {last_error}")
+
+        async def _worker():
+            nonlocal next_fetch
+            while True:
+                async with cond:
+                    # 限制重排緩衝：不要領先寫入位置太多
+                    await cond.wait_for(lambda: next_fetch - next_write < REORDER_WINDOW or failure)
+                    if failure or next_fetch >= total:
+                        return
+                    index = next_fetch
+                    next_fetch += 1
+                try:
+                    data = await _fetch(index)
+                except BaseException as e:
+                    async with cond:
+                        failure.append(e)
+                        cond.notify_all()
+                    return
+                async with cond:
+                    buffer[index] = data
+                    cond.notify_all()
+
+        async def _writer():
+            nonlocal next_write
+            written = 0
+            last_report = 0
+            with open(part_file, "wb") as f:
+                while next_write < total:
+                    async with cond:
+                        await cond.wait_for(lambda: next_write in buffer or failure)
+                        if failure:
+                            return written
+                        data = buffer.pop(next_write)
+                    f.write(data)
+                    written += len(data)
+                    async with cond:
+                        next_write += 1
+                        cond.notify_all()
+                    if next_write - last_report >= 50 or next_write == total:
+                        last_report = next_write
+                        print(f"[HlsDownloader] 已寫入 {next_write}/{total} 個分段（{written / 1024 / 1024:.1f} MB）")
+            return written
+
+        async def _watch_stop():
+            # 外部中止（multiprocessing Event）時喚醒所有等待者
+            while stop_event is not None:
+                await asyncio.sleep(0.5)
+                if stop_event.is_set():
+                    async with cond:
+                        failure.append(HlsDownloadError("下載已中止"))
+                        cond.notify_all()
+                    return
+
+        watcher = asyncio.ensure_future(_watch_stop())
+        workers = [asyncio.ensure_future(_worker()) for _ in range(max(1, concurrency))]
+        try:
+            written = await _writer()
+            await asyncio.gather(*workers)
+        finally:
+            watcher.cancel()
+            for w in workers:
+                w.cancel()
+
+    if failure:
+        raise HlsDownloadError(str(failure[0])) from failure[0]
+    os.replace(part_file, out_file)
+    print(f"[HlsDownloader] 完成：{out_file}（{total} 個分段，{written / 1024 / 1024:.2f} MB）")
+    return written
@@ -0,0 +1,31 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# 所有 handler 共用的 HTTP 連線池（keep-alive），避免每次請求都重新握手
+DEFAULT_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:126.0) "
+        "Gecko/20100101 Firefox/126.0"
+    ),
+    "Accept-Language": "zh-TW,zh;q=0.9,en;q=0.6",
+}
+POOL_SIZE = 16
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """取得共用的 requests.Session（lazy 建立，執行緒安全）"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update(DEFAULT_HEADERS)
+                _session = session
+    return _session
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Optional
+from handlers.http_client import get_session
+
+CACHE_PATH = os.path.join(os.environ.get("DATA_DIR", "/data"), "handler_cache.json")
+EPISODE_LIST_TTL = 24 * 3600      # 超過此時間強制完整重爬一次
+TITLE_TTL = 30 * 24 * 3600        # 標題幾乎不會變
+
+
+def fingerprint(items) -> str:
+    """將擷取到的連結 / 文字清單轉成穩定的指紋"""
+    h = hashlib.sha1()
+    for item in items:
+        h.update(str(item).encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+class MetadataCache:
+    """
+    Handler 的持久化中繼資料快取：
+    - episodes: 以系列 URL 為 key，保存集數清單與驗證資訊（ETag / Last-Modified / 首頁指紋）
+    - titles:   以集數 id 為 key，保存標題
+    寫入時以暫存檔 + os.replace 原子替換。
+    """
+
+    def __init__(self, path: str = CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _load(self) -> dict:
+        if self._data is None:
+            data = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                except Exception as e:
+                    print(f"[MetadataCache] 讀取快取失敗，重新建立: {e}")
+                    data = {}
+            data.setdefault("episodes", {})
+            data.setdefault("titles", {})
+            self._data = data
+        return self._data
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    # ——— 集數清單 ———
+    def check_episodes(self, series_url: str, extract) -> tuple[Optional[list[str]], dict]:
+        """
+        以一次小型 HTTP 請求重新驗證快取的集數清單。
+        extract(html) 需回傳用來計算指紋的項目清單（例如集數連結），取不到時回傳 None。
+        回傳 (urls, validators)：
+        - urls 不為 None 代表快取仍有效，可直接使用
+        - validators 供完整重爬後呼叫 put_episodes 保存
+        """
+        with self._lock:
+            entry = self._load()["episodes"].get(series_url)
+        expired = entry is None or time.time() - entry.get("crawled_at", 0) > EPISODE_LIST_TTL
+
+        headers = {}
+        if entry and not expired:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            resp = get_session().get(series_url, headers=headers, timeout=15)
+        except Exception as e:
+            print(f"[MetadataCache] 重新驗證 {series_url} 失敗: {e}")
+            return None, {}
+
+        if resp.status_code == 304 and entry:
+            print(f"[MetadataCache] {series_url} 304 Not Modified，使用快取 ({len(entry['urls'])} 集)")
+            self._touch(series_url)
+            return entry["urls"], {}
+        if resp.status_code != 200:
+            print(f"[MetadataCache] {series_url} 回應 {resp.status_code}，需要完整重爬")
+            return None, {}
+
+        items = extract(resp.text)
+        validators = {
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "fingerprint": fingerprint(items) if items is not None else None,
+        }
+        if (
+            entry and not expired
+            and validators["fingerprint"] is not None
+            and validators["fingerprint"] == entry.get("fingerprint")
+        ):
+            print(f"[MetadataCache] {series_url} 首頁指紋未變，使用快取 ({len(entry['urls'])} 集)")
+            self._touch(series_url, validators)
+            return entry["urls"], validators
+        return None, validators
+
+    def put_episodes(self, series_url: str, urls: list[str], validators: dict):
+        now = time.time()
+        with self._lock:
+            self._load()["episodes"][series_url] = {
+                "urls": list(urls),
+                "crawled_at": now,
+                "checked_at": now,
+                **{k: v for k, v in (validators or {}).items() if v},
+            }
+            self._save()
+
+    def _touch(self, series_url: str, validators: Optional[dict] = None):
+        with self._lock:
+            entry = self._load()["episodes"].get(series_url)
+            if entry is None:
+                return
+            entry["checked_at"] = time.time()
+            for k, v in (validators or {}).items():
+                if v:
+                    entry[k] = v
+            self._save()
+
+    # ——— 標題 ———
+    def get_title(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._load()["titles"].get(key)
+        if entry and time.time() - entry.get("fetched_at", 0) <= TITLE_TTL:
+            return entry["title"]
+        return None
+
+    def put_title(self, key: str, title: str):
+        with self._lock:
+            self._load()["titles"][key] = {"title": title, "fetched_at": time.time()}
+            self._save()
+
+
+metadata_cache = MetadataCache()
@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+from handlers.http_client import DEFAULT_HEADERS
+
+DOWNLOAD_CONNECTIONS = 4              # 同時下載的連線數
+SEGMENT_SIZE = 16 * 1024 * 1024       # 每個 byte range 的大小，也是續傳的粒度
+READ_CHUNK = 1024 * 1024
+MAX_RETRIES = 5
+REQUEST_TIMEOUT = 60
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadCancelled(DownloadError):
+    pass
+
+
+def _new_session(headers: Optional[dict], pool_size: int) -> requests.Session:
+    # 每次下載各自建立 session：可能在 fork 出來的子進程中執行，不共用父進程的連線
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def _probe(session: requests.Session, url: str) -> tuple[Optional[int], bool, Optional[str]]:
+    """以 Range: bytes=0-0 探測檔案大小與是否支援分段，回傳 (size, accept_ranges, validator)"""
+    with session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=REQUEST_TIMEOUT) as resp:
+        validator = resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+        if resp.status_code == 206:
+            content_range = resp.headers.get("Content-Range", "")
+            total = content_range.rsplit("/", 1)[-1]
+            if total.isdigit():
+                return int(total), True, validator
+            return None, False, validator
+        if resp.status_code == 200:
+            length = resp.headers.get("Content-Length")
+            return (int(length) if length and length.isdigit() else None), False, validator
+        raise DownloadError(f"探測 {url} 失敗，狀態碼 {resp.status_code}")
+
+
+def _load_journal(journal_file: str, size: int, validator: Optional[str]) -> set:
+    if not os.path.exists(journal_file):
+        return set()
+    try:
+        with open(journal_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("size") != size or data.get("validator") != validator:
+            print("[RangedDownloader] 遠端檔案已變更，捨棄舊的續傳記錄")
+            return set()
+        return {tuple(r) for r in data.get("done", [])}
+    except Exception as e:
+        print(f"[RangedDownloader] 讀取續傳記錄失敗: {e}")
+        return set()
+
+
+def _save_journal(journal_file: str, size: int, validator: Optional[str], done: set):
+    tmp = f"{journal_file}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"size": size, "validator": validator, "done": sorted(done)}, f)
+    os.replace(tmp, journal_file)
+
+
+def _covered_bytes(done: set) -> int:
+    """從 0 起連續完成的位元組數（遇到缺口就停）"""
+    cursor = 0
+    for start, end in sorted(done):
+        if start > cursor:
+            break
+        cursor = max(cursor, end + 1)
+    return cursor
+
+
+def _fetch_range(session, url, fd, start, end, should_stop, progress):
+    """下載 [start, end] 並以 os.pwrite 寫到對應位置；斷線時從已寫入的位置續傳"""
+    offset = start
+    attempt = 0
+    while offset <= end:
+        if should_stop():
+            raise DownloadCancelled("下載已被取消")
+        try:
+            headers = {"Range": f"bytes={offset}-{end}"}
+            with session.get(url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as resp:
+                if resp.status_code != 206:
+                    raise DownloadError(f"range {offset}-{end} 回應 {resp.status_code}")
+                for chunk in resp.iter_content(chunk_size=READ_CHUNK):
+                    if should_stop():
+                        raise DownloadCancelled("下載已被取消")
+                    if not chunk:
+                        continue
+                    chunk = chunk[: end - offset + 1]
+                    os.pwrite(fd, chunk, offset)
+                    offset += len(chunk)
+                    progress(len(chunk))
+            if offset <= end:
+                raise DownloadError(f"range {start}-{end} 提前結束於 {offset}")
+        except DownloadCancelled:
+            raise
+        except (requests.RequestException, DownloadError) as e:
+            attempt += 1
+            if attempt > MAX_RETRIES:
+                raise DownloadError(f"range {start}-{end} 重試 {MAX_RETRIES} 次仍失敗: {e}") from e
+            print(f"[RangedDownloader] range {start}-{end} 中斷於 {offset}（第 {attempt} 次重試）: {e}")
+            time.sleep(min(2 ** attempt, 30))
+    return start, end
+
+
+def _download_single(session, url, out_file, stop_event) -> int:
+    """伺服器不支援 Range 時的退路：單一連線串流下載"""
+    part_file = f"{out_file}.part"
+    written = 0
+    with session.get(url, stream=True, timeout=REQUEST_TIMEOUT) as resp:
+        if resp.status_code != 200:
+            raise DownloadError(f"下載 {url} 失敗，狀態碼 {resp.status_code}")
+        expected = resp.headers.get("Content-Length")
+        with open(part_file, "wb") as f:
+            for chunk in resp.iter_content(chunk_size=READ_CHUNK):
+                if stop_event is not None and stop_event.is_set():
+                    raise DownloadCancelled("下載已被取消")
+                if chunk:
+                    f.write(chunk)
+                    written += len(chunk)
+    if expected and expected.isdigit() and int(expected) != written:
+        raise DownloadError(f"檔案大小不符：預期 {expected}，實際 {written}")
+    os.replace(part_file, out_file)
+    return written
+
+
+def download_file(url: str, out_file: str, headers: Optional[dict] = None,
+                  connections: int = DOWNLOAD_CONNECTIONS, stop_event=None) -> int:
+    """
+    多連線分段下載任意直連檔案（MP4 等），支援續傳：
+    1. 探測檔案大小與 Range 支援；不支援就退回單一連線下載。
+    2. 預先配置 <out_file>.part，依 SEGMENT_SIZE 切成多個 byte range，
+       由 `connections` 條 keep-alive 連線平行下載，以 os.pwrite 寫入對應位置。
+    3. 每完成一段就寫入 <out_file>.part.json 續傳記錄；重新執行時跳過已完成的段。
+    4. 全部完成後驗證已完成的 range 連續涵蓋整個檔案，再改名為 out_file。
+    回傳下載的總位元組數；stop_event（threading / multiprocessing Event）被設定時中止。
+    """
+    os.makedirs(os.path.dirname(out_file) or ".", exist_ok=True)
+    session = _new_session(headers, connections)
+    try:
+        size, accept_ranges, validator = _probe(session, url)
+        if not accept_ranges or not size:
+            print("[RangedDownloader] 伺服器不支援 Range，改用單一連線下載")
+            return _download_single(session, url, out_file, stop_event)
+
+        part_file = f"{out_file}.part"
+        journal_file = f"{part_file}.json"
+        segments = [(s, min(s + SEGMENT_SIZE, size) - 1) for s in range(0, size, SEGMENT_SIZE)]
+        done = _load_journal(journal_file, size, validator) if os.path.exists(part_file) else set()
+        pending = [seg for seg in segments if seg not in done]
+        print(f"[RangedDownloader] {size} bytes，共 {len(segments)} 段，待下載 {len(pending)} 段，{connections} 條連線")
+
+        fd = os.open(part_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+                if hasattr(os, "posix_fallocate"):
+                    try:
+                        os.posix_fallocate(fd, 0, size)
+                    except OSError:
+                        pass
+
+            lock = threading.Lock()
+            abort = threading.Event()  # 任一段失敗時通知其他段停止
+
+            def _should_stop():
+                return abort.is_set() or (stop_event is not None and stop_event.is_set())
+
+            downloaded = [sum(e - s + 1 for s, e in done)]
+            last_report = [time.monotonic()]
+
+            def _progress(n):
+                with lock:
+                    downloaded[0] += n
+                    now = time.monotonic()
+                    if now - last_report[0] >= 5:
+                        last_report[0] = now
+                        print(f"[RangedDownloader] 進度 {downloaded[0] * 100 / size:.1f}% ({downloaded[0]}/{size})")
+
+            with ThreadPoolExecutor(max_workers=connections) as pool:
+                futures = [
+                    pool.submit(_fetch_range, session, url, fd, s, e, _should_stop, _progress)
+                    for s, e in pending
+                ]
+                try:
+                    for fut in as_completed(futures):
+                        seg = fut.result()
+                        with lock:
+                            done.add(seg)
+                            _save_journal(journal_file, size, validator, done)
+                except BaseException:
+                    abort.set()
+                    for f in futures:
+                        f.cancel()
+                    raise
+
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        # .part 一開始就 ftruncate 成 size，檔案大小無法代表下載了多少；改以完成的 range 是否從 0 連續涵蓋到 size 驗證
+        covered = _covered_bytes(done)
+        if set(segments) - done or covered != size:
+            raise DownloadError(f"檔案不完整：{len(done & set(segments))}/{len(segments)} 段，連續完成 {covered}/{size} bytes")
+        os.replace(part_file, out_file)
+        try:
+            os.remove(journal_file)
+        except FileNotFoundError:
+            pass
+        print(f"[RangedDownloader] 下載完成：{out_file}（{size / 1024 / 1024:.2f} MB）")
+        return size
+    finally:
+        session.close()
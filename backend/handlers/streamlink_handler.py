@@ -27,4 +27,7 @@ class StreamlinkHandler(StreamHandler):
             task.url,
             'best',
             '-o', out_file
-        ]
\ No newline at end of file
+        ]
+    def build_method(self, url: str, task, out_file: str):
+        # 一律走 build_cmd 的 streamlink 命令列
+        return None
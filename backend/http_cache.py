@@ -0,0 +1,96 @@
+import os
+import gzip
+import json
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Callable, Optional
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# UI 輪詢的 JSON API 的條件式 GET：ETag 由狀態版本號 / 檔案 stat 算出，不必先產生內容；
+# 沒變的話直接回 304，變了才執行 build() 並視大小壓縮
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
+
+
+def file_stamp(path: str) -> Optional[tuple]:
+    """(mtime_ns, size)；檔案不存在回傳 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def dir_stamp(path: str) -> Optional[tuple]:
+    """目錄內每個檔案的 (名稱, mtime_ns, size)：只做 stat，不讀內容；錄影中的檔案變大也會改變"""
+    try:
+        with os.scandir(path) as it:
+            entries = []
+            for e in it:
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                entries.append((e.name, st.st_mtime_ns, st.st_size))
+    except OSError:
+        return None
+    return tuple(sorted(entries))
+
+
+def make_etag(*validator) -> str:
+    return 'W/"' + hashlib.sha1(repr(validator).encode()).hexdigest()[:20] + '"'
+
+
+def _not_modified(request: Request, etag: str, last_modified: Optional[float]) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        # 有 If-None-Match 時忽略 If-Modified-Since（RFC 9110）；弱比較
+        tags = {t.strip().removeprefix("W/") for t in inm.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+    ims = request.headers.get("if-modified-since")
+    if ims and last_modified is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _accepts(request: Request, coding: str) -> bool:
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == coding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+def cached_json(request: Request, validator: tuple, build: Callable[[], object],
+                last_modified: Optional[float] = None) -> Response:
+    """
+    validator 沒變（客戶端送來的 If-None-Match / If-Modified-Since 相符）就回 304，不呼叫 build；
+    否則回傳 build() 的 JSON，超過 COMPRESS_MIN_BYTES 時依 Accept-Encoding 用 br 或 gzip 壓縮。
+    Cache-Control: no-cache 讓瀏覽器每次都帶著 ETag 重新驗證，前端 fetch 不需要改。
+    """
+    etag = make_etag(*validator)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    body = json.dumps(jsonable_encoder(build()), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(body) >= COMPRESS_MIN_BYTES:
+        if brotli is not None and _accepts(request, "br"):
+            body = brotli.compress(body, quality=BROTLI_QUALITY)
+            headers["Content-Encoding"] = "br"
+        elif _accepts(request, "gzip"):
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+            headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,90 @@
+import threading
+from typing import Callable, Optional
+from job_store import get_store, HEARTBEAT_SECONDS
+
+POLL_SECONDS = 3
+
+
+class JobFailed(Exception):
+    """handler 回報不值得重試的失敗（例如來源檔無法轉檔）"""
+
+
+class JobRunner:
+    """
+    從 job_store 以租約領取工作，每個工作在自己的執行緒執行：
+    - heartbeat 執行緒定期延長租約並寫回 progress(job)；被要求取消或租約遺失時呼叫 cancel(job)
+    - handlers[kind](job) 回傳結果 dict 即完成；拋出 JobFailed 不重試，其他例外依 MAX_ATTEMPTS 重新排入佇列
+    worker.py（其他節點）與單機模式的本機轉檔都用它。
+    """
+
+    def __init__(self, worker_id: str, handlers: dict, concurrency: int = 1,
+                 progress: Callable[[dict], Optional[dict]] = None, cancel: Callable[[dict], None] = None,
+                 poll_seconds: float = POLL_SECONDS):
+        self.worker_id = worker_id
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.progress = progress or (lambda job: None)
+        self.cancel = cancel or (lambda job: None)
+        self.poll_seconds = poll_seconds
+        self._running = {}
+        self._running_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    @property
+    def kinds(self) -> list[str]:
+        return list(self.handlers)
+
+    def running(self) -> int:
+        with self._running_lock:
+            return len(self._running)
+
+    def _heartbeat(self, job: dict, done: threading.Event):
+        store = get_store()
+        while not done.wait(HEARTBEAT_SECONDS):
+            cancel = store.heartbeat(job["id"], self.worker_id, self.progress(job))
+            if cancel is None:
+                print(f"[JobRunner] 工作 {job['id']} 的租約已遺失，停止執行")
+                self.cancel(job)
+                return
+            if cancel:
+                print(f"[JobRunner] 工作 {job['id']} 被要求取消")
+                self.cancel(job)
+
+    def _run(self, job: dict):
+        store = get_store()
+        done = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job, done), daemon=True).start()
+        try:
+            result = self.handlers[job["kind"]](job)
+            store.complete(job["id"], self.worker_id, result)
+        except JobFailed as e:
+            store.fail(job["id"], self.worker_id, str(e), retry=False)
+        except Exception as e:
+            print(f"[JobRunner] 工作 {job['id']} 失敗: {e}")
+            store.fail(job["id"], self.worker_id, str(e))
+        finally:
+            done.set()
+            with self._running_lock:
+                self._running.pop(job["id"], None)
+
+    def run(self):
+        store = get_store()
+        print(f"[JobRunner] {self.worker_id} 開始領取 {self.kinds}，同時最多 {self.concurrency} 個工作")
+        while not self._stopping.is_set():
+            job = None if self.running() >= self.concurrency else store.claim(self.worker_id, self.kinds)
+            if job is None:
+                self._stopping.wait(self.poll_seconds)
+                continue
+            print(f"[JobRunner] 領取工作 {job['kind']} {job['id']}")
+            thread = threading.Thread(target=self._run, args=(job,), name=f"job-{job['id'][:8]}", daemon=True)
+            with self._running_lock:
+                self._running[job["id"]] = thread
+            thread.start()
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.run, name=f"JobRunner-{self.worker_id}", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stopping.set()
@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Optional
+from state_store import configure
+
+# 放在所有節點共用的 volume 上；該檔案系統需支援 POSIX 檔案鎖（SQLite 依賴它），
+# 多台主機共用時不能用 WAL（見 state_store.JOURNAL_MODE）
+DB_PATH = os.environ.get("JOB_DB") or os.path.join(os.environ.get("DATA_DIR", "/data"), "jobs.db")
+LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", "60"))
+HEARTBEAT_SECONDS = max(1, LEASE_SECONDS // 4)
+MAX_ATTEMPTS = 3
+ACTIVE_STATUSES = ("queued", "leased")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    dedupe_key TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cancel INTEGER NOT NULL DEFAULT 0,
+    progress TEXT,
+    result TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs(status, kind, created);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_key ON jobs(dedupe_key) WHERE status IN ('queued', 'leased');
+"""
+
+
+def _row(row: sqlite3.Row) -> dict:
+    job = dict(row)
+    for field in ("payload", "progress", "result"):
+        if job.get(field):
+            job[field] = json.loads(job[field])
+    job["cancel"] = bool(job["cancel"])
+    return job
+
+
+class JobStore:
+    """
+    共用的工作表（SQLite）：API 節點 enqueue，worker 以租約（lease）領取。
+    - claim() 在 BEGIN IMMEDIATE 交易中領取最舊的 queued 工作，設定 lease_expires
+    - worker 定期 heartbeat() 延長租約並回報進度；租約過期的工作由 requeue_expired() 放回佇列
+    - 同一個 dedupe_key 同時只會有一個 queued / leased 的工作
+    """
+
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            configure(conn)
+            self._local.conn = conn
+        return conn
+
+    def _tx(self):
+        return _Transaction(self._conn())
+
+    def enqueue(self, kind: str, payload: dict, dedupe_key: str = None) -> Optional[str]:
+        """新增工作；同 dedupe_key 已有進行中的工作時回傳 None"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        try:
+            self._conn().execute(
+                "INSERT INTO jobs (id, kind, dedupe_key, payload, status, created, updated) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, dedupe_key, json.dumps(payload, ensure_ascii=False), now, now),
+            )
+        except sqlite3.IntegrityError:
+            return None
+        return job_id
+
+    def claim(self, worker: str, kinds: list[str], lease: int = LEASE_SECONDS) -> Optional[dict]:
+        now = time.time()
+        placeholders = ",".join("?" * len(kinds))
+        with self._tx() as conn:
+            self._requeue_expired(conn, now)
+            row = conn.execute(
+                f"SELECT id FROM jobs WHERE status = 'queued' AND kind IN ({placeholders}) "
+                "ORDER BY created LIMIT 1",
+                kinds,
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated = ? WHERE id = ?",
+                (worker, now + lease, now, row["id"]),
+            )
+            return _row(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+
+    def heartbeat(self, job_id: str, worker: str, progress: dict = None, lease: int = LEASE_SECONDS) -> Optional[bool]:
+        """延長租約並回報進度；回傳是否被要求取消，租約已遺失時回傳 None"""
+        now = time.time()
+        with self._tx() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, progress = COALESCE(?, progress), updated = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (now + lease, json.dumps(progress, ensure_ascii=False) if progress is not None else None,
+                 now, job_id, worker),
+            )
+            if cur.rowcount == 0:
+                return None
+            return bool(conn.execute("SELECT cancel FROM jobs WHERE id = ?", (job_id,)).fetchone()["cancel"])
+
+    def complete(self, job_id: str, worker: str, result: dict = None):
+        self._finish(job_id, worker, "done", result)
+
+    def fail(self, job_id: str, worker: str, error: str, retry: bool = True):
+        now = time.time()
+        with self._tx() as conn:
+            row = conn.execute("SELECT attempts, cancel FROM jobs WHERE id = ? AND worker = ?",
+                               (job_id, worker)).fetchone()
+            if row is None:
+                return
+            requeue = retry and not row["cancel"] and row["attempts"] < MAX_ATTEMPTS
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, lease_expires = NULL, result = ?, updated = ? "
+                "WHERE id = ?",
+                ("queued" if requeue else "failed", json.dumps({"error": error}, ensure_ascii=False), now, job_id),
+            )
+
+    def _finish(self, job_id: str, worker: str, status: str, result: dict = None):
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, lease_expires = NULL, result = ?, updated = ? "
+            "WHERE id = ? AND worker = ?",
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+             time.time(), job_id, worker),
+        )
+
+    def _requeue_expired(self, conn, now: float) -> int:
+        cur = conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? OR cancel THEN 'failed' ELSE 'queued' END, "
+            "worker = NULL, lease_expires = NULL, updated = ? "
+            "WHERE status = 'leased' AND lease_expires < ?",
+            (MAX_ATTEMPTS, now, now),
+        )
+        if cur.rowcount:
+            print(f"[JobStore] {cur.rowcount} 個租約過期的工作已重新排入佇列")
+        return cur.rowcount
+
+    def requeue_expired(self) -> int:
+        with self._tx() as conn:
+            return self._requeue_expired(conn, time.time())
+
+    def release(self, kind: str = None, worker: str = None) -> int:
+        """
+        不等租約過期，直接把 leased 的工作放回佇列（已確定持有者不在了，例如單機模式重新啟動）。
+        每次 claim 都會累加 attempts，反覆讓程序掛掉的工作最多重試 MAX_ATTEMPTS 次。
+        """
+        sql = ("UPDATE jobs SET status = CASE WHEN attempts >= ? OR cancel THEN 'failed' ELSE 'queued' END, "
+               "worker = NULL, lease_expires = NULL, updated = ? WHERE status = 'leased'")
+        args = [MAX_ATTEMPTS, time.time()]
+        if kind:
+            sql += " AND kind = ?"
+            args.append(kind)
+        if worker:
+            sql += " AND worker = ?"
+            args.append(worker)
+        with self._tx() as conn:
+            count = conn.execute(sql, args).rowcount
+        if count:
+            print(f"[JobStore] {count} 個未完成的工作已重新排入佇列")
+        return count
+
+    def request_cancel(self, dedupe_key: str) -> int:
+        """要求取消進行中的工作：queued 直接取消，leased 由 worker 在下一次 heartbeat 看到後中止"""
+        now = time.time()
+        with self._tx() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', updated = ? WHERE dedupe_key = ? AND status = 'queued'",
+                (now, dedupe_key),
+            )
+            return conn.execute(
+                "UPDATE jobs SET cancel = 1, updated = ? WHERE dedupe_key = ? AND status = 'leased'",
+                (now, dedupe_key),
+            ).rowcount
+
+    def active(self, kind: str = None) -> list[dict]:
+        return self.list_jobs(kind=kind, statuses=ACTIVE_STATUSES, limit=1000)
+
+    def list_jobs(self, kind: str = None, statuses=None, limit: int = 100) -> list[dict]:
+        sql, args = "SELECT * FROM jobs WHERE 1 = 1", []
+        if kind:
+            sql += " AND kind = ?"
+            args.append(kind)
+        if statuses:
+            sql += f" AND status IN ({','.join('?' * len(statuses))})"
+            args.extend(statuses)
+        sql += " ORDER BY created DESC LIMIT ?"
+        args.append(limit)
+        return [_row(r) for r in self._conn().execute(sql, args).fetchall()]
+
+    def version(self, kind: str = None) -> tuple:
+        """工作表目前的戳記（筆數、最後更新時間）：任何工作新增、狀態或進度改變、被清除時都會不同，給 API 的 ETag 用"""
+        sql, args = "SELECT COUNT(*), MAX(updated) FROM jobs", ()
+        if kind:
+            sql, args = sql + " WHERE kind = ?", (kind,)
+        return tuple(self._conn().execute(sql, args).fetchone())
+
+    def purge(self, older_than_seconds: float) -> int:
+        """刪除已結束且超過保存時間的工作紀錄"""
+        cutoff = time.time() - older_than_seconds
+        return self._conn().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND updated < ?", (cutoff,)
+        ).rowcount
+
+
+class _Transaction:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> JobStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = JobStore()
+    return _store
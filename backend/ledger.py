@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+LEDGER_NAME = "recorded.jsonl"
+LEGACY_NAME = "recorded.json"
+LOCK_NAME = ".recorded.lock"
+# 不屬於錄影檔、列出錄影時要略過的 metadata 檔
+LEDGER_FILES = {LEDGER_NAME, LEGACY_NAME, f"{LEGACY_NAME}.migrated", LOCK_NAME, f"{LEDGER_NAME}.tmp"}
+COMPACT_MIN_WASTE = 100   # 多餘的行（重複或損毀）超過這個數量才重寫
+
+_ledgers = {}
+_ledgers_lock = threading.Lock()
+
+
+class RecordedLedger:
+    """
+    每個 save_dir 一份只追加的錄影記錄（recorded.jsonl），每行一筆：
+    {"url": ..., "task_id": ..., "file": ..., "time": ...}
+    - 記憶體中維護 url 集合，查詢為 O(1)
+    - 追加時持有 save_dir 下的 flock，並先讀入其他進程 / 任務剛追加的行，避免重複錄同一集
+    - 舊的 recorded.json 會在第一次開啟時匯入，之後改名為 recorded.json.migrated
+    """
+
+    def __init__(self, save_path: str):
+        self.save_path = save_path
+        self.path = os.path.join(save_path, LEDGER_NAME)
+        self.lock_path = os.path.join(save_path, LOCK_NAME)
+        self._thread_lock = threading.Lock()
+        self._entries = {}    # url -> record
+        self._offset = 0      # 已讀到的位置
+        self._inode = None
+        self._lines = 0       # 檔案中的行數（含重複 / 損毀），用來判斷是否需要壓縮
+        os.makedirs(save_path, exist_ok=True)
+        with self._locked():
+            self._migrate_legacy()
+            self._refresh()
+            self._compact_if_needed()
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            with open(self.lock_path, "a") as lf:
+                fcntl.flock(lf, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lf, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """讀入上次之後追加的行；檔案被其他進程壓縮（inode 改變）時整份重讀"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._entries, self._offset, self._inode, self._lines = {}, 0, None, 0
+            return
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            self._entries, self._offset, self._lines = {}, 0, 0
+            self._inode = st.st_ino
+        if st.st_size == self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        # 只處理完整的行；最後一行若被截斷（寫到一半當機）就留到下次
+        end = data.rfind(b"\n") + 1
+        for raw in data[:end].splitlines():
+            self._lines += 1
+            try:
+                record = json.loads(raw)
+                self._entries.setdefault(record["url"], record)
+            except (ValueError, KeyError, TypeError):
+                print(f"[Ledger] 略過損毀的記錄行: {raw[:80]!r}")
+        self._offset += end
+
+    def _append(self, records: list[dict]):
+        payload = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if self._offset < os.fstat(fd).st_size:
+                # 前一次寫入被截斷，先補上換行讓新的記錄獨立成行
+                with open(self.path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        payload = b"\n" + payload
+            os.write(fd, payload)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _migrate_legacy(self):
+        legacy = os.path.join(self.save_path, LEGACY_NAME)
+        if not os.path.exists(legacy):
+            return
+        try:
+            with open(legacy, "r", encoding="utf-8") as f:
+                urls = json.load(f)
+        except Exception as e:
+            print(f"[Ledger] 讀取 {legacy} 失敗，略過匯入: {e}")
+            return
+        self._refresh()
+        mtime = os.path.getmtime(legacy)
+        records = [
+            {"url": u, "task_id": None, "file": None, "time": mtime}
+            for u in urls if u not in self._entries
+        ]
+        if records:
+            self._append(records)
+        os.replace(legacy, f"{legacy}.migrated")
+        print(f"[Ledger] 已從 {LEGACY_NAME} 匯入 {len(records)} 筆記錄")
+
+    def _compact_if_needed(self):
+        waste = self._lines - len(self._entries)
+        if waste < COMPACT_MIN_WASTE:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for record in self._entries.values():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        st = os.stat(self.path)
+        self._inode, self._offset, self._lines = st.st_ino, st.st_size, len(self._entries)
+        print(f"[Ledger] 已壓縮 {self.path}，移除 {waste} 行")
+
+    def __contains__(self, url: str) -> bool:
+        with self._locked():
+            self._refresh()
+            return url in self._entries
+
+    def urls(self) -> set[str]:
+        """目前已錄製的 url 集合（快照）"""
+        with self._locked():
+            self._refresh()
+            return set(self._entries)
+
+    def get(self, url: str) -> Optional[dict]:
+        with self._locked():
+            self._refresh()
+            return self._entries.get(url)
+
+    def add(self, url: str, task_id: str = None, filename: str = None) -> bool:
+        """原子地追加一筆記錄；已存在則不寫入並回傳 False"""
+        with self._locked():
+            self._refresh()
+            if url in self._entries:
+                return False
+            record = {"url": url, "task_id": task_id, "file": filename, "time": time.time()}
+            self._append([record])
+            self._refresh()
+            return True
+
+    def compact(self):
+        with self._locked():
+            self._refresh()
+            self._compact_if_needed()
+
+
+def get_ledger(save_path: str) -> RecordedLedger:
+    save_path = os.path.abspath(save_path)
+    with _ledgers_lock:
+        ledger = _ledgers.get(save_path)
+        if ledger is None:
+            ledger = RecordedLedger(save_path)
+            _ledgers[save_path] = ledger
+        return ledger
+
+
+def compact_all():
+    """壓縮目前開啟過的所有 ledger（由排程定期呼叫）"""
+    with _ledgers_lock:
+        ledgers = list(_ledgers.values())
+    for ledger in ledgers:
+        try:
+            ledger.compact()
+        except Exception as e:
+            print(f"[Ledger] 壓縮 {ledger.path} 失敗: {e}")
+
+
+def is_ledger_file(name: str) -> bool:
+    return name in LEDGER_FILES
@@ -0,0 +1,190 @@
+import os
+import re
+import json
+import time
+import threading
+import subprocess
+from collections import deque
+from typing import Optional
+from ts_segmenter import TsSegmenter, MANIFEST_SUFFIX
+from proc_output import OutputCapture
+
+# 與 ts_to_mp4 相同的品質對應
+CRF_MAP = {"extreme": 36, "high": 32, "medium": 28, "low": 24}
+# 編碼跟不上即時速度時，依序換成更快的 preset
+PRESET_LADDER = ["medium", "fast", "faster", "veryfast", "superfast", "ultrafast"]
+SLOW_SPEED = 0.97          # ffmpeg 回報的 speed 低於此值視為跟不上
+WARMUP_SECONDS = 30        # 剛啟動時 speed 不穩定，不列入判斷
+LAG_WINDOW_SECONDS = 60    # 以最近這段時間的平均 speed 判斷
+SPEED_RE = re.compile(r"speed=\s*([\d.]+)x")
+
+
+class _EncoderSink:
+    """一個 ffmpeg libx265 行程：從 stdin 讀 TS，即時輸出 fragmented mp4，並回報編碼速度"""
+
+    def __init__(self, path: str, crf: int, preset: str):
+        self.path = path
+        self.preset = preset
+        self.started = time.monotonic()
+        self.speeds = deque()
+        cmd = [
+            "ffmpeg", "-hide_banner", "-nostats", "-y",
+            "-progress", "pipe:1",
+            "-f", "mpegts", "-i", "pipe:0",
+            "-map", "0:v:0?", "-map", "0:a?",
+            "-c:v", "libx265", "-crf", str(crf), "-preset", preset,
+            "-c:a", "copy",
+            # fragmented mp4：不需回頭改寫 moov，寫到一半也能播放
+            "-movflags", "+frag_keyframe+empty_moov+default_base_moof",
+            "-f", "mp4", path,
+        ]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        threading.Thread(target=self._read_progress, daemon=True).start()
+        self.stderr = OutputCapture(self.proc, streams=("stderr",), max_lines=20, name="live-encode")
+
+    def _read_progress(self):
+        for line in iter(self.proc.stdout.readline, b""):
+            m = SPEED_RE.search(line.decode("utf-8", errors="ignore"))
+            if m:
+                now = time.monotonic()
+                self.speeds.append((now, float(m.group(1))))
+                while self.speeds and now - self.speeds[0][0] > LAG_WINDOW_SECONDS:
+                    self.speeds.popleft()
+
+    def lagging(self) -> bool:
+        if time.monotonic() - self.started < WARMUP_SECONDS + LAG_WINDOW_SECONDS / 2 or not self.speeds:
+            return False
+        samples = [s for _, s in self.speeds]
+        return sum(samples) / len(samples) < SLOW_SPEED
+
+    def write(self, data: bytes):
+        self.proc.stdin.write(data)
+
+    def close(self):
+        # 只關閉 stdin，ffmpeg 會自行把剩下的畫面編完；finish() 時再等待
+        try:
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    def wait(self) -> int:
+        return self.proc.wait()
+
+
+class LiveTranscoder(TsSegmenter):
+    """
+    邊錄邊轉 HEVC：streamlink 的 TS 直接送進 ffmpeg libx265，輸出 <base>_enc001.mp4。
+    - 編碼速度持續低於即時時，在下一個關鍵幀結束目前的 ffmpeg，改用 PRESET_LADDER 中更快的 preset 接續編碼
+    - raw_file 不為 None 時同時保存原始 TS，作為轉檔失敗時的備份（不可與最終的 <base>.mp4 同名）
+    - 錄影結束後呼叫 finish() 等待所有 ffmpeg 完成，由呼叫端把各段合併成單一 mp4
+    """
+
+    def __init__(self, base_path: str, quality: str = "high", raw_file: Optional[str] = None):
+        if raw_file and os.path.abspath(raw_file) == os.path.abspath(base_path + ".mp4"):
+            raise ValueError(f"原始 TS 備份不能與最終檔同名: {raw_file}")
+        super().__init__(base_path)
+        self.crf = CRF_MAP.get(quality, 32)
+        self.preset_index = 0
+        self.raw_file = raw_file
+        self.raw_expires = None
+        # 第一次有資料要寫時才建立備份檔：沒開播（串流是空的）就不會留下 0 byte 的 .raw.ts
+        self._raw = None
+        self._raw_closed = False
+        self._sinks: list[_EncoderSink] = []
+
+    def _segment_path(self, index: int) -> str:
+        return f"{self.base_path}_enc{index:03d}.mp4"
+
+    def _open_sink(self, path: str):
+        sink = _EncoderSink(path, self.crf, PRESET_LADDER[self.preset_index])
+        self._sinks.append(sink)
+        return sink
+
+    def _write(self, data: bytes):
+        super()._write(data)
+        if self.raw_file and data and not self._raw_closed:
+            if self._raw is None:
+                self._raw = open(self.raw_file, "wb")
+            self._raw.write(data)
+
+    def _due(self, pending: int = 0) -> bool:
+        sink = self._file
+        if sink is None or not sink.lagging():
+            return False
+        if self.preset_index >= len(PRESET_LADDER) - 1:
+            return False
+        self.preset_index += 1
+        self._current["preset"] = sink.preset
+        print(f"[LiveTranscoder] 編碼跟不上即時速度，改用 preset {PRESET_LADDER[self.preset_index]}")
+        return True
+
+    def _manifest_extra(self) -> dict:
+        return {
+            "mode": "live_transcode",
+            "raw_file": os.path.basename(self.raw_file) if self.raw_file else None,
+            "raw_expires": self.raw_expires,
+        }
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._raw_closed = True
+            if self._raw is not None:
+                self._raw.close()
+                self._raw = None
+
+    def finish(self) -> Optional[list[str]]:
+        """等待所有 ffmpeg 結束；全部成功回傳各段 mp4 路徑（依序），否則回傳 None"""
+        ok = True
+        for sink in self._sinks:
+            code = sink.wait()
+            name = os.path.basename(sink.path)
+            if code == 0 and os.path.exists(sink.path):
+                self.update_segment(name, status="encoded", preset=sink.preset)
+            else:
+                ok = False
+                self.update_segment(name, status="failed", preset=sink.preset)
+                print(f"[LiveTranscoder] {name} 編碼失敗（{code}）: {sink.stderr.text(sep=' | ')}")
+        if not ok:
+            return None
+        folder = os.path.dirname(self.base_path)
+        return [os.path.join(folder, seg["file"]) for seg in self.segments]
+
+    def keep_raw_until(self, expires: Optional[float]):
+        with self._lock:
+            self.raw_expires = expires
+            self._save_manifest_locked()
+
+
+def expire_raw_copies(save_path: str, log=None, task_id: str = None) -> int:
+    """刪除超過保留時間的原始 TS 備份（依各 manifest 的 raw_expires），回傳刪除的檔案數"""
+    removed = 0
+    if not os.path.isdir(save_path):
+        return 0
+    now = time.time()
+    for name in os.listdir(save_path):
+        if not name.endswith(MANIFEST_SUFFIX):
+            continue
+        manifest_path = os.path.join(save_path, name)
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        raw, expires = manifest.get("raw_file"), manifest.get("raw_expires")
+        if not raw or not expires or now < expires:
+            continue
+        try:
+            os.remove(os.path.join(save_path, raw))
+            removed += 1
+            if log:
+                log(task_id, "evict", f"原始 TS 備份已過保留時間: 刪除 {raw}")
+        except FileNotFoundError:
+            pass
+        manifest["raw_file"], manifest["raw_expires"] = None, None
+        tmp = f"{manifest_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, manifest_path)
+    return removed
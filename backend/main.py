@@ -1,7 +1,7 @@
 import os
 import json
 import threading
-from fastapi import FastAPI, HTTPException, UploadFile, File, Response, status
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from apscheduler.schedulers.background import BackgroundScheduler
@@ -9,7 +9,7 @@ from apscheduler.triggers.interval import IntervalTrigger
 from typing import List, Optional, Literal
 import subprocess
 from uuid import uuid4
-from datetime import datetime
+from datetime import datetime, timedelta
 import signal
 import sys
 from fastapi.responses import FileResponse, StreamingResponse
@@ -19,20 +19,60 @@ import psutil
 from PIL import Image
 import time
 from handlers.base_handler import get_handler
-from handlers.base_handler import BrowserManager
-
-
-HLS_DIR = "/hls"
+from handlers.browser_loop import BrowserLoop
+from ledger import get_ledger, compact_all
+import retention
+from ts_segmenter import TsSegmenter, SegmentPipeline, stitch, GB
+from live_transcoder import LiveTranscoder, expire_raw_copies
+import conversion_policy
+import media_info
+import chunked_encoder
+import spans
+import http_cache
+import dashboard
+from proc_output import OutputCapture
+from job_store import get_store
+from job_runner import JobRunner, JobFailed
+import recovery
+import state_store
+from state_store import SharedMap, FileLock, SchedulerElection
+import socket
+import asyncio
+
+
+# all：單一程序包辦排程、錄影、轉檔與 API（預設）
+# api：只負責排程與 API，錄影 / 轉檔排入共用工作表（job_store），由 worker.py 在其他節點執行
+# worker：由 worker.py 設定，錄影後的轉檔同樣排入工作表
+RUN_MODE = os.environ.get("RUN_MODE", "all")
+
+# 各目錄可用環境變數覆寫（例如 bench/ 在暫存目錄中跑真實流程）
+HLS_DIR = os.environ.get("HLS_DIR", "/hls")
 os.makedirs(HLS_DIR, exist_ok=True)
+# 多個 API 程序（uvicorn --workers N）共用的狀態放在 state_store，任何程序都讀得到最新值
+conversion_tasks = SharedMap("conversions")  # {task_id_filename: {status, progress, start_time, quality}}
+live_recordings = SharedMap("recordings")    # task_id: {out_file, started, host, pid}
+stop_requests = SharedMap("stop_requests")   # task_id: 要求時間，由持有錄影程序的排程 leader 執行
+# 以下存放程序 handle，只存在於實際執行錄影 / HLS 的程序（排程 leader 或 worker）
 hls_processes = {}  # task_id: subprocess.Popen
-conversion_tasks = {}  # {task_id_filename: {status, progress, start_time, quality}}  
 active_recordings = {}
-
-THUMBNAILS_DIR = "/thumbnails"
+recording_outputs = {}  # task_id: 錄影中的輸出檔，retention 不會刪除
+active_segmenters = {}  # task_id: TsSegmenter（分段錄影中）
+HOSTNAME = socket.gethostname()
+
+# 轉檔一律記在工作表（DATA_DIR/jobs.db），程序重啟後未完成的轉檔會重新執行
+CONVERSION_CONCURRENCY = int(os.environ.get("CONVERSION_CONCURRENCY", "2"))
+# 已結束的轉檔狀態保留多久（秒）後從 /conversion_status 移除
+CONVERSION_STATUS_TTL = int(os.environ.get("CONVERSION_STATUS_TTL", "3600"))
+# 啟動時各任務第一次錄影的間隔，避免所有任務同時啟動 streamlink / 瀏覽器
+STARTUP_STAGGER_SECONDS = float(os.environ.get("STARTUP_STAGGER_SECONDS", "5"))
+# 錄影開始後多久檢查一次輸出是否已有資料（有資料才做空間檢查）
+ADMIT_POLL_SECONDS = 0.5
+
+THUMBNAILS_DIR = os.environ.get("THUMBNAILS_DIR", "/thumbnails")
 os.makedirs(THUMBNAILS_DIR, exist_ok=True)
 
-DATA_DIR = "/data"
-RECORDINGS_DIR = "/recordings"
+DATA_DIR = os.environ.get("DATA_DIR", "/data")
+RECORDINGS_DIR = os.environ.get("RECORDINGS_DIR", "/recordings")
 TASKS_FILE = os.path.join(DATA_DIR, "tasks.json")
 LOG_DIR = os.path.join(DATA_DIR, "logs")
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -40,16 +80,17 @@ os.makedirs(LOG_DIR, exist_ok=True)
 os.makedirs(RECORDINGS_DIR, exist_ok=True)
 
 app = FastAPI()
+# 排程只在選出的 leader 程序中啟動（見 _start_scheduler），其他 API 程序只服務 HTTP
 scheduler = BackgroundScheduler()
-scheduler.start()
 
-@app.on_event("startup")
-async def startup_event():
-    await BrowserManager.init()
+# 瀏覽器不在啟動時開啟：handler 第一次需要時由 BrowserManager 在 BrowserLoop 上啟動，閒置後自動關閉
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    await BrowserManager.close()
+    browser_manager = sys.modules.get("handlers.browser_manager")
+    if browser_manager is not None:
+        await asyncio.wrap_future(BrowserLoop.submit(browser_manager.BrowserManager.close()))
+    BrowserLoop.stop()
 
 app.add_middleware(
     CORSMiddleware,
@@ -62,7 +103,7 @@ app.mount("/hls", StaticFiles(directory=HLS_DIR), name="hls")
 app.mount("/thumbnails", StaticFiles(directory=THUMBNAILS_DIR), name="thumbnails")
 
 
-lock = threading.Lock()
+lock = FileLock(os.path.join(DATA_DIR, "tasks.lock"))
 
 class Task(BaseModel):
     id: Optional[str] = None
@@ -74,6 +115,16 @@ class Task(BaseModel):
     hls_enable: Optional[bool] = False
     default_conversion_quality: Optional[str] = "high"
     tool: Literal["streamlink", "custom"] = "streamlink"
+    # 保留規則（皆為選填）：保留最後 N 集、最長保留天數、任務配額（GB）
+    keep_last: Optional[int] = None
+    max_age_days: Optional[float] = None
+    max_gb: Optional[float] = None
+    # 分段錄影（選填）：每 N 分鐘或 N GB 在關鍵幀切段，錄影中就逐段轉檔，結束後合併
+    segment_minutes: Optional[int] = None
+    segment_gb: Optional[float] = None
+    # 邊錄邊轉 HEVC（選填）：錄影結束幾秒後就有 mp4；raw_keep_hours > 0 時另存原始 TS 作為備份，保留 N 小時
+    live_transcode: Optional[bool] = False
+    raw_keep_hours: Optional[float] = None
 
 def get_tasks():
     if not os.path.exists(TASKS_FILE):
@@ -85,17 +136,24 @@ def save_tasks(tasks):
     with open(TASKS_FILE, "w") as f:
         json.dump(tasks, f, ensure_ascii=False, indent=2)
 
+def task_save_path(t):
+    return os.path.join(RECORDINGS_DIR, t["save_dir"].strip("/"))
+
 def get_logfile(task_id):
     return os.path.join(LOG_DIR, f"{task_id}.log")
 
-def write_log(task_id, event, msg=""):
+def write_log(task_id, event, msg="", **fields):
+    # fields：額外的結構化欄位（例如 timing 的 spans），前端只顯示 event / msg
     logfile = get_logfile(task_id)
+    now = datetime.now().isoformat()
     with open(logfile, "a") as f:
         f.write(json.dumps({
-            "time": datetime.now().isoformat(),
+            "time": now,
             "event": event,
-            "msg": msg
+            "msg": msg,
+            **fields
         }, ensure_ascii=False) + "\n")
+    dashboard.note_event(task_id, event, msg, now)
 
 def read_logs(task_id, limit=20):
     """
@@ -161,25 +219,6 @@ def read_logs(task_id, limit=20):
 def write_compression_log(message):
     print(message)
 
-def get_total_frames(ts_file):
-    """
-    用 ffprobe 获取视频总帧数，用于进度计算
-    """
-    cmd = [
-        "ffprobe", "-v", "error",
-        "-count_frames",
-        "-select_streams", "v:0",
-        "-show_entries", "stream=nb_read_frames",
-        "-of", "default=noprint_wrappers=1:nokey=1",
-        ts_file
-    ]
-    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    try:
-        return int(result.stdout.strip())
-    except:
-        return None
-
-
 # 添加在 ts_to_mp4 函数中，修改函数签名和内容
 def ts_to_mp4(ts_file, quality="high", task_id=None, task_key_override=None):
     import re  # 確保 re 模塊已導入
@@ -202,24 +241,27 @@ def ts_to_mp4(ts_file, quality="high", task_id=None, task_key_override=None):
     crf_map = {"extreme": 36, "high": 32, "medium": 28, "low": 24}
     crf = crf_map.get(quality, 32)
 
+    # 先探測來源：已是高效率編碼、只有音訊或重新編碼省不了多少時，直接 stream copy
+    decision = conversion_policy.decide(ts_file, quality)
+    conversion_tasks[task_key].update({
+        "path": decision["action"],
+        "reason": decision["reason"],
+        "expected_saving": decision["expected_saving"]
+    })
+    print(f"轉檔方式: {decision['action']}（{decision['reason']}）")
+
     # 关键：使用 -stats 参数让 ffmpeg 输出详细的进度信息
-    cmd = [
-        "ffmpeg",
-        "-hide_banner",
-        "-y",
-        "-stats",  # 使用 -stats 而不是 -progress
-        "-i", ts_file,
-        "-c:v", "libx265", "-crf", str(crf), "-preset", "medium",
-        "-c:a", "copy",
-        mp4_file
-    ]
+    cmd = conversion_policy.build_cmd(decision["action"], ts_file, mp4_file, crf)
     
+    # 時長優先用 media_info（TS 以頭尾 PTS 計算，比 ffmpeg 印出的估算值準）
+    known_duration = (media_info.get_info(ts_file) or {}).get("duration")
+
     # 使用線程來讀取進程輸出，確保實時更新進度
     def read_output(proc):
         # 用於跟踪進度的變量
         total_duration_seconds = None
         start_time_seconds = 0  # 默認為0，如果解析到start則更新
-        actual_total_duration_seconds = None
+        actual_total_duration_seconds = known_duration
 
         # 從 stderr 讀取，因為 ffmpeg 的進度信息輸出到 stderr
         for line in iter(proc.stderr.readline, ''):
@@ -244,7 +286,7 @@ def ts_to_mp4(ts_file, quality="high", task_id=None, task_key_override=None):
                 start_time_seconds = float(start_match.group(1))
                 print(f"解析到 start: {start_time_seconds}s")
             
-            if total_duration_seconds is not None:
+            if total_duration_seconds is not None and not known_duration:
                 actual_total_duration_seconds = total_duration_seconds - start_time_seconds
                 if actual_total_duration_seconds <= 0: # 防止 start 比 duration 大或相等的情況
                     print(f"警告: 計算出的實際總時長 <= 0 ({actual_total_duration_seconds}s), 將使用原始Duration進行計算。")
@@ -268,32 +310,52 @@ def ts_to_mp4(ts_file, quality="high", task_id=None, task_key_override=None):
                 conversion_tasks[task_key]["progress"] = progress
                 print(f"轉碼進度 (基於時間): {progress:.2f}% (當前時間: {current_time_seconds}s / 實際總長: {actual_total_duration_seconds}s)")
     
-    # 使用 stderr=subprocess.PIPE 來捕獲 ffmpeg 的進度輸出
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1, universal_newlines=True)
-    
-    # 啟動讀取線程
-    output_thread = threading.Thread(target=read_output, args=(proc,), daemon=True)
-    output_thread.start()
-    
-    # 等待進程完成
-    proc.wait()
-    output_thread.join(timeout=1)  # 給讀取線程最多1秒鐘完成
+    def on_chunk_progress(progress, chunks):
+        conversion_tasks[task_key]["progress"] = progress
+        conversion_tasks[task_key]["chunks"] = chunks
+
+    returncode = None
+    # 長錄影：在關鍵幀切塊後多個 x265 平行編碼，失敗時退回單一 ffmpeg
+    if decision["action"] == "encode" and chunked_encoder.should_use(ts_file):
+        conversion_tasks[task_key]["path"] = "encode_chunked"
+        if chunked_encoder.encode(ts_file, mp4_file, crf, on_progress=on_chunk_progress):
+            returncode = 0
+        else:
+            conversion_tasks[task_key].update({"path": "encode", "progress": 0})
+            conversion_tasks[task_key].pop("chunks", None)
+
+    if returncode is None:
+        # 使用 stderr=subprocess.PIPE 來捕獲 ffmpeg 的進度輸出
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1, universal_newlines=True)
+
+        # 啟動讀取線程
+        output_thread = threading.Thread(target=read_output, args=(proc,), daemon=True)
+        output_thread.start()
+
+        # 等待進程完成
+        proc.wait()
+        output_thread.join(timeout=1)  # 給讀取線程最多1秒鐘完成
+        returncode = proc.returncode
 
     # 转码完成／失败后收尾
-    if proc.returncode == 0 and os.path.exists(mp4_file):
-        original_size = os.path.getsize(ts_file) / (1024*1024)
-        new_size = os.path.getsize(mp4_file) / (1024*1024)
+    if returncode == 0 and os.path.exists(mp4_file):
+        original_bytes = os.path.getsize(ts_file)
+        new_bytes = os.path.getsize(mp4_file)
+        original_size = original_bytes / (1024*1024)
+        new_size = new_bytes / (1024*1024)
         conversion_tasks[task_key].update({
             "status": "completed",
             "progress": 100,
             "end_time": time.time(),
             "original_size": original_size,
-            "new_size": new_size
+            "new_size": new_size,
+            "saved_bytes": original_bytes - new_bytes
         })
         print(f"轉碼完成: {ts_file} -> {mp4_file}")
         print(f"文件大小: {original_size:.2f}MB -> {new_size:.2f}MB")
         try: os.remove(ts_file)
         except: pass
+        dashboard.refresh(os.path.dirname(ts_file))
         return mp4_file
     else:
         conversion_tasks[task_key].update({
@@ -301,6 +363,7 @@ def ts_to_mp4(ts_file, quality="high", task_id=None, task_key_override=None):
             "end_time": time.time()
         })
         print(f"轉碼失敗: {ts_file}")
+        dashboard.refresh(os.path.dirname(ts_file))
         return None
 
 # 添加新的 API 端点，用于手动触发转码（约在第 600 行后）
@@ -321,23 +384,110 @@ def convert_recording(task_id: str, filename: str, quality: str = "high"):
     if task_key in conversion_tasks and conversion_tasks[task_key]["status"] == "processing":
         return {"status": "already_processing", "task_key": task_key}
 
-    # 直接把 ts_to_mp4 当作 target，file_path 就是上面定义的那个变量
-    thread = threading.Thread(
-        target=ts_to_mp4,
-        args=(file_path, quality, task_id),
-        daemon=True
+    task_key = f"{task_id}_{os.path.basename(file_path)}"
+    job_id = enqueue_transcode(file_path, quality, task_id)
+    if job_id is None:
+        return {"status": "already_processing", "task_key": task_key}
+    return {"status": "queued", "task_key": task_key, "job_id": job_id}
+
+
+def enqueue_transcode(file_path, quality, task_id):
+    """
+    轉檔排入工作表：單機模式由排程 leader 的本機 runner 執行，分散模式由任一個 worker 執行（輸出寫回共用的 /recordings）。
+    同一個檔案同時只會有一個排隊中或轉檔中的工作，已存在時回傳 None。
+    """
+    task_key = f"{task_id}_{os.path.basename(file_path)}"
+    job_id = get_store().enqueue(
+        "transcode",
+        {"file": file_path, "quality": quality, "task_id": task_id, "task_key": task_key},
+        dedupe_key=f"transcode:{file_path}"
     )
-    thread.start()
+    if job_id and RUN_MODE == "all":
+        conversion_tasks[task_key] = {"status": "queued", "progress": 0, "quality": quality, "queued_time": time.time()}
+    return job_id
+
+
+def run_transcode_job(job):
+    p = job["payload"]
+    output = ts_to_mp4(p["file"], p["quality"], p["task_id"], p["task_key"])
+    if not output:
+        raise JobFailed("轉檔失敗")
+    return {"output": output, **(conversion_tasks.get(p["task_key"]) or {})}
 
-    return {"status": "started", "task_key": task_key}
+
+def transcode_progress(job):
+    return conversion_tasks.get(job["payload"]["task_key"])
+
+
+def evict_finished_conversions():
+    """已結束超過 CONVERSION_STATUS_TTL 的轉檔狀態從共用 map 移除（結果仍保留在工作表）"""
+    cutoff = time.time() - CONVERSION_STATUS_TTL
+    for key, info in conversion_tasks.snapshot().items():
+        finished = info.get("end_time") or info.get("start_time") or 0
+        if info.get("status") in ("completed", "failed", "interrupted") and finished < cutoff:
+            conversion_tasks.pop(key, None)
+
+
+def reconcile_conversions():
+    """
+    開機後整理上次中斷的轉檔：
+    - 狀態停在 processing / queued 但已沒有對應工作的項目標記為 interrupted
+    - 各任務目錄中沒轉完的 TS 重新排入轉檔（見 recovery.scan）
+    """
+    store = get_store()
+    active = store.active(kind="transcode")
+    active_keys = {j["payload"]["task_key"] for j in active}
+    for key, info in conversion_tasks.snapshot().items():
+        if info.get("status") in ("processing", "queued") and key not in active_keys:
+            conversion_tasks[key] = {**info, "status": "interrupted", "end_time": time.time()}
+
+    # 重試次數用完仍失敗的檔案不再自動排入，留給使用者手動處理
+    gave_up = store.list_jobs(kind="transcode", statuses=("failed",), limit=1000)
+    skip = _protected_files() | {os.path.abspath(j["payload"]["file"]) for j in active + gave_up}
+    requeued = 0
+    for t in get_tasks():
+        save_path = os.path.join(RECORDINGS_DIR, t["save_dir"].strip("/"))
+        for ts_path in recovery.scan(save_path, skip, write_log, t["id"]):
+            if enqueue_transcode(ts_path, t.get("default_conversion_quality") or "high", t["id"]):
+                write_log(t["id"], "recovered", f"重新排入轉檔: {os.path.basename(ts_path)}")
+                requeued += 1
+    if requeued:
+        print(f"[Recovery] 重新排入 {requeued} 個未完成的轉檔")
 
 
 # 添加 API 端点，用于获取转码进度
 @app.get("/conversion_status")
-def get_conversion_status(task_key: str = None):
-    if task_key:
-        return {task_key: conversion_tasks.get(task_key, {"status": "not_found"})}
-    return conversion_tasks
+def get_conversion_status(request: Request, task_key: str = None):
+    def build():
+        statuses = _conversion_statuses()
+        if task_key:
+            return {task_key: statuses.get(task_key, {"status": "not_found"})}
+        return statuses
+    return http_cache.cached_json(request, ("conversions", _conversion_version(), task_key), build)
+
+
+def _conversion_statuses():
+    statuses = conversion_tasks.snapshot()
+    if RUN_MODE != "all":
+        statuses.update(_job_conversion_statuses())
+    return statuses
+
+
+def _conversion_version():
+    return conversion_tasks.version, get_store().version("transcode") if RUN_MODE != "all" else None
+
+
+def _job_conversion_statuses():
+    """分散模式下 worker 回報在工作表中的轉檔進度"""
+    status_map = {"queued": "queued", "leased": "processing", "done": "completed", "failed": "failed"}
+    result = {}
+    for job in reversed(get_store().list_jobs(kind="transcode", limit=200)):
+        info = dict(job.get("result") or job.get("progress") or {})
+        info.pop("output", None)
+        info["status"] = status_map.get(job["status"], job["status"])
+        info["worker"] = job["worker"]
+        result[job["payload"]["task_key"]] = info
+    return result
 
 
 # 定期生成縮圖的函數
@@ -409,17 +559,148 @@ from datetime import datetime
 import subprocess
 import multiprocessing
 
+def pump_stdout(proc, segmenter, on_event=None):
+    """把 streamlink stdout 交給 segmenter 直到串流結束，回傳 (returncode, stderr 最後幾行)"""
+    # stderr 另開線程讀進有界緩衝，避免 pipe 塞滿卡住 streamlink；重要事件即時交給 on_event
+    capture = OutputCapture(proc, on_event, streams=("stderr",), name="streamlink")
+    try:
+        segmenter.run(proc.stdout)
+    except Exception as e:
+        # 輸出端壞掉（例如 ffmpeg 意外結束）就停止 streamlink，保留已寫入的部分
+        print(f"[ERROR] 處理 streamlink 輸出失敗: {e}")
+        proc.terminate()
+    returncode = capture.wait()
+    return returncode, capture.text("stderr")
+
+
+def record_live_transcoded(task, proc, out_file):
+    """
+    邊錄邊轉：TS 直接送進 ffmpeg libx265（見 live_transcoder.py），串流結束後只需等編碼器收尾並合併各段。
+    轉檔失敗時若有原始 TS 備份就回傳它，交給一般的 ts_to_mp4 流程。
+    回傳 (returncode, stderr 訊息, 最終檔案或 None, 錄到的位元組數)。
+    """
+    base, _ = os.path.splitext(out_file)
+    keep_raw = bool(task.raw_keep_hours and task.raw_keep_hours > 0)
+    # 原始 TS 備份一律用自己的檔名：out_file 可能本來就是 .mp4（例如巴哈），和最終檔同名時會被合併結果覆蓋，
+    # 之後又被當成備份過期刪除
+    raw_file = base + ".raw.ts" if keep_raw else None
+    transcoder = LiveTranscoder(base, task.default_conversion_quality or "high", raw_file)
+    active_segmenters[task.id] = transcoder
+    try:
+        returncode, std_err_msg = pump_stdout(proc, transcoder, _log_event(task.id))
+        if not transcoder.segments:
+            return returncode, std_err_msg, None, 0
+
+        parts = transcoder.finish()
+        if not parts:
+            if keep_raw and os.path.exists(raw_file):
+                # 備份改回 <base>.ts 再交給一般轉檔，輸出才會是 <base>.mp4 而不是 <base>.raw.mp4；
+                # 它已不是備份，從 manifest 移除，避免之後被當成過期備份刪掉
+                ts_file = base + ".ts"
+                os.replace(raw_file, ts_file)
+                transcoder.raw_file = None
+                transcoder._save_manifest()
+                write_log(task.id, "error", "即時轉檔失敗，改用原始 TS 進行一般轉檔")
+                return returncode, std_err_msg, ts_file, transcoder.total_bytes
+            write_log(task.id, "error", "即時轉檔失敗，保留已完成的分段")
+            return returncode, std_err_msg, None, transcoder.total_bytes
+
+        final_file = base + ".mp4"
+        if len(parts) == 1:
+            os.replace(parts[0], final_file)
+        elif stitch(parts, final_file):
+            for p in parts:
+                os.remove(p)
+        else:
+            write_log(task.id, "error", f"合併 {len(parts)} 段即時轉檔輸出失敗，保留分段檔案")
+            return returncode, std_err_msg, None, transcoder.total_bytes
+        transcoder.mark_stitched(final_file)
+        if keep_raw:
+            transcoder.keep_raw_until(time.time() + task.raw_keep_hours * 3600)
+        write_log(task.id, "live_transcoded", f"{final_file}（{len(parts)} 段，preset 最後為 {transcoder._sinks[-1].preset}）")
+        return returncode, std_err_msg, final_file, transcoder.total_bytes
+    finally:
+        active_segmenters.pop(task.id, None)
+
+
+def record_segmented(task, proc, out_file):
+    """
+    分段錄影：從 streamlink stdout 讀取 TS，依 segment_minutes / segment_gb 在關鍵幀切段，
+    每個分段關閉後立刻生成縮圖並轉檔，錄影結束後以 stream copy 把轉好的分段合併成單一 mp4。
+    回傳 (returncode, stderr 訊息, 合併後的檔案或 None, 錄到的位元組數)。
+    """
+    base, _ = os.path.splitext(out_file)
+    quality = task.default_conversion_quality or "high"
+
+    def _process(path):
+        generate_thumbnail(path)
+        return ts_to_mp4(path, quality, task.id)
+
+    def _on_done(path, output):
+        name = os.path.basename(path)
+        segmenter.update_segment(
+            name,
+            status="converted" if output else "failed",
+            output=os.path.basename(output) if output else None
+        )
+        write_log(task.id, "segment_processed", f"{name} -> {output or '轉檔失敗'}")
+
+    def _on_closed(path):
+        write_log(task.id, "segment", f"分段完成: {os.path.basename(path)}")
+        pipeline.submit(path)
+
+    pipeline = SegmentPipeline(_process, _on_done)
+    segmenter = TsSegmenter(
+        base,
+        max_seconds=task.segment_minutes * 60 if task.segment_minutes else None,
+        max_bytes=int(task.segment_gb * GB) if task.segment_gb else None,
+        on_segment_closed=_on_closed
+    )
+    active_segmenters[task.id] = segmenter
+
+    try:
+        returncode, std_err_msg = pump_stdout(proc, segmenter, _log_event(task.id))
+        results = pipeline.finish()
+        seg_paths = [os.path.join(os.path.dirname(base), seg["file"]) for seg in segmenter.segments]
+        if not seg_paths:
+            return returncode, std_err_msg, None, 0
+
+        outputs = [results.get(p) for p in seg_paths]
+        if not all(outputs):
+            # 有分段轉檔失敗：保留各分段（已轉好的 mp4 與失敗的 ts），不合併
+            write_log(task.id, "error", f"部分分段轉檔失敗，保留 {len(seg_paths)} 個分段未合併")
+            return returncode, std_err_msg, None, segmenter.total_bytes
+
+        final_file = base + ".mp4"
+        if len(outputs) == 1:
+            os.replace(outputs[0], final_file)
+        elif stitch(outputs, final_file):
+            for p in outputs:
+                os.remove(p)
+        else:
+            write_log(task.id, "error", f"合併 {len(outputs)} 個分段失敗，保留分段檔案")
+            return returncode, std_err_msg, None, segmenter.total_bytes
+        for p in seg_paths:
+            shutil.rmtree(os.path.join(THUMBNAILS_DIR, os.path.splitext(os.path.basename(p))[0]), ignore_errors=True)
+        segmenter.mark_stitched(final_file)
+        write_log(task.id, "stitched", f"{len(outputs)} 個分段已合併為 {final_file}")
+        return returncode, std_err_msg, final_file, segmenter.total_bytes
+    finally:
+        active_segmenters.pop(task.id, None)
+
+
 def record_stream(task):
     """
     兼容 subprocess.Popen 與 multiprocessing.Process 的錄影流程，
-    並在錄影成功後寫入 recorded.json。對於 multiprocessing.Process，
+    並在錄影成功後寫入 save_dir 的 recorded.jsonl（見 ledger.py）。對於 multiprocessing.Process，
     成功判斷改為只要 out_file 存在即可，不以 returncode 作唯一準則。
     """
 
     # ——— 1. Helper: 統一處理 Popen 和 Process ———
     def handle_proc(proc):
         """
-        如果 proc 是 subprocess.Popen，就用 .communicate() 取得 stdout/stderr 和 returncode；
+        如果 proc 是 subprocess.Popen，就以 OutputCapture 逐行讀取 stdout/stderr（只保留最後幾行，
+        錯誤 / 重連等事件即時寫入 task log），結束後取得 returncode 與輸出的最後幾行；
         如果 proc 是 multiprocessing.Process，就用 .join() 等待結束，再用 .exitcode 作 returncode，
         但不以 returncode 判斷是否成功，stdout/stderr 均設為空字串。
         回傳 (is_process, returncode, std_out_msg, std_err_msg)。
@@ -433,19 +714,12 @@ def record_stream(task):
         # 判斷如果是 Popen 或有 communicate 屬性，就當成 subprocess.Popen
         if isinstance(proc, subprocess.Popen) or hasattr(proc, "communicate"):
             try:
-                stdout, stderr = proc.communicate()
-                returncode = proc.returncode
-                if isinstance(stdout, (bytes, bytearray)):
-                    std_out_msg = stdout.decode("utf-8", errors="ignore").strip()
-                elif stdout is not None:
-                    std_out_msg = str(stdout).strip()
-                if isinstance(stderr, (bytes, bytearray)):
-                    std_err_msg = stderr.decode("utf-8", errors="ignore").strip()
-                elif stderr is not None:
-                    std_err_msg = str(stderr).strip()
+                returncode = capture.wait()
+                std_out_msg = capture.text("stdout")
+                std_err_msg = capture.text("stderr")
             except Exception as e:
                 returncode = getattr(proc, "returncode", None)
-                std_err_msg = f"communicate() 例外: {e}"
+                std_err_msg = f"wait() 例外: {e}"
         else:
             # multiprocessing.Process
             is_process = True
@@ -463,48 +737,91 @@ def record_stream(task):
     save_path = os.path.join(RECORDINGS_DIR, task.save_dir.strip("/"))
     os.makedirs(save_path, exist_ok=True)
 
-    handler = get_handler(task)
-    urls = handler.parse_urls(task.url)
+    # 各階段計時（見 spans.py）：結束時寫入 task log 的 timing 事件並併入 handler 的百分位統計
+    trace = spans.RunTrace(task.id)
+    with trace.span("get_handler"):
+        handler = get_handler(task)
+    trace.handler = type(handler).__name__
+    with trace.span("parse_urls"):
+        urls = handler.parse_urls(task.url)
     if not urls:
         urls = [task.url]
 
-    meta_file = os.path.join(save_path, "recorded.json")
-    recorded = set()
-    if os.path.exists(meta_file):
-        try:
-            recorded = set(json.load(open(meta_file, 'r', encoding='utf-8')))
-        except Exception:
-            recorded = set()
-
-    u = handler.get_new_url(urls, recorded)
-    filename = handler.get_filename(u, task)
+    with trace.span("read_ledger"):
+        ledger = get_ledger(save_path)
+        recorded = ledger.urls()
+    with trace.span("get_new_url"):
+        u = handler.get_new_url(urls, recorded)
+    with trace.span("get_filename"):
+        filename = handler.get_filename(u, task)
     out_file = os.path.join(save_path, filename)
+    recording_outputs[task.id] = out_file
+    record_started = time.time()
 
     proc = None
+    capture = None
     conversion_triggered = False
     thumbnail_thread = None
     stop_flag = threading.Event()
+    refused = threading.Event()
 
     try:
         # ——— 啟動錄影進程 ———
-        proc = handler.start_recording(handler.get_final_url(u), task, out_file)
+        segmented = bool(task.segment_minutes or task.segment_gb)
+        piped = segmented or bool(task.live_transcode)
+        with trace.span("get_final_url"):
+            final_url = handler.get_final_url(u)
+        with trace.span("start_recording"):
+            proc = handler.start_recording(final_url, task, out_file, to_stdout=piped)
+        if isinstance(proc, subprocess.Popen) and not getattr(proc, "to_stdout", False):
+            # 寫檔模式：streamlink 的 log 在 stdout / stderr，立刻開始讀，避免 pipe 塞滿
+            capture = OutputCapture(proc, _log_event(task.id), name="streamlink")
+        written = lambda: active_segmenters[task.id].total_bytes if piped else os.path.getsize(out_file)
+        # 從 record_stream 開始到輸出（檔案或分段）第一次有資料
+        spans.watch_first_byte(trace, written, stop_flag, since=trace.started)
+        # 空間檢查在確定有開播（輸出出現資料）後才做：沒開播的輪詢不會觸發清理，也不會寫 no_space
+        _admit_when_live(task, proc, written, stop_flag, refused, trace)
         active_recordings[task.id] = proc
+        live_recordings[task.id] = {"out_file": out_file, "started": record_started, "host": HOSTNAME, "pid": os.getpid()}
 
-        # 啟動縮圖線程
-        thumbnail_thread = threading.Thread(
-            target=generate_thumbnails_periodically,
-            args=(out_file, task.id, stop_flag),
-            daemon=True
-        )
-        thumbnail_thread.start()
-
-        # 等待並取得子進程回傳資訊
-        is_process, returncode, std_out_msg, std_err_msg = handle_proc(proc)
+        final_file = None
+        if getattr(proc, "to_stdout", False):
+            if task.live_transcode:
+                # 邊錄邊轉：串流結束後只需等編碼器收尾
+                returncode, std_err_msg, final_file, recorded_bytes = record_live_transcoded(task, proc, out_file)
+            else:
+                # 分段錄影：縮圖與轉檔在每個分段關閉時就進行，最後得到合併好的 mp4
+                returncode, std_err_msg, final_file, recorded_bytes = record_segmented(task, proc, out_file)
+            is_process, std_out_msg = False, ""
+            if final_file:
+                out_file = final_file
+                filename = os.path.basename(final_file)
+        else:
+            recorded_bytes = None
+            # 啟動縮圖線程
+            thumbnail_thread = threading.Thread(
+                target=generate_thumbnails_periodically,
+                args=(out_file, task.id, stop_flag),
+                daemon=True
+            )
+            thumbnail_thread.start()
+
+            # 等待並取得子進程回傳資訊
+            is_process, returncode, std_out_msg, std_err_msg = handle_proc(proc)
+
+        if refused.is_set():
+            # 空間不足而中止：丟掉剛錄到的片段、不寫入 ledger，下次輪詢再試
+            if os.path.exists(out_file):
+                os.remove(out_file)
+            return
 
         # 對 subprocess.Popen：以 returncode == 0 判斷成功
         # 對 multiprocessing.Process：只要檔案存在就算成功
+        # 分段錄影 / 邊錄邊轉：中止錄影時 streamlink 不會回傳 0，只要有產生最終檔案就算成功
         succeeded = False
-        if is_process:
+        if getattr(proc, "to_stdout", False):
+            succeeded = final_file is not None and os.path.exists(out_file)
+        elif is_process:
             if os.path.exists(out_file):
                 succeeded = True
             else:
@@ -519,13 +836,17 @@ def record_stream(task):
             write_log(task.id, "end", f"SUCCESS: {out_file}")
             if os.path.exists(out_file):
                 print("[DEBUG] 0001: out_file 已存在")
-                recorded.add(u)
                 try:
-                    with open(meta_file, 'w', encoding='utf-8') as mf:
-                        json.dump(list(recorded), mf, ensure_ascii=False, indent=2)
-                    print("[DEBUG] 已將 recorded.json 寫入")
+                    retention.record_bitrate(task.id, recorded_bytes or os.path.getsize(out_file), time.time() - record_started)
                 except Exception as e:
-                    print(f"[ERROR] 寫入 recorded.json 失敗: {e}")
+                    print(f"[ERROR] 記錄 bitrate 失敗: {e}")
+                try:
+                    if ledger.add(u, task.id, filename):
+                        print("[DEBUG] 已寫入 recorded.jsonl")
+                    else:
+                        print(f"[DEBUG] {u} 已由其他任務記錄")
+                except Exception as e:
+                    print(f"[ERROR] 寫入 recorded.jsonl 失敗: {e}")
 
                 # 生成最終縮圖
                 try:
@@ -547,7 +868,9 @@ def record_stream(task):
             reason = std_err_msg or std_out_msg or "Unknown"
             main_line = reason.splitlines()[0] if reason else "Unknown"
             if "No playable streams found" in reason or "No streams found" in reason:
-                write_log(task.id, "no_stream", f"No live stream: {main_line}")
+                # 輸出擷取已即時寫入 no_stream 的就不重複
+                if not (capture and capture.seen("no_stream")):
+                    write_log(task.id, "no_stream", f"No live stream: {main_line}")
             else:
                 write_log(task.id, "error", f"ERROR: {main_line}")
     except Exception as e:
@@ -556,7 +879,10 @@ def record_stream(task):
     finally:
         # 清理
         active_recordings.pop(task.id, None)
+        live_recordings.pop(task.id, None)
+        recording_outputs.pop(task.id, None)
         stop_flag.set()
+        _finish_trace(trace)
         if thumbnail_thread and thumbnail_thread.is_alive():
             pass
 
@@ -576,27 +902,103 @@ def record_stream(task):
                 except Exception as e:
                     print(f"[ERROR] finally convert_recording 失敗: {e}")
 
+        dashboard.refresh(save_path)
         print("[DEBUG] record_stream() 完成。")
 
 
 
-def add_job(task: Task):
+def _admit_when_live(task, proc, written, stop, refused, trace):
+    """
+    輸出第一次出現資料時依這個頻道過去的 bitrate 預估需要的空間（見 retention.admit），
+    不足時先依保留規則清理，仍不足就設定 refused、寫入 no_space 並中止錄影。
+    """
+    def _check():
+        while not stop.is_set():
+            try:
+                if written() > 0:
+                    break
+            except Exception:
+                pass
+            stop.wait(ADMIT_POLL_SECONDS)
+        else:
+            return
+        start = time.time()
+        try:
+            admitted, detail = retention.admit(
+                task.dict(), get_tasks(), RECORDINGS_DIR, _protected_files(), THUMBNAILS_DIR, write_log
+            )
+        except Exception as e:
+            print(f"[ERROR] 空間檢查失敗: {e}")
+            return
+        trace.add("admit", start, time.time())
+        if not admitted:
+            refused.set()
+            write_log(task.id, "no_space", detail)
+            proc.terminate()
+
+    threading.Thread(target=_check, name=f"Admit-{task.id}", daemon=True).start()
+
+
+def _log_event(task_id):
+    """OutputCapture 的 on_event：子程序輸出中的錯誤 / 重連等事件寫入 task log"""
+    return lambda event, line: write_log(task_id, event, line)
+
+
+def _finish_trace(trace):
+    # 各階段耗時一律併入 /stats；只有真的錄到資料的那次才寫進 task log，離線輪詢不留紀錄
+    try:
+        spans.record(trace)
+        if trace.get("first_byte"):
+            write_log(trace.task_id, "timing", trace.summary(), spans=trace.to_dict())
+    except Exception as e:
+        print(f"[ERROR] 寫入階段計時失敗: {e}")
+
+def _protected_files():
+    paths = list(recording_outputs.values())
+    paths += [r["out_file"] for r in live_recordings.snapshot().values()]
+    for segmenter in list(active_segmenters.values()):
+        folder = os.path.dirname(segmenter.base_path)
+        for seg in list(segmenter.segments):
+            paths.append(os.path.join(folder, seg["file"]))
+            if seg.get("output"):
+                paths.append(os.path.join(folder, seg["output"]))
+            paths.append(os.path.join(folder, os.path.splitext(seg["file"])[0] + ".mp4"))
+    return {os.path.abspath(p) for p in paths}
+
+def sweep_recordings():
+    tasks = get_tasks()
+    for t in tasks:
+        expire_raw_copies(os.path.join(RECORDINGS_DIR, t["save_dir"].strip("/")), write_log, t["id"])
+    retention.sweep(tasks, RECORDINGS_DIR, _protected_files(), THUMBNAILS_DIR, write_log)
+    # 順便校正 /dashboard 的統計（開機時與每次清理後），涵蓋其他程序或手動對目錄做的變更
+    dashboard.reconcile(task_save_path(t) for t in tasks)
+
+def enqueue_recording(task: Task):
+    # 同一個任務同時只會有一個排隊中或錄影中的工作
+    job_id = get_store().enqueue("record", {"task": task.dict()}, dedupe_key=f"record:{task.id}")
+    if job_id:
+        print(f"[DEBUG] 已排入錄影工作 {task.name}: {job_id}")
+
+def add_job(task: Task, delay: float = 0):
     stop_hls_stream(task.id)  # 保險先停
     try:
         scheduler.remove_job(task.id)
     except Exception:
         pass
     scheduler.add_job(
-        record_stream,
+        record_stream if RUN_MODE == "all" else enqueue_recording,
         trigger=IntervalTrigger(minutes=task.interval),
         args=[task],
         id=task.id,
         replace_existing=True,
-        next_run_time=datetime.now()
+        next_run_time=datetime.now() + timedelta(seconds=delay)
     )
-    if getattr(task, "hls_enable", False):
+    if getattr(task, "hls_enable", False) and RUN_MODE == "all":
         start_hls_stream(task)
     else:
+        # 分散模式的 API 節點只排程與服務 HTTP，不在本機跑 streamlink + ffmpeg；HLS 預覽只在單機模式提供
+        if getattr(task, "hls_enable", False):
+            print(f"[HLS] RUN_MODE={RUN_MODE}：略過任務 {task.name} 的 HLS 預覽")
         stop_hls_stream(task.id)
 
 
@@ -642,15 +1044,20 @@ def start_hls_stream(task: Task):
         os.path.join(task_hls_dir, "stream.m3u8")
     ]
     write_log(task.id, "hls_start", f"CMD: {' '.join(streamlink_cmd)} | {' '.join(ffmpeg_cmd)}")
-    streamlink_proc = subprocess.Popen(streamlink_cmd, stdout=subprocess.PIPE)
+    streamlink_proc = subprocess.Popen(streamlink_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     ffmpeg_proc = subprocess.Popen(ffmpeg_cmd, stdin=streamlink_proc.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    streamlink_proc.stdout.close()   # 只留 ffmpeg 持有讀取端，ffmpeg 結束時 streamlink 會收到 SIGPIPE
     hls_processes[task.id] = (streamlink_proc, ffmpeg_proc)
+    # 兩個程序的輸出都只保留最後幾行；事件加上 hls_ 前綴寫入 task log
+    on_event = lambda event, line: write_log(task.id, f"hls_{event}", line)
+    OutputCapture(streamlink_proc, on_event, streams=("stderr",), name="hls-streamlink")
+    ffmpeg_capture = OutputCapture(ffmpeg_proc, on_event, name="hls-ffmpeg")
 
     def monitor_ffmpeg():
-        stdout, stderr = ffmpeg_proc.communicate()
-        std_out_msg = stdout.decode("utf-8", errors="ignore") if stdout else ""
-        std_err_msg = stderr.decode("utf-8", errors="ignore") if stderr else ""
-        if ffmpeg_proc.returncode == 0:
+        returncode = ffmpeg_capture.wait()
+        std_out_msg = ffmpeg_capture.text("stdout")
+        std_err_msg = ffmpeg_capture.text("stderr")
+        if returncode == 0:
             write_log(task.id, "hls_end", "ffmpeg exited normally")
         else:
             write_log(task.id, "hls_error", f"ffmpeg exited: {std_err_msg or std_out_msg}")
@@ -693,9 +1100,13 @@ def generate_thumbnail(video_path, interval: int = 60, size: int = 128):
     name, _ = os.path.splitext(basename)
     out_dir = os.path.join(THUMBNAILS_DIR, name)
     os.makedirs(out_dir, exist_ok=True)
+    # 關鍵幀間隔不大於 interval 時只解碼關鍵幀，不必解碼整部影片
+    info = media_info.get_info(video_path) or {}
+    gop = info.get("keyframe_interval")
+    skip = ["-skip_frame", "nokey"] if gop and gop <= interval else []
     # 构建 ffmpeg 命令：fps=1/interval 每秒取 1/interval 帧
     cmd = [
-        "ffmpeg", "-i", video_path,
+        "ffmpeg", *skip, "-i", video_path,
         "-vf", f"fps=1/{interval},scale={size}:-1:flags=lanczos",
         "-qscale:v", "2",
         os.path.join(out_dir, f"{name}_%03d.jpg")
@@ -710,15 +1121,88 @@ def generate_thumbnail(video_path, interval: int = 60, size: int = 128):
         return None
 
 
+_scheduled_tasks = {}  # leader：task_id -> 目前排程所依據的任務設定
+_sync_lock = threading.Lock()
+
+def sync_jobs(_version=None, stagger: float = 0):
+    """
+    leader 依 tasks.json 增減 / 更新排程與 HLS；任何程序修改任務後都會 bump "tasks" 版本觸發這裡。
+    stagger > 0 時（啟動時）第 i 個任務延後 i * stagger 秒才第一次錄影。
+    """
+    with _sync_lock:
+        tasks = {t["id"]: t for t in get_tasks()}
+        for task_id in list(_scheduled_tasks):
+            if task_id not in tasks:
+                remove_job(task_id)
+                _scheduled_tasks.pop(task_id)
+        added = 0
+        for task_id, t in tasks.items():
+            if _scheduled_tasks.get(task_id) != t:
+                add_job(Task(**t), delay=added * stagger)
+                _scheduled_tasks[task_id] = t
+                added += 1
+
+def _tasks_changed():
+    state_store.get_store().bump("tasks")
+    if election.is_leader:
+        sync_jobs()
+
+def _handle_stop_requests(_version=None):
+    for task_id in list(stop_requests):
+        stop_requests.pop(task_id, None)
+        if task_id in active_recordings:
+            stop_recording(task_id)
+
+def _clear_stale_recordings():
+    # 前一個 leader 結束時它的錄影也跟著結束了；其他節點 worker 的錄影不動
+    for task_id, rec in live_recordings.snapshot().items():
+        if rec.get("host") == HOSTNAME and not psutil.pid_exists(rec.get("pid") or 0):
+            live_recordings.pop(task_id, None)
+
+local_runner = JobRunner(
+    f"{HOSTNAME}-local", {"transcode": run_transcode_job}, CONVERSION_CONCURRENCY, progress=transcode_progress
+)
+
+def _start_scheduler():
+    _clear_stale_recordings()
+    stop_requests.clear()
+    scheduler.start()
+    # 先整理上次中斷的轉檔再開始錄影，啟動時各任務錯開
+    scheduler.add_job(reconcile_conversions, id="reconcile_conversions", next_run_time=datetime.now())
+    if RUN_MODE == "all":
+        # 仍 leased 的轉檔工作持有者就是上一次的自己，不等租約過期直接放回佇列；分塊編碼會沿用已完成的區塊
+        get_store().release(kind="transcode")
+        local_runner.start()
+    sync_jobs(stagger=STARTUP_STAGGER_SECONDS)
+    state_store.get_store().watch("tasks", sync_jobs)
+    stop_requests.watch(_handle_stop_requests)
+    # 定期壓縮各 save_dir 的 recorded.jsonl（移除重複與損毀的行）
+    scheduler.add_job(compact_all, trigger=IntervalTrigger(hours=24), id="ledger_compaction", replace_existing=True)
+    # 依各任務保留規則與全域配額清理舊錄影
+    scheduler.add_job(
+        sweep_recordings,
+        trigger=IntervalTrigger(minutes=retention.SWEEP_INTERVAL_MINUTES),
+        id="retention_sweep",
+        replace_existing=True,
+        next_run_time=datetime.now()
+    )
+    scheduler.add_job(evict_finished_conversions, trigger=IntervalTrigger(minutes=5), id="conversion_status_ttl", replace_existing=True)
+    if RUN_MODE == "api":
+        # worker 掛掉時租約會過期，定期把這些工作放回佇列；也清掉一週前已結束的工作紀錄
+        store = get_store()
+        scheduler.add_job(store.requeue_expired, trigger=IntervalTrigger(seconds=30), id="job_requeue", replace_existing=True)
+        scheduler.add_job(lambda: store.purge(7 * 86400), trigger=IntervalTrigger(hours=6), id="job_purge", replace_existing=True)
+
+election = SchedulerElection(on_elected=_start_scheduler)
+
 @app.on_event("startup")
 def startup_event():
-    tasks = get_tasks()
-    for t in tasks:
-        add_job(Task(**t))
+    election.start()
 
 @app.get("/tasks", response_model=List[Task])
-def list_tasks():
-    return get_tasks()
+def list_tasks(request: Request):
+    stamp = http_cache.file_stamp(TASKS_FILE)
+    return http_cache.cached_json(request, ("tasks", stamp), get_tasks, last_modified=stamp and stamp[0] / 1e9)
 
 @app.post("/tasks", response_model=Task)
 def create_task(task: Task):
@@ -728,7 +1212,7 @@ def create_task(task: Task):
             task.id = uuid4().hex
         tasks.append(task.dict())
         save_tasks(tasks)
-        add_job(task)
+    _tasks_changed()
     return task
 
 @app.put("/tasks/{task_id}", response_model=Task)
@@ -741,7 +1225,7 @@ def update_task(task_id: str, update: Task):
         update.id = task_id
         tasks[idx] = update.dict()
         save_tasks(tasks)
-        add_job(update)
+    _tasks_changed()
     return update
 
 @app.delete("/tasks/{task_id}")
@@ -750,29 +1234,45 @@ def delete_task(task_id: str):
         tasks = get_tasks()
         tasks = [t for t in tasks if t["id"] != task_id]
         save_tasks(tasks)
-        remove_job(task_id)
+    _tasks_changed()
     logfile = get_logfile(task_id)
     if os.path.exists(logfile):
         os.remove(logfile)
+    dashboard.forget(task_id)
     return {"ok": True}
 
 @app.get("/tasks/{task_id}/recordings")
-def list_recordings(task_id: str):
+def list_recordings(request: Request, task_id: str):
     tasks = get_tasks()
     t = next((x for x in tasks if x["id"] == task_id), None)
     if not t:
         raise HTTPException(404)
     save_dir = os.path.join(RECORDINGS_DIR, t["save_dir"].strip("/"))
+    # 只 stat 目錄內容就能判斷有沒有變；沒變就不必讀 media_info
+    stamp = http_cache.dir_stamp(save_dir)
+    last_modified = max((e[1] for e in stamp), default=None) if stamp else None
+    return http_cache.cached_json(request, ("recordings", save_dir, stamp), lambda: _recording_files(save_dir),
+                                  last_modified=last_modified and last_modified / 1e9)
+
+
+def _recording_files(save_dir):
     files = []
     if os.path.exists(save_dir):
+        paths = []
         for f in os.listdir(save_dir):
             p = os.path.join(save_dir, f)
-            if os.path.isfile(p):
-                files.append({
-                    "file": f,
-                    "size": os.path.getsize(p),
-                    "mtime": datetime.fromtimestamp(os.path.getmtime(p)).isoformat()
-                })
+            if os.path.isfile(p) and dashboard.is_recording_file(f):
+                paths.append(p)
+        # 錄影中 / 轉檔中的檔案每次輪詢大小都不同，media_info 的快取永遠不會命中，只回傳大小與時間
+        busy = {os.path.abspath(x) for x in _protected_files()}
+        infos = media_info.get_many([p for p in paths if os.path.abspath(p) not in busy])
+        for p in paths:
+            files.append({
+                "file": os.path.basename(p),
+                "size": os.path.getsize(p),
+                "mtime": datetime.fromtimestamp(os.path.getmtime(p)).isoformat(),
+                **media_info.summary(infos.get(p))
+            })
     files = sorted(files, key=lambda x: x["mtime"], reverse=True)
     return files
 
@@ -799,19 +1299,37 @@ def delete_recording(task_id: str, filename: str):
     file_path = os.path.join(save_dir, filename)
     if os.path.exists(file_path):
         os.remove(file_path)
+        dashboard.refresh(save_dir)
     return {"ok": True}
 
 @app.get("/tasks/{task_id}/logs")
-def get_task_logs(task_id: str):
-    return read_logs(task_id)
+def get_task_logs(request: Request, task_id: str):
+    # log 檔只會附加，(mtime, size) 沒變內容就沒變
+    stamp = http_cache.file_stamp(get_logfile(task_id))
+    return http_cache.cached_json(request, ("logs", task_id, stamp), lambda: read_logs(task_id),
+                                  last_modified=stamp and stamp[0] / 1e9)
 
 # ========== 新增: 停止錄影 API ==========
 @app.post("/tasks/{task_id}/stop", status_code=status.HTTP_200_OK)
 def stop_recording(task_id: str):
+    if RUN_MODE == "api":
+        # 由正在錄影的 worker 在下一次 heartbeat 時中止
+        if get_store().request_cancel(f"record:{task_id}"):
+            write_log(task_id, "manual_stop", "User requested stop")
+            return {"ok": True, "msg": "Stop requested"}
+        return {"ok": False, "msg": "No active recording"}
     proc = active_recordings.get(task_id)
+    if proc is None and task_id in live_recordings:
+        # 錄影在排程 leader（另一個 API 程序）裡，交給它中止
+        stop_requests[task_id] = time.time()
+        return {"ok": True, "msg": "Stop requested"}
     if proc and proc.poll() is None:
         proc.terminate()
         write_log(task_id, "manual_stop", "User requested stop")
+        if getattr(proc, "to_stdout", False) or task_id in active_segmenters:
+            # 分段錄影 / 邊錄邊轉：最新的 .ts 是正在轉檔的分段或原始備份，
+            # 最終檔由 record_segmented / record_live_transcoded 產生，這裡只中止錄影
+            return {"ok": True, "msg": "Stopped"}
         # 轉檔流程
         tasks = get_tasks()
         t = next((x for x in tasks if x["id"] == task_id), None)
@@ -839,9 +1357,57 @@ def handle_shutdown(signum, frame):
     sys.exit(0)
 
 @app.get("/tasks/active_recordings")
-def get_active_recordings():
+def get_active_recordings(request: Request):
     # 回傳目前有在錄影的 task id 列表
-    return list(active_recordings.keys())
+    return http_cache.cached_json(request, ("active", _active_version()), lambda: sorted(_active_task_ids()))
+
+
+def _active_task_ids():
+    active = set(active_recordings) | set(live_recordings)
+    if RUN_MODE == "api":
+        active.update(j["payload"]["task"]["id"] for j in get_store().list_jobs(kind="record", statuses=("leased",)))
+    return active
+
+
+def _active_version():
+    # active_recordings 與 live_recordings 同時增減，版本號看 live_recordings 即可
+    return live_recordings.version, get_store().version("record") if RUN_MODE == "api" else None
+
+
+@app.get("/dashboard")
+def get_dashboard(request: Request):
+    # 任務列表卡片用的彙總：錄影中、錄影數 / 總大小 / 最新時間、進行中的轉檔與最後一筆 log，
+    # 全部來自 dashboard 維護的統計與共用狀態，不掃描目錄
+    validator = ("dashboard", http_cache.file_stamp(TASKS_FILE), dashboard.version(),
+                 _active_version(), _conversion_version())
+    return http_cache.cached_json(
+        request, validator,
+        lambda: dashboard.build(get_tasks(), task_save_path, _active_task_ids(), _conversion_statuses())
+    )
+
+
+@app.get("/jobs")
+def list_jobs(kind: Optional[str] = None, status: Optional[str] = None, limit: int = 100):
+    # 分散模式的工作表（錄影 / 轉檔工作、所屬 worker、租約與進度）
+    return get_store().list_jobs(kind=kind, statuses=(status,) if status else None, limit=limit)
+
+
+@app.get("/stats")
+def get_stats():
+    # record_stream 各 handler 各階段耗時的百分位數（最近 spans.SAMPLES_PER_STAGE 次）
+    return {"record_stream": spans.summary()}
+
+
+@app.get("/browser_stats")
+def get_browser_stats():
+    # 回傳各 handler 瀏覽器 context 的資源攔截統計（調整 route profile 用）與冷啟動 / 閒置回收統計
+    browser_manager = sys.modules.get("handlers.browser_manager")
+    if browser_manager is None:
+        return {"routes": {}, "lifecycle": {"running": False, "cold_starts": 0, "idle_reaps": 0}}
+    return {
+        "routes": browser_manager.BrowserManager.route_stats(),
+        "lifecycle": browser_manager.BrowserManager.lifecycle_stats(),
+    }
 
 
 # 點播轉檔：TS → MP4 串流（下載或觀看用）
@@ -868,6 +1434,7 @@ def stream_ts_to_mp4(task_id: str, filename: str):
             "pipe:1"
         ]
         proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=10**6)
+        OutputCapture(proc, streams=("stderr",), name="remux")   # 不讀 stderr 的話 ffmpeg 會在 pipe 塞滿時卡住
         try:
             while True:
                 data = proc.stdout.read(1024 * 64)
@@ -904,6 +1471,7 @@ def live_mp4_stream(task_id: str, filename: str):
             "pipe:1"
         ]
         proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=10**6)
+        OutputCapture(proc, streams=("stderr",), name="remux")   # 不讀 stderr 的話 ffmpeg 會在 pipe 塞滿時卡住
         try:
             while True:
                 data = proc.stdout.read(1024 * 64)
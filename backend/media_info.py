@@ -0,0 +1,191 @@
+import os
+import json
+import threading
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+TS_PACKET = 188
+SCAN_BYTES = 4 * 1024 * 1024     # TS 頭尾各掃描的大小
+PTS_CLOCK = 90000
+PTS_WRAP = 1 << 33
+KEYFRAME_PROBE_SECONDS = 20      # 只看開頭這段時間的關鍵幀估算 GOP
+CACHE_SIZE = 1024
+PROBE_WORKERS = 4
+MEDIA_EXTS = {".ts", ".mp4", ".mkv", ".flv", ".m4a", ".mov", ".webm"}
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _rate(value) -> Optional[float]:
+    if not value or value in ("0/0", "N/A"):
+        return None
+    num, _, den = value.partition("/")
+    try:
+        return float(num) / float(den) if den and float(den) else float(num)
+    except ValueError:
+        return None
+
+
+def _pts_values(data: bytes) -> list[int]:
+    """從一段 TS 資料中取出所有 PES 開頭封包的 PTS（90kHz）"""
+    values = []
+    start = data.find(b"\x47")
+    while start >= 0 and start + TS_PACKET < len(data) and data[start + TS_PACKET] != 0x47:
+        start = data.find(b"\x47", start + 1)
+    if start < 0:
+        return values
+    for pos in range(start, len(data) - TS_PACKET + 1, TS_PACKET):
+        pkt = data[pos:pos + TS_PACKET]
+        if pkt[0] != 0x47 or not pkt[1] & 0x40:
+            continue
+        afc = (pkt[3] >> 4) & 0x3
+        offset = 4 + (1 + pkt[4] if afc & 0x2 else 0)
+        if not afc & 0x1 or offset + 14 > TS_PACKET:
+            continue
+        pes = pkt[offset:]
+        if pes[:3] != b"\x00\x00\x01" or not pes[7] & 0x80:
+            continue
+        p = pes[9:14]
+        values.append(((p[0] >> 1) & 0x07) << 30 | p[1] << 22 | (p[2] >> 1) << 15 | p[3] << 7 | p[4] >> 1)
+    return values
+
+
+def scan_ts_duration(path: str) -> Optional[float]:
+    """只讀 TS 檔頭尾各 SCAN_BYTES，以 PTS 差估算時長（錄影中的檔案也適用）"""
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            head = f.read(SCAN_BYTES)
+            f.seek(max(0, size - SCAN_BYTES))
+            tail = f.read(SCAN_BYTES)
+    except OSError:
+        return None
+    first, last = _pts_values(head), _pts_values(tail)
+    if not first or not last:
+        return None
+    diff = (max(last) - min(first)) % PTS_WRAP
+    return diff / PTS_CLOCK if diff else None
+
+
+def _keyframe_interval(path: str) -> Optional[float]:
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0", "-skip_frame", "nokey",
+        "-read_intervals", f"%+{KEYFRAME_PROBE_SECONDS}",
+        "-show_entries", "frame=pts_time,best_effort_timestamp_time",
+        "-of", "csv=p=0", path,
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    times = []
+    for line in result.stdout.splitlines():
+        t = next((_float(v) for v in line.split(",") if _float(v) is not None), None)
+        if t is not None:
+            times.append(t)
+    if len(times) < 2:
+        return None
+    return round((times[-1] - times[0]) / (len(times) - 1), 3)
+
+
+def _probe(path: str, size: int) -> Optional[dict]:
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries",
+        "format=duration,bit_rate,format_name:stream=codec_type,codec_name,width,height,avg_frame_rate,r_frame_rate,bit_rate",
+        "-of", "json", path,
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        print(f"[MediaInfo] ffprobe {path} 失敗: {result.stderr.strip()}")
+        return None
+    data = json.loads(result.stdout or "{}")
+    fmt = data.get("format", {})
+    info = {
+        "size": size,
+        "format": fmt.get("format_name"),
+        "duration": _float(fmt.get("duration")),
+        "bit_rate": _float(fmt.get("bit_rate")),
+        "video": None,
+        "audio": [],
+        "keyframe_interval": None,
+    }
+    for s in data.get("streams", []):
+        if s.get("codec_type") == "video" and info["video"] is None:
+            info["video"] = {
+                "codec": s.get("codec_name"),
+                "width": s.get("width") or 0,
+                "height": s.get("height") or 0,
+                "fps": _rate(s.get("avg_frame_rate")) or _rate(s.get("r_frame_rate")),
+                "bit_rate": _float(s.get("bit_rate")),
+            }
+        elif s.get("codec_type") == "audio":
+            info["audio"].append({"codec": s.get("codec_name"), "bit_rate": _float(s.get("bit_rate"))})
+
+    # TS 的 format duration 是估算值（錄影中更不準），以頭尾 PTS 為準
+    if path.lower().endswith(".ts"):
+        scanned = scan_ts_duration(path)
+        if scanned:
+            info["duration"] = scanned
+    if not info["bit_rate"] and info["duration"]:
+        info["bit_rate"] = size * 8 / info["duration"]
+    if info["video"]:
+        info["keyframe_interval"] = _keyframe_interval(path)
+    return info
+
+
+def get_info(path: str) -> Optional[dict]:
+    """
+    取得檔案的媒體資訊（時長、bitrate、編碼、解析度、關鍵幀間隔），只讀容器標頭與 TS 頭尾，不解碼整個檔案。
+    結果依 (path, size, mtime) 快取，檔案變動（例如錄影中持續寫入）後會重新探測。
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (os.path.abspath(path), st.st_size, st.st_mtime)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    info = _probe(path, st.st_size)
+    if info is not None:
+        with _cache_lock:
+            _cache[key] = info
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+    return info
+
+
+def get_many(paths: list[str]) -> dict:
+    """平行取得多個檔案的媒體資訊，回傳 {path: info}"""
+    paths = [p for p in paths if os.path.splitext(p)[1].lower() in MEDIA_EXTS]
+    if not paths:
+        return {}
+    with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as pool:
+        return dict(zip(paths, pool.map(get_info, paths)))
+
+
+def summary(info: Optional[dict]) -> dict:
+    """給 API 用的精簡欄位"""
+    if not info:
+        return {}
+    video = info.get("video") or {}
+    return {
+        "duration": info.get("duration"),
+        "bit_rate": info.get("bit_rate"),
+        "video_codec": video.get("codec"),
+        "audio_codec": info["audio"][0]["codec"] if info.get("audio") else None,
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "fps": video.get("fps"),
+        "keyframe_interval": info.get("keyframe_interval"),
+    }
@@ -0,0 +1,109 @@
+import os
+import re
+import time
+import threading
+from collections import deque
+from typing import Callable, Optional
+
+# 子程序（streamlink / ffmpeg）輸出的有界擷取：不論錄影跑多久，每個 pipe 只保留最後 MAX_LINES 行
+MAX_LINES = int(os.environ.get("PROC_OUTPUT_LINES", 200))
+MAX_LINE_BYTES = 2048       # 單行上限，超過的部分丟掉（沒有換行的進度輸出也不會無限增長）
+READ_CHUNK = 64 * 1024
+EVENT_MIN_INTERVAL = 30     # 同一種事件在這段時間內只轉發一次，其餘只計數
+LINE_SPLIT_RE = re.compile(rb"[\r\n]")
+
+# (事件名稱, pattern)：依序比對，第一個命中的為準
+EVENT_PATTERNS = [
+    ("no_stream", re.compile(r"No (playable )?streams found", re.I)),
+    ("stream_reconnect", re.compile(r"reconnect|retrying|Failed to reload playlist", re.I)),
+    ("stream_error", re.compile(r"\berror\b|\bfatal\b", re.I)),
+]
+
+
+class OutputCapture:
+    """
+    背景執行緒逐塊讀取 proc 的 stdout / stderr（streams 指定哪些），每個 pipe 各一個 deque 環狀緩衝；
+    每一行比對 EVENT_PATTERNS，命中時即時呼叫 on_event(事件, 該行)（例如寫入 task log），
+    同一種事件 EVENT_MIN_INTERVAL 秒內只轉發一次，下一次轉發時附上中間略過的次數。
+    取代 proc.communicate()：wait() 等程序結束，text(stream) 取得最後幾行。
+    """
+
+    def __init__(self, proc, on_event: Optional[Callable[[str, str], None]] = None,
+                 streams=("stdout", "stderr"), max_lines: int = MAX_LINES, name: str = "proc"):
+        self.proc = proc
+        self.on_event = on_event
+        self.counts = {}           # 事件 -> 出現次數
+        self._tails = {}
+        self._threads = []
+        self._last_sent = {}       # 事件 -> 上次轉發時間
+        self._suppressed = {}      # 事件 -> 上次轉發後略過的次數
+        self._lock = threading.Lock()
+        for stream in streams:
+            pipe = getattr(proc, stream, None)
+            if pipe is None or not hasattr(pipe, "read"):
+                continue
+            tail = self._tails[stream] = deque(maxlen=max_lines)
+            thread = threading.Thread(target=self._read, args=(pipe, tail), name=f"{name}-{stream}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _read(self, pipe, tail: deque):
+        raw = getattr(pipe, "buffer", pipe)      # text 模式的 pipe 直接讀底層 bytes
+        read = getattr(raw, "read1", raw.read)   # read1：有資料就回傳，不等湊滿 READ_CHUNK
+        pending = b""
+        try:
+            while True:
+                chunk = read(READ_CHUNK)
+                if not chunk:
+                    break
+                parts = LINE_SPLIT_RE.split(pending + chunk)
+                pending = parts.pop()[:MAX_LINE_BYTES]
+                for part in parts:
+                    if part:
+                        self._line(part[:MAX_LINE_BYTES], tail)
+        except (OSError, ValueError):
+            pass   # pipe 被關閉
+        if pending:
+            self._line(pending, tail)
+
+    def _line(self, data: bytes, tail: deque):
+        line = data.decode("utf-8", errors="ignore").strip()
+        if not line:
+            return
+        tail.append(line)
+        for event, pattern in EVENT_PATTERNS:
+            if pattern.search(line):
+                self._emit(event, line)
+                break
+
+    def _emit(self, event: str, line: str):
+        now = time.time()
+        with self._lock:
+            self.counts[event] = self.counts.get(event, 0) + 1
+            if now - self._last_sent.get(event, 0) < EVENT_MIN_INTERVAL:
+                self._suppressed[event] = self._suppressed.get(event, 0) + 1
+                return
+            self._last_sent[event] = now
+            skipped = self._suppressed.pop(event, 0)
+        if self.on_event is None:
+            return
+        if skipped:
+            line = f"{line}（期間另有 {skipped} 則相同事件）"
+        try:
+            self.on_event(event, line)
+        except Exception as e:
+            print(f"[ProcOutput] 轉發事件失敗: {e}")
+
+    def wait(self, timeout: float = 5):
+        """等程序結束，再等讀取執行緒讀完剩下的輸出（最多 timeout 秒，孫程序可能還握著 pipe），回傳 returncode"""
+        returncode = self.proc.wait()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        return returncode
+
+    def text(self, stream: str = "stderr", sep: str = "\n") -> str:
+        return sep.join(list(self._tails.get(stream, ()))).strip()
+
+    def seen(self, event: str) -> bool:
+        with self._lock:
+            return event in self.counts
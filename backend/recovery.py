@@ -0,0 +1,76 @@
+import os
+import json
+import shutil
+import time
+import media_info
+from ts_segmenter import MANIFEST_SUFFIX
+
+# 錄影結束不到這麼久的 TS 可能仍在寫入（例如其他節點的 worker），開機整理時不碰
+RECENT_GRACE_SECONDS = 300
+DURATION_TOLERANCE = 2.0
+
+
+def _manifest_files(save_path: str) -> set:
+    """分段錄影 / 邊錄邊轉 manifest 裡記錄的原始 TS 備份，它們與 mp4 並存是正常的"""
+    names = set()
+    for name in os.listdir(save_path):
+        if not name.endswith(MANIFEST_SUFFIX):
+            continue
+        try:
+            with open(os.path.join(save_path, name), encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if manifest.get("raw_file"):
+            names.add(manifest["raw_file"])
+    return names
+
+
+def _complete(mp4_path: str, ts_path: str) -> bool:
+    """mp4 能探測且時長與來源相符才算轉完；寫到一半的 mp4 沒有 moov，探測會失敗"""
+    mp4 = (media_info.get_info(mp4_path) or {}).get("duration")
+    ts = (media_info.get_info(ts_path) or {}).get("duration")
+    if not mp4 or not ts:
+        return False
+    return abs(mp4 - ts) <= max(DURATION_TOLERANCE, ts * 0.005)
+
+
+def scan(save_path: str, skip: set, log=None, task_id: str = None) -> list[str]:
+    """
+    找出上次中斷而沒轉完的 TS，回傳需要重新轉檔的路徑：
+    - 沒有 mp4：需要轉檔
+    - 有 mp4 但不完整：刪掉半成品後重新轉檔
+    - 有完整 mp4：上次轉完但來不及刪 TS，直接補刪
+    skip 為不可碰的絕對路徑（錄影中的檔案、已排入或轉檔中的工作）。
+    """
+    if not os.path.isdir(save_path):
+        return []
+    now = time.time()
+    keep = _manifest_files(save_path)
+    pending = []
+    for name in sorted(os.listdir(save_path)):
+        if name.endswith(".mp4.chunks"):
+            # 分塊編碼的暫存（見 chunked_encoder）；來源已不在就不可能再沿用
+            if not os.path.exists(os.path.join(save_path, name[:-len(".mp4.chunks")] + ".ts")):
+                shutil.rmtree(os.path.join(save_path, name), ignore_errors=True)
+            continue
+        if not name.endswith(".ts") or name in keep:
+            continue
+        ts_path = os.path.abspath(os.path.join(save_path, name))
+        try:
+            if ts_path in skip or now - os.path.getmtime(ts_path) < RECENT_GRACE_SECONDS:
+                continue
+        except FileNotFoundError:
+            continue
+        mp4_path = os.path.splitext(ts_path)[0] + ".mp4"
+        if os.path.exists(mp4_path):
+            if _complete(mp4_path, ts_path):
+                os.remove(ts_path)
+                if log:
+                    log(task_id, "recovered", f"{name} 上次已轉檔完成，刪除殘留的 TS")
+                continue
+            os.remove(mp4_path)
+            if log:
+                log(task_id, "recovered", f"刪除未完成的轉檔輸出 {os.path.basename(mp4_path)}")
+        pending.append(ts_path)
+    return pending
@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import shutil
+import threading
+from typing import Callable, Iterable
+from ledger import is_ledger_file
+
+GB = 1024 ** 3
+# 全域配額：/recordings 下所有任務加總的上限（GB，0 表示不限制）
+GLOBAL_QUOTA_GB = float(os.environ.get("RECORDINGS_QUOTA_GB", "0") or 0)
+# 錄影開始前至少要保留的剩餘空間（GB）
+MIN_FREE_GB = float(os.environ.get("RECORDINGS_MIN_FREE_GB", "2") or 0)
+# 沒有 bitrate 紀錄時，預估一次錄影需要的空間（GB）
+DEFAULT_ESTIMATE_GB = float(os.environ.get("RECORDING_ESTIMATE_GB", "2") or 0)
+SWEEP_INTERVAL_MINUTES = 10
+RECENT_GRACE_SECONDS = 300     # 最近仍在寫入的檔案（錄影 / 轉檔中）不刪
+ESTIMATE_MARGIN = 1.2
+HISTORY_SIZE = 10
+BITRATE_FILE = os.path.join(os.environ.get("DATA_DIR", "/data"), "bitrate_history.json")
+_TEMP_SUFFIXES = {".part", ".json", ".tmp"}   # X.ts.part / X.ts.part.json 都屬於 X
+
+_history_lock = threading.Lock()
+_sweep_lock = threading.Lock()
+
+
+def _policy(task: dict) -> dict:
+    return {
+        "keep_last": task.get("keep_last"),
+        "max_age_days": task.get("max_age_days"),
+        "max_gb": task.get("max_gb"),
+    }
+
+
+def has_policy(task: dict) -> bool:
+    return any(v for v in _policy(task).values())
+
+
+def list_groups(save_path: str) -> list[dict]:
+    """
+    把 save_dir 裡的錄影依檔名（不含副檔名）分組：同一集的 .ts / .mp4 / .part 算同一份，
+    回傳 [{"stem", "files", "bytes", "mtime"}, ...]，由舊到新排序。
+    """
+    groups = {}
+    if not os.path.isdir(save_path):
+        return []
+    for name in os.listdir(save_path):
+        path = os.path.join(save_path, name)
+        if is_ledger_file(name) or not os.path.isfile(path):
+            continue
+        stem = name
+        while os.path.splitext(stem)[1] in _TEMP_SUFFIXES:
+            stem = os.path.splitext(stem)[0]
+        stem = os.path.splitext(stem)[0]
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        g = groups.setdefault(stem, {"stem": stem, "files": [], "bytes": 0, "mtime": 0.0})
+        g["files"].append(path)
+        g["bytes"] += st.st_size
+        g["mtime"] = max(g["mtime"], st.st_mtime)
+    return sorted(groups.values(), key=lambda g: g["mtime"])
+
+
+def _is_protected(group: dict, protected: set, now: float) -> bool:
+    if now - group["mtime"] < RECENT_GRACE_SECONDS:
+        return True
+    return any(os.path.abspath(p) in protected for p in group["files"])
+
+
+def _evict(group: dict, task_id: str, reason: str, thumbnails_dir: str, log: Callable):
+    freed = 0
+    for path in group["files"]:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            freed += size
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[Retention] 刪除 {path} 失敗: {e}")
+    if thumbnails_dir:
+        shutil.rmtree(os.path.join(thumbnails_dir, group["stem"]), ignore_errors=True)
+    msg = f"{reason}: 刪除 {group['stem']}（{freed / GB:.2f} GB）"
+    print(f"[Retention] [{task_id}] {msg}")
+    log(task_id, "evict", msg)
+    return freed
+
+
+def _task_paths(tasks: Iterable[dict], recordings_dir: str):
+    for t in tasks:
+        yield t, os.path.join(recordings_dir, t["save_dir"].strip("/"))
+
+
+def _apply_task_policy(task: dict, save_path: str, protected: set, thumbnails_dir: str, log: Callable) -> int:
+    policy = _policy(task)
+    groups = list_groups(save_path)
+    now = time.time()
+    freed = 0
+    evicted = set()
+
+    if policy["keep_last"]:
+        excess = len(groups) - int(policy["keep_last"])
+        for g in groups[:max(0, excess)]:
+            if not _is_protected(g, protected, now):
+                freed += _evict(g, task["id"], f"超過保留集數 {policy['keep_last']}", thumbnails_dir, log)
+                evicted.add(g["stem"])
+
+    if policy["max_age_days"]:
+        cutoff = now - float(policy["max_age_days"]) * 86400
+        for g in groups:
+            if g["stem"] not in evicted and g["mtime"] < cutoff and not _is_protected(g, protected, now):
+                freed += _evict(g, task["id"], f"超過保留天數 {policy['max_age_days']}", thumbnails_dir, log)
+                evicted.add(g["stem"])
+
+    if policy["max_gb"]:
+        limit = float(policy["max_gb"]) * GB
+        used = sum(g["bytes"] for g in groups if g["stem"] not in evicted)
+        for g in groups:
+            if used <= limit:
+                break
+            if g["stem"] in evicted or _is_protected(g, protected, now):
+                continue
+            freed += _evict(g, task["id"], f"超過任務配額 {policy['max_gb']} GB", thumbnails_dir, log)
+            evicted.add(g["stem"])
+            used -= g["bytes"]
+    return freed
+
+
+def _evict_oldest(tasks: list[dict], recordings_dir: str, need_bytes: int, reason: str,
+                  protected: set, thumbnails_dir: str, log: Callable, only_with_policy: bool) -> int:
+    """跨任務由舊到新刪除，直到釋放 need_bytes"""
+    now = time.time()
+    candidates = []
+    for t, save_path in _task_paths(tasks, recordings_dir):
+        if only_with_policy and not has_policy(t):
+            continue
+        for g in list_groups(save_path):
+            if not _is_protected(g, protected, now):
+                candidates.append((g["mtime"], t["id"], g))
+    candidates.sort(key=lambda c: c[0])
+    freed = 0
+    for _, task_id, g in candidates:
+        if freed >= need_bytes:
+            break
+        freed += _evict(g, task_id, reason, thumbnails_dir, log)
+    return freed
+
+
+def _used_bytes(tasks: list[dict], recordings_dir: str) -> int:
+    seen, used = set(), 0
+    for _, save_path in _task_paths(tasks, recordings_dir):
+        if save_path in seen:
+            continue
+        seen.add(save_path)
+        used += sum(g["bytes"] for g in list_groups(save_path))
+    return used
+
+
+def sweep(tasks: list[dict], recordings_dir: str, protected: set, thumbnails_dir: str, log: Callable) -> int:
+    """
+    背景清理：先套用各任務的保留規則（保留最後 N 集、最長天數、任務配額），
+    再檢查全域配額，超過就跨任務由舊到新刪除。回傳釋放的位元組數。
+    """
+    with _sweep_lock:
+        freed = 0
+        for t, save_path in _task_paths(tasks, recordings_dir):
+            if has_policy(t):
+                try:
+                    freed += _apply_task_policy(t, save_path, protected, thumbnails_dir, log)
+                except Exception as e:
+                    print(f"[Retention] 套用 {t.get('name')} 的保留規則失敗: {e}")
+        if GLOBAL_QUOTA_GB:
+            over = _used_bytes(tasks, recordings_dir) - int(GLOBAL_QUOTA_GB * GB)
+            if over > 0:
+                freed += _evict_oldest(tasks, recordings_dir, over, f"超過全域配額 {GLOBAL_QUOTA_GB} GB",
+                                       protected, thumbnails_dir, log, only_with_policy=False)
+        return freed
+
+
+def _load_history() -> dict:
+    try:
+        with open(BITRATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def record_bitrate(task_id: str, size_bytes: int, seconds: float):
+    """錄影結束後記錄這次的大小與長度，供下次預估空間"""
+    if seconds <= 0 or size_bytes <= 0:
+        return
+    with _history_lock:
+        history = _load_history()
+        samples = history.get(task_id, [])
+        samples.append({"bytes": size_bytes, "seconds": round(seconds, 1), "time": time.time()})
+        history[task_id] = samples[-HISTORY_SIZE:]
+        tmp = f"{BITRATE_FILE}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(history, f)
+        os.replace(tmp, BITRATE_FILE)
+
+
+def estimate_bytes(task_id: str) -> int:
+    """以最近幾次錄影的最高 bitrate × 最長時間預估這次需要的空間"""
+    with _history_lock:
+        samples = _load_history().get(task_id, [])
+    if not samples:
+        return int(DEFAULT_ESTIMATE_GB * GB)
+    bps = max(s["bytes"] / s["seconds"] for s in samples)
+    seconds = max(s["seconds"] for s in samples)
+    return int(bps * seconds * ESTIMATE_MARGIN)
+
+
+def admit(task: dict, tasks: list[dict], recordings_dir: str, protected: set,
+          thumbnails_dir: str, log: Callable) -> tuple[bool, str]:
+    """
+    確定開播後（錄影輸出出現資料時）的空間檢查：剩餘空間需大於「預估大小 + MIN_FREE_GB」，且不可超過全域配額。
+    不足時先從有設定保留規則的任務（設定全域配額時則為所有任務）由舊到新刪除；仍不足就拒絕。
+    回傳 (是否允許, 說明)。
+    """
+    save_path = os.path.join(recordings_dir, task["save_dir"].strip("/"))
+    need = estimate_bytes(task["id"])
+    with _sweep_lock:
+        reserve = int(MIN_FREE_GB * GB)
+        free = shutil.disk_usage(save_path).free
+        shortage = need + reserve - free
+        if GLOBAL_QUOTA_GB:
+            shortage = max(shortage, _used_bytes(tasks, recordings_dir) + need - int(GLOBAL_QUOTA_GB * GB))
+        if shortage > 0:
+            _evict_oldest(tasks, recordings_dir, shortage, f"為 {task.get('name')} 騰出空間",
+                          protected, thumbnails_dir, log, only_with_policy=not GLOBAL_QUOTA_GB)
+            free = shutil.disk_usage(save_path).free
+            shortage = need + reserve - free
+            if GLOBAL_QUOTA_GB:
+                shortage = max(shortage, _used_bytes(tasks, recordings_dir) + need - int(GLOBAL_QUOTA_GB * GB))
+        detail = f"預估需要 {need / GB:.2f} GB，剩餘 {free / GB:.2f} GB"
+        if shortage > 0:
+            return False, f"空間不足（{detail}，保留 {MIN_FREE_GB} GB）"
+        return True, detail
+
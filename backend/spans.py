@@ -0,0 +1,119 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+from state_store import SharedMap
+
+SAMPLES_PER_STAGE = 200         # 每個 handler / 階段保留最近幾筆，用來算百分位數
+FIRST_BYTE_POLL = 0.1
+FIRST_BYTE_TIMEOUT = 120
+
+# handler 名稱 -> {階段: [最近的耗時（毫秒）]}；存在 state_store，任何 API 程序都能讀到 leader 的統計
+_samples = SharedMap("stage_timings")
+_samples_lock = threading.Lock()
+
+
+class RunTrace:
+    """
+    一次 record_stream 的各階段計時：
+        with trace.span("parse_urls"):
+            ...
+    span 記錄開始時間（相對於 trace 建立）與耗時；first_byte 由 watch_first_byte 在輸出出現資料時補上。
+    """
+
+    def __init__(self, task_id: str, handler: str = None):
+        self.task_id = task_id
+        self.handler = handler
+        self.started = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.time()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.add(name, start, time.time(), error)
+
+    def add(self, name: str, start: float, end: float, error: str = None):
+        entry = {"stage": name, "at_ms": round((start - self.started) * 1000), "ms": round((end - start) * 1000)}
+        if error:
+            entry["error"] = error
+        with self._lock:
+            self.spans.append(entry)
+
+    def get(self, name: str) -> Optional[dict]:
+        with self._lock:
+            return next((s for s in self.spans if s["stage"] == name), None)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {"handler": self.handler, "total_ms": round((time.time() - self.started) * 1000),
+                    "spans": list(self.spans)}
+
+    def summary(self) -> str:
+        """寫進 task log msg 的一行摘要"""
+        with self._lock:
+            return ", ".join(f"{s['stage']} {s['ms']}ms" for s in self.spans)
+
+
+def watch_first_byte(trace: RunTrace, written: Callable[[], int], stop: threading.Event,
+                     since: float = None, timeout: float = FIRST_BYTE_TIMEOUT) -> threading.Thread:
+    """
+    背景輪詢 written()（已寫入的位元組數），第一次大於 0 時記錄 first_byte span（從 since 起算，預設為現在）。
+    stop 被設定或逾時就放棄。
+    """
+    since = since or time.time()
+
+    def _watch():
+        deadline = since + timeout
+        while not stop.is_set() and time.time() < deadline:
+            try:
+                if written() > 0:
+                    trace.add("first_byte", since, time.time())
+                    return
+            except Exception:
+                pass
+            stop.wait(FIRST_BYTE_POLL)
+
+    thread = threading.Thread(target=_watch, name=f"FirstByte-{trace.task_id}", daemon=True)
+    thread.start()
+    return thread
+
+
+def record(trace: RunTrace):
+    """把這次的各階段耗時併入 handler 的統計"""
+    if not trace.handler or not trace.spans:
+        return
+    with _samples_lock:
+        stages = dict(_samples.get(trace.handler) or {})
+        for s in trace.to_dict()["spans"]:
+            stages[s["stage"]] = (stages.get(s["stage"], []) + [s["ms"]])[-SAMPLES_PER_STAGE:]
+        _samples[trace.handler] = stages
+
+
+def _percentile(values: list, pct: float):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def summary() -> dict:
+    """{handler: {stage: {count, p50_ms, p90_ms, p99_ms, max_ms}}}"""
+    result = {}
+    for handler, stages in _samples.snapshot().items():
+        result[handler] = {
+            stage: {
+                "count": len(values),
+                "p50_ms": _percentile(values, 50),
+                "p90_ms": _percentile(values, 90),
+                "p99_ms": _percentile(values, 99),
+                "max_ms": max(values),
+            }
+            for stage, values in stages.items() if values
+        }
+    return result
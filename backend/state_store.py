@@ -0,0 +1,325 @@
+import os
+import json
+import time
+import fcntl
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from typing import Callable, Optional
+
+# API 程序（uvicorn --workers N）與 worker 共用的執行期狀態；分散模式下 worker 節點經由共用的 /data 寫入
+DB_PATH = os.environ.get("STATE_DB") or os.path.join(os.environ.get("DATA_DIR", "/data"), "state.db")
+SCHEDULER_LOCK = os.environ.get("SCHEDULER_LOCK") or os.path.join(os.environ.get("DATA_DIR", "/data"), "scheduler.lock")
+WATCH_INTERVAL = 0.5        # 檢查其他程序寫入的間隔（秒）
+ELECTION_RETRY_SECONDS = 5  # 非 leader 重新嘗試取得排程鎖的間隔
+# SQLite 的 WAL 依賴 -shm 共享記憶體索引，只在同一台機器上有效；分散模式（api / worker）下 state.db 與 jobs.db
+# 由多台主機經共用 volume 開啟，必須用 rollback journal（DELETE），且該檔案系統要支援 POSIX 檔案鎖（fcntl）
+JOURNAL_MODE = (os.environ.get("SQLITE_JOURNAL_MODE")
+                or ("WAL" if os.environ.get("RUN_MODE", "all") == "all" else "DELETE")).upper()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    ns TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (ns, key)
+);
+CREATE TABLE IF NOT EXISTS versions (
+    ns TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+
+def configure(conn: sqlite3.Connection):
+    """依 JOURNAL_MODE 設定連線；rollback journal 下 synchronous=NORMAL 不保證掉電安全，改用 FULL"""
+    conn.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+    conn.execute(f"PRAGMA synchronous={'NORMAL' if JOURNAL_MODE == 'WAL' else 'FULL'}")
+
+
+class StateStore:
+    """
+    以 namespace 分組的 key/value（SQLite，journal mode 見 JOURNAL_MODE）：
+    - 每次寫入都在同一個交易裡把該 namespace 的版本號加一
+    - watch(ns, callback) 由背景執行緒輪詢版本號，任何程序寫入後 callback 都會被呼叫
+    """
+
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._watchers = {}        # ns -> [callback]
+        self._seen = {}            # ns -> 最後通知過的版本
+        self._watch_lock = threading.Lock()
+        self._watch_thread = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            configure(conn)
+            self._local.conn = conn
+        return conn
+
+    def _write(self, ns: str, sql: str, args: tuple) -> int:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rowcount = conn.execute(sql, args).rowcount
+            if rowcount:
+                self._bump(conn, ns)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return rowcount
+
+    @staticmethod
+    def _bump(conn, ns: str):
+        conn.execute(
+            "INSERT INTO versions (ns, version) VALUES (?, 1) "
+            "ON CONFLICT(ns) DO UPDATE SET version = version + 1",
+            (ns,),
+        )
+
+    def get(self, ns: str, key: str, default=None):
+        row = self._conn().execute("SELECT value FROM state WHERE ns = ? AND key = ?", (ns, key)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, ns: str, key: str, value):
+        self._write(ns, "INSERT OR REPLACE INTO state (ns, key, value) VALUES (?, ?, ?)",
+                    (ns, key, json.dumps(value, ensure_ascii=False)))
+
+    def delete(self, ns: str, key: str) -> bool:
+        return bool(self._write(ns, "DELETE FROM state WHERE ns = ? AND key = ?", (ns, key)))
+
+    def clear(self, ns: str):
+        self._write(ns, "DELETE FROM state WHERE ns = ?", (ns,))
+
+    def keys(self, ns: str) -> list[str]:
+        return [r[0] for r in self._conn().execute("SELECT key FROM state WHERE ns = ?", (ns,))]
+
+    def items(self, ns: str) -> dict:
+        return {k: json.loads(v) for k, v in self._conn().execute("SELECT key, value FROM state WHERE ns = ?", (ns,))}
+
+    def count(self, ns: str) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM state WHERE ns = ?", (ns,)).fetchone()[0]
+
+    def version(self, ns: str) -> int:
+        row = self._conn().execute("SELECT version FROM versions WHERE ns = ?", (ns,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, ns: str) -> int:
+        """沒有存在 state 裡的資料（例如 tasks.json）變更時，手動通知其他程序"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._bump(conn, ns)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.version(ns)
+
+    def watch(self, ns: str, callback: Callable[[int], None]):
+        """ns 的版本改變時（不論是哪個程序寫入）以新版本號呼叫 callback"""
+        with self._watch_lock:
+            self._seen.setdefault(ns, self.version(ns))
+            self._watchers.setdefault(ns, []).append(callback)
+            if self._watch_thread is None:
+                self._watch_thread = threading.Thread(target=self._watch_loop, name="StateWatch", daemon=True)
+                self._watch_thread.start()
+
+    def _watch_loop(self):
+        while True:
+            time.sleep(WATCH_INTERVAL)
+            try:
+                versions = dict(self._conn().execute("SELECT ns, version FROM versions"))
+            except sqlite3.Error as e:
+                print(f"[StateStore] 讀取版本失敗: {e}")
+                continue
+            with self._watch_lock:
+                changed = [(ns, versions.get(ns, 0)) for ns in self._watchers if versions.get(ns, 0) != self._seen[ns]]
+                for ns, version in changed:
+                    self._seen[ns] = version
+                callbacks = [(cb, version) for ns, version in changed for cb in self._watchers[ns]]
+            for cb, version in callbacks:
+                try:
+                    cb(version)
+                except Exception as e:
+                    print(f"[StateStore] watch callback 失敗: {e}")
+
+
+class _Entry(dict):
+    """SharedMap 取出的值；對它的修改（m[k]["progress"] = ...、update、pop）會寫回 store"""
+
+    def __init__(self, owner: "SharedMap", key: str, value: dict):
+        super().__init__(value)
+        self._owner = owner
+        self._key = key
+
+    def _save(self):
+        self._owner.store.set(self._owner.ns, self._key, dict(self))
+
+    def __setitem__(self, k, v):
+        super().__setitem__(k, v)
+        self._save()
+
+    def __delitem__(self, k):
+        super().__delitem__(k)
+        self._save()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._save()
+
+    def pop(self, k, *default):
+        had = k in self
+        value = super().pop(k, *default)
+        if had:
+            self._save()
+        return value
+
+    def setdefault(self, k, default=None):
+        if k not in self:
+            self[k] = default
+        return self[k]
+
+
+class SharedMap(MutableMapping):
+    """
+    取代模組層級 dict 的共用 map，值必須能 JSON 序列化。
+    值為 dict 時取出的是 _Entry，原本 conversion_tasks[key]["progress"] = p 的寫法不必改。
+    """
+
+    def __init__(self, ns: str, store: "StateStore" = None):
+        self.ns = ns
+        self._store = store
+
+    @property
+    def store(self) -> StateStore:
+        return self._store or get_store()
+
+    def __getitem__(self, key):
+        value = self.store.get(self.ns, key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return _Entry(self, key, value) if isinstance(value, dict) else value
+
+    def __setitem__(self, key, value):
+        self.store.set(self.ns, key, value)
+
+    def __delitem__(self, key):
+        if not self.store.delete(self.ns, key):
+            raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.store.keys(self.ns))
+
+    def __len__(self):
+        return self.store.count(self.ns)
+
+    def __contains__(self, key):
+        return self.store.get(self.ns, key, _MISSING) is not _MISSING
+
+    def clear(self):
+        self.store.clear(self.ns)
+
+    def snapshot(self) -> dict:
+        """一次查詢取得全部內容（給 API 回傳用）"""
+        return self.store.items(self.ns)
+
+    @property
+    def version(self) -> int:
+        return self.store.version(self.ns)
+
+    def watch(self, callback: Callable[[int], None]):
+        self.store.watch(self.ns, callback)
+
+
+_MISSING = object()
+
+
+class FileLock:
+    """跨程序（flock）+ 程序內（threading.Lock）的互斥，用在 tasks.json 這類共用檔案的讀改寫"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        self._fd = open(self.path, "a")
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._fd.close()
+        finally:
+            self._fd = None
+            self._thread_lock.release()
+        return False
+
+
+class SchedulerElection:
+    """
+    在同一台機器的多個程序中選出唯一一個跑排程（錄影、HLS、清理）的 leader：
+    以非阻塞 flock 搶 SCHEDULER_LOCK，搶到的程序一直持有到結束；
+    leader 結束（包含當機）時 OS 會釋放鎖，其他程序在下一次重試時接手並呼叫 on_elected。
+    """
+
+    def __init__(self, on_elected: Callable[[], None], path: str = SCHEDULER_LOCK,
+                 retry_seconds: float = ELECTION_RETRY_SECONDS):
+        self.path = path
+        self.on_elected = on_elected
+        self.retry_seconds = retry_seconds
+        self.is_leader = False
+        self._fd = None
+
+    def _try_acquire(self) -> bool:
+        fd = open(self.path, "a+")
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fd.close()
+            return False
+        fd.seek(0)
+        fd.truncate()
+        fd.write(str(os.getpid()))
+        fd.flush()
+        self._fd = fd
+        return True
+
+    def start(self):
+        if self._try_acquire():
+            self._elected()
+        else:
+            print(f"[StateStore] 程序 {os.getpid()} 不是排程 leader，每 {self.retry_seconds} 秒重試")
+            threading.Thread(target=self._retry, name="SchedulerElection", daemon=True).start()
+
+    def _retry(self):
+        while not self._try_acquire():
+            time.sleep(self.retry_seconds)
+        self._elected()
+
+    def _elected(self):
+        self.is_leader = True
+        print(f"[StateStore] 程序 {os.getpid()} 成為排程 leader")
+        self.on_elected()
+
+
+_store: Optional[StateStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> StateStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = StateStore()
+    return _store
@@ -0,0 +1,22 @@
+import io
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from live_transcoder import LiveTranscoder
+
+
+def test_empty_stream_leaves_no_files():
+    """沒開播（streamlink 沒有輸出）時，不應留下 0 byte 的原始 TS 備份或 manifest 以外的檔案"""
+    with tempfile.TemporaryDirectory() as folder:
+        base = os.path.join(folder, "show_20240101_000000")
+        transcoder = LiveTranscoder(base, "high", base + ".raw.ts")
+        transcoder.run(io.BytesIO(b""))
+        assert not transcoder.segments
+        assert os.listdir(folder) == []
+
+
+if __name__ == "__main__":
+    test_empty_stream_leaves_no_files()
+    print("ok")
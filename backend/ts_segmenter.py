@@ -0,0 +1,320 @@
+import os
+import json
+import time
+import queue
+import threading
+import subprocess
+from typing import Callable, Optional
+
+TS_PACKET = 188
+SYNC_BYTE = 0x47
+READ_SIZE = TS_PACKET * 1024           # 每次從 streamlink stdout 讀取約 188KB
+GB = 1024 ** 3
+MANIFEST_SUFFIX = ".segments.json"
+# PMT 中代表影像的 stream_type：MPEG-1/2、MPEG-4、H.264、HEVC
+VIDEO_STREAM_TYPES = {0x01, 0x02, 0x10, 0x1B, 0x24}
+H264_KEY_NALS = {5, 7}                 # IDR、SPS
+HEVC_KEY_NALS = {16, 17, 18, 19, 20, 21, 32}   # IRAP、VPS
+
+
+def _section(payload: bytes) -> Optional[bytes]:
+    """取出 PSI section（略過 pointer_field）"""
+    if not payload:
+        return None
+    start = 1 + payload[0]
+    if start + 3 > len(payload):
+        return None
+    length = ((payload[start + 1] & 0x0F) << 8) | payload[start + 2]
+    return payload[start:start + 3 + length]
+
+
+def _is_keyframe_payload(payload: bytes, stream_type: int) -> bool:
+    """在 PES 開頭的封包裡找 IDR / IRAP NAL（沒有 random_access_indicator 的來源用）"""
+    if len(payload) < 9 or payload[:3] != b"\x00\x00\x01":
+        return False
+    es = payload[9 + payload[8]:]
+    i = es.find(b"\x00\x00\x01")
+    while 0 <= i < len(es) - 3:
+        nal = es[i + 3]
+        if stream_type == 0x24:
+            if (nal >> 1) & 0x3F in HEVC_KEY_NALS:
+                return True
+        elif stream_type == 0x1B:
+            if nal & 0x1F in H264_KEY_NALS:
+                return True
+        i = es.find(b"\x00\x00\x01", i + 3)
+    return False
+
+
+class TsSegmenter:
+    """
+    把 streamlink 輸出的 MPEG-TS 切成多個分段：
+    - 每 max_seconds 秒或 max_bytes 位元組後，在下一個影像關鍵幀（random_access_indicator 或 IDR/IRAP）切開
+    - 新分段開頭補上最近的 PAT/PMT，讓每個分段都能單獨播放與轉檔
+    - 分段資訊寫入 <base>.segments.json；每個分段關閉後立刻呼叫 on_segment_closed(path)
+    base_path 為不含副檔名的輸出路徑，分段命名為 <base>_seg001.ts、<base>_seg002.ts…
+    """
+
+    def __init__(self, base_path: str, max_seconds: Optional[float] = None, max_bytes: Optional[int] = None,
+                 on_segment_closed: Callable[[str], None] = None):
+        self.base_path = base_path
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.on_segment_closed = on_segment_closed
+        self.manifest_path = f"{base_path}{MANIFEST_SUFFIX}"
+        self.segments: list[dict] = []
+        self.total_bytes = 0
+        self.stitched = None
+        self._file = None
+        self._current = None
+        self._buffer = b""
+        self._pmt_pid = None
+        self._video_pid = None
+        self._video_type = None
+        self._pat = None
+        self._pmt = None
+        self._lock = threading.Lock()
+
+    # —— 分段檔案管理（子類可覆寫 _segment_path / _open_sink / _close_sink 改變輸出方式）——
+    def _segment_path(self, index: int) -> str:
+        return f"{self.base_path}_seg{index:03d}.ts"
+
+    def _open_sink(self, path: str):
+        return open(path, "wb")
+
+    def _close_sink(self, sink):
+        sink.close()
+
+    def _open_segment(self):
+        index = len(self.segments) + 1
+        path = self._segment_path(index)
+        self._file = self._open_sink(path)
+        self._current = {
+            "index": index,
+            "file": os.path.basename(path),
+            "start": time.time(),
+            "end": None,
+            "bytes": 0,
+            "status": "recording",
+            "output": None,
+        }
+        self.segments.append(self._current)
+        for table in (self._pat, self._pmt):
+            if table:
+                self._write(table)
+        self._save_manifest()
+        print(f"[TsSegmenter] 開始分段 {path}")
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        self._close_sink(self._file)
+        self._file = None
+        seg = self._current
+        seg["end"] = time.time()
+        path = os.path.join(os.path.dirname(self.base_path), seg["file"])
+        if seg["bytes"] == 0:
+            # 還沒寫入任何資料就結束（例如直播沒開）
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.segments.pop()
+            self._save_manifest()
+            return
+        seg["status"] = "closed"
+        self._save_manifest()
+        print(f"[TsSegmenter] 分段完成 {seg['file']}（{seg['bytes'] / 1024 / 1024:.1f} MB）")
+        if self.on_segment_closed:
+            self.on_segment_closed(path)
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+        self._current["bytes"] += len(data)
+        self.total_bytes += len(data)
+
+    def _due(self, pending: int = 0) -> bool:
+        """pending：這次 feed 中已掃過、尚未寫出的位元組數"""
+        seg = self._current
+        if self.max_seconds and time.time() - seg["start"] >= self.max_seconds:
+            return True
+        return bool(self.max_bytes and seg["bytes"] + pending >= self.max_bytes)
+
+    def update_segment(self, file: str, **fields):
+        """後處理完成後更新分段狀態（執行緒安全）"""
+        with self._lock:
+            for seg in self.segments:
+                if seg["file"] == file:
+                    seg.update(fields)
+            self._save_manifest_locked()
+
+    def _manifest_extra(self) -> dict:
+        return {}
+
+    def mark_stitched(self, out_file: str):
+        with self._lock:
+            self.stitched = os.path.basename(out_file)
+            self._save_manifest_locked()
+
+    def _save_manifest(self):
+        with self._lock:
+            self._save_manifest_locked()
+
+    def _save_manifest_locked(self):
+        tmp = f"{self.manifest_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"base": os.path.basename(self.base_path), "stitched": self.stitched,
+                       **self._manifest_extra(), "segments": self.segments}, f,
+                      ensure_ascii=False, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    # —— TS 解析 ——
+    def _inspect(self, pkt: bytes) -> bool:
+        """更新 PAT/PMT 狀態；回傳此封包是否為可切點（影像關鍵幀的第一個封包）"""
+        pid = ((pkt[1] & 0x1F) << 8) | pkt[2]
+        pusi = pkt[1] & 0x40
+        afc = (pkt[3] >> 4) & 0x3
+        offset = 4
+        rai = False
+        if afc & 0x2:
+            af_len = pkt[4]
+            if af_len > 0:
+                rai = bool(pkt[5] & 0x40)
+            offset += 1 + af_len
+        if not afc & 0x1 or offset >= TS_PACKET:
+            return False
+        payload = pkt[offset:]
+
+        if pid == 0 and pusi:
+            self._pat = pkt
+            section = _section(payload)
+            if section and len(section) >= 12:
+                for i in range(8, len(section) - 4, 4):
+                    program = (section[i] << 8) | section[i + 1]
+                    if program != 0:
+                        self._pmt_pid = ((section[i + 2] & 0x1F) << 8) | section[i + 3]
+                        break
+        elif pid == self._pmt_pid and pusi:
+            self._pmt = pkt
+            section = _section(payload)
+            if section and len(section) >= 16:
+                i = 12 + (((section[10] & 0x0F) << 8) | section[11])
+                while i + 5 <= len(section) - 4:
+                    stream_type = section[i]
+                    es_pid = ((section[i + 1] & 0x1F) << 8) | section[i + 2]
+                    if stream_type in VIDEO_STREAM_TYPES:
+                        self._video_pid, self._video_type = es_pid, stream_type
+                        break
+                    i += 5 + (((section[i + 3] & 0x0F) << 8) | section[i + 4])
+        elif pid == self._video_pid and pusi:
+            return rai or _is_keyframe_payload(payload, self._video_type)
+        return False
+
+    def feed(self, data: bytes):
+        if self._file is None:
+            self._open_segment()
+        data = self._buffer + data
+        # 重新對齊到 sync byte
+        start = 0
+        while start < len(data) and data[start] != SYNC_BYTE:
+            start += 1
+        end = start + (len(data) - start) // TS_PACKET * TS_PACKET
+        self._buffer = data[end:]
+        flushed = start
+        for pos in range(start, end, TS_PACKET):
+            # 只有 PAT / PMT / 影像 PID 且為 PES / section 開頭的封包需要解析，其餘直接寫出
+            if data[pos] != SYNC_BYTE or not data[pos + 1] & 0x40:
+                continue
+            pid = ((data[pos + 1] & 0x1F) << 8) | data[pos + 2]
+            if pid != 0 and pid != self._pmt_pid and pid != self._video_pid:
+                continue
+            if self._inspect(data[pos:pos + TS_PACKET]) and self._due(pos - flushed):
+                self._write(data[flushed:pos])
+                flushed = pos
+                self._close_segment()
+                self._open_segment()
+        self._write(data[flushed:end])
+
+    def close(self):
+        if self._buffer and self._file is not None:
+            self._write(self._buffer)
+        self._buffer = b""
+        self._close_segment()
+
+    def run(self, stream):
+        """讀取 stream 直到 EOF（streamlink 結束），最後關閉當前分段"""
+        try:
+            while True:
+                data = stream.read(READ_SIZE)
+                if not data:
+                    break
+                self.feed(data)
+        finally:
+            self.close()
+
+
+class SegmentPipeline:
+    """
+    分段後處理佇列：錄影中每關閉一個分段就丟進來，由背景執行緒依序呼叫 process(path)，
+    讓縮圖與轉檔跟錄影同時進行。process 回傳處理後的檔案路徑（失敗回傳 None）。
+    """
+
+    def __init__(self, process: Callable[[str], Optional[str]], on_done: Callable[[str, Optional[str]], None] = None):
+        self.process = process
+        self.on_done = on_done
+        self.results: dict[str, Optional[str]] = {}
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="segment-pipeline", daemon=True)
+        self._thread.start()
+
+    def submit(self, path: str):
+        self._queue.put(path)
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            if path is None:
+                return
+            try:
+                output = self.process(path)
+            except Exception as e:
+                print(f"[SegmentPipeline] 處理 {path} 失敗: {e}")
+                output = None
+            self.results[path] = output
+            if self.on_done:
+                self.on_done(path, output)
+
+    def finish(self) -> dict:
+        """等待所有已送出的分段處理完成"""
+        self._queue.put(None)
+        self._thread.join()
+        return self.results
+
+
+def stitch(files: list[str], out_file: str) -> bool:
+    """以 ffmpeg concat demuxer 串流複製（-c copy）把分段接成單一檔案"""
+    if not files:
+        return False
+    list_file = f"{out_file}.concat.txt"
+    with open(list_file, "w", encoding="utf-8") as f:
+        for path in files:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    cmd = [
+        "ffmpeg", "-hide_banner", "-y",
+        "-f", "concat", "-safe", "0",
+        "-i", list_file,
+        "-map", "0", "-c", "copy",
+        out_file,
+    ]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0 or not os.path.exists(out_file):
+            print(f"[TsSegmenter] 合併分段失敗: {result.stderr.strip()[-500:]}")
+            return False
+        return True
+    finally:
+        try:
+            os.remove(list_file)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,71 @@
+"""
+錄影 / 轉檔 worker：可以跑在其他節點上，從共用的工作表（job_store）領取工作。
+
+    RUN_MODE=worker python worker.py
+
+需要與 API 節點掛載相同的 /data（工作表、共用狀態）與 /recordings（輸出）。/data 所在的檔案系統
+必須支援 POSIX 檔案鎖；分散模式下 jobs.db / state.db 使用 rollback journal（見 state_store.JOURNAL_MODE），
+不要設 SQLITE_JOURNAL_MODE=WAL。
+WORKER_KINDS 決定要領取的工作種類（預設 record,transcode），WORKER_CONCURRENCY 為同時執行的工作數。
+"""
+import os
+import sys
+import socket
+
+os.environ.setdefault("RUN_MODE", "worker")
+
+import main  # noqa: E402  錄影與轉檔流程都在 main 裡
+from job_runner import JobRunner  # noqa: E402
+
+WORKER_ID = os.environ.get("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+WORKER_KINDS = [k.strip() for k in os.environ.get("WORKER_KINDS", "record,transcode").split(",") if k.strip()]
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", "2"))
+
+
+def _progress(job: dict):
+    """目前工作的進度（寫回工作表，API 節點據此顯示）"""
+    payload = job["payload"]
+    if job["kind"] == "transcode":
+        return main.transcode_progress(job)
+    task_id = payload["task"]["id"]
+    return {"recording": task_id in main.active_recordings, "out_file": main.recording_outputs.get(task_id)}
+
+
+def _cancel(job: dict):
+    if job["kind"] == "record":
+        proc = main.active_recordings.get(job["payload"]["task"]["id"])
+        if proc is not None:
+            proc.terminate()
+
+
+def _record(job: dict):
+    main.record_stream(main.Task(**job["payload"]["task"]))
+    return None
+
+
+HANDLERS = {"record": _record, "transcode": main.run_transcode_job}
+
+runner = JobRunner(
+    WORKER_ID,
+    {kind: HANDLERS[kind] for kind in WORKER_KINDS if kind in HANDLERS},
+    WORKER_CONCURRENCY,
+    progress=_progress,
+    cancel=_cancel,
+)
+
+
+def _shutdown(signum, frame):
+    print("[Worker] 收到結束訊號，停止領取工作並中止錄影")
+    runner.stop()
+    main.handle_shutdown(signum, frame)
+
+
+def run():
+    import signal
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+    runner.run()
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -32,6 +32,11 @@ const api = {
     async stopRecording(taskId) {
         await axios.post(`${API}/tasks/${taskId}/stop`);
     },
+    async getDashboard() {
+        // 每個任務的錄影中狀態、錄影數 / 總大小 / 最新時間、進行中的轉檔與最後一筆紀錄
+        const r = await axios.get(`${API}/dashboard`);
+        return r.data;
+    },
     async getActiveRecordings() {
         const res = await axios.get(`${API}/tasks/active_recordings`);
         return res.data;
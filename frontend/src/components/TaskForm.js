@@ -25,9 +25,18 @@ const defaultForm = {
   params: "",
   hls_enable: false,
   default_conversion_quality: "high", // 新增預設轉碼品質
-  tool: "Streamlink" // 新增工具選項預設
+  tool: "Streamlink", // 新增工具選項預設
+  keep_last: null, // 保留規則（空白表示不限制）
+  max_age_days: null,
+  max_gb: null,
+  segment_minutes: null, // 分段錄影（空白表示不分段）
+  segment_gb: null,
+  live_transcode: false, // 邊錄邊轉 HEVC
+  raw_keep_hours: null
 };
 
+const numberFields = ["keep_last", "max_age_days", "max_gb", "segment_minutes", "segment_gb", "raw_keep_hours"];
+
 export default function TaskForm({ open, task, onClose }) {
   const theme = useTheme();
   const fullScreen = useMediaQuery(theme.breakpoints.down('sm')); // Dialog fullScreen on small screens
@@ -42,6 +51,7 @@ export default function TaskForm({ open, task, onClose }) {
     let { name, value, type, checked } = e.target;
     if (type === "checkbox") value = checked;
     if (name === "interval") value = parseInt(value, 10) || 1;
+    if (numberFields.includes(name)) value = value === "" ? null : Number(value);
     setForm((prev) => ({ ...prev, [name]: value }));
   };
 
@@ -138,6 +148,73 @@ export default function TaskForm({ open, task, onClose }) {
             <MenuItem value="low">低壓縮 (最高畫質)</MenuItem>
           </Select>
         </FormControl>
+        <TextField
+          margin="dense"
+          label="保留最後幾集 (選填)"
+          name="keep_last"
+          type="number"
+          value={form.keep_last ?? ""}
+          onChange={handleChange}
+          fullWidth
+        />
+        <TextField
+          margin="dense"
+          label="最長保留天數 (選填)"
+          name="max_age_days"
+          type="number"
+          value={form.max_age_days ?? ""}
+          onChange={handleChange}
+          fullWidth
+        />
+        <TextField
+          margin="dense"
+          label="任務空間上限 GB (選填)"
+          name="max_gb"
+          type="number"
+          value={form.max_gb ?? ""}
+          onChange={handleChange}
+          fullWidth
+        />
+        <TextField
+          margin="dense"
+          label="每幾分鐘分段 (選填)"
+          name="segment_minutes"
+          type="number"
+          value={form.segment_minutes ?? ""}
+          onChange={handleChange}
+          fullWidth
+        />
+        <TextField
+          margin="dense"
+          label="每幾 GB 分段 (選填)"
+          name="segment_gb"
+          type="number"
+          value={form.segment_gb ?? ""}
+          onChange={handleChange}
+          fullWidth
+        />
+        <FormControlLabel
+          control={
+            <Checkbox
+              name="live_transcode"
+              checked={!!form.live_transcode}
+              onChange={handleChange}
+              color="primary"
+            />
+          }
+          label="邊錄邊轉 HEVC（錄影結束即可取得 mp4）"
+        />
+        {form.live_transcode && (
+          <TextField
+            margin="dense"
+            label="原始 TS 備份保留小時數 (選填，空白不保留)"
+            name="raw_keep_hours"
+            type="number"
+            value={form.raw_keep_hours ?? ""}
+            onChange={handleChange}
+            fullWidth
+          />
+        )}
         <FormControlLabel
           control={
             <Checkbox
@@ -12,30 +12,13 @@ import {
 import api from '../api';
 
 export default function TaskList({ tasks, reload, onSelectTask, onShowLogs, onEditTask }) {
-    const [activeTasks, setActiveTasks] = useState([]);
-    const [lastTimes, setLastTimes] = useState({});
-    const [recordCounts, setRecordCounts] = useState({});
+    const [summary, setSummary] = useState({});
 
-    // 获取录制状态、最新时间和录制数量
+    // 一次取得所有任务的录制状态、最新时间、录制数量与转档进度
     useEffect(() => {
         const fetchStatus = async () => {
             try {
-                const active = await api.getActiveRecordings();
-                setActiveTasks(active);
-
-                const times = {};
-                const counts = {};
-
-                await Promise.all(tasks.map(async (t) => {
-                    const recs = await api.listRecordings(t.id);
-                    if (recs.length > 0) {
-                        times[t.id] = recs[0].mtime;
-                    }
-                    counts[t.id] = recs.length;
-                }));
-
-                setLastTimes(times);
-                setRecordCounts(counts);
+                setSummary(await api.getDashboard());
             } catch (e) {
                 console.error('获取录制状态或时间失败', e);
             }
@@ -46,7 +29,9 @@ export default function TaskList({ tasks, reload, onSelectTask, onShowLogs, onEd
     return (
         <Box sx={{ p: 2, pb: 4, overflowX: 'hidden' }}> {/* Added pb: 4 for bottom padding */}
             <Grid container spacing={2} justifyContent="flex-start">
-                {tasks.map((t) => (
+                {tasks.map((t) => {
+                    const s = summary[t.id] || {};
+                    return (
                     <Grid item key={t.id} xs={12} sm={6} md={4} lg={3}>
                         <Card sx={{ height: '100%', display: 'flex', flexDirection: 'column', boxShadow: 2, borderRadius: 2 }}>
                             <CardContent sx={{ flexGrow: 1 }}>
@@ -54,7 +39,7 @@ export default function TaskList({ tasks, reload, onSelectTask, onShowLogs, onEd
                                     <Typography variant="h6" noWrap>
                                         {t.name}
                                     </Typography>
-                                    {activeTasks.includes(t.id) ? (
+                                    {s.active ? (
                                         <Chip label="錄影中" color="error" size="small" />
                                     ) : (
                                         <Chip label="空閒" size="small" />
@@ -69,14 +54,24 @@ export default function TaskList({ tasks, reload, onSelectTask, onShowLogs, onEd
                                 <Typography variant="body2" noWrap gutterBottom>
                                     路徑：{t.save_dir}
                                 </Typography>
-                                {recordCounts[t.id] != null && (
+                                {s.recordings != null && (
                                     <Typography variant="body2" color="text.secondary">
-                                        已錄製：{recordCounts[t.id]} 次
+                                        已錄製：{s.recordings} 次（{(s.total_bytes / 1024 / 1024 / 1024).toFixed(1)} GB）
                                     </Typography>
                                 )}
-                                {lastTimes[t.id] && (
-                                    <Typography variant="caption" color="text.secondary">
-                                        最新錄製：{new Date(lastTimes[t.id]).toLocaleString()}
+                                {s.last_recording && (
+                                    <Typography variant="caption" display="block" color="text.secondary">
+                                        最新錄製：{new Date(s.last_recording).toLocaleString()}
+                                    </Typography>
+                                )}
+                                {(s.conversions || []).map((c) => (
+                                    <Typography key={c.file} variant="caption" display="block" color="primary" noWrap>
+                                        轉檔{c.status === 'queued' ? '排隊中' : `中 ${Math.round(c.progress || 0)}%`}：{c.file}
+                                    </Typography>
+                                ))}
+                                {s.last_event && (
+                                    <Typography variant="caption" display="block" color="text.secondary" noWrap>
+                                        最後紀錄：{s.last_event.event} {s.last_event.msg}
                                     </Typography>
                                 )}
                             </CardContent>
@@ -93,7 +88,8 @@ export default function TaskList({ tasks, reload, onSelectTask, onShowLogs, onEd
                             </Box>
                         </Card>
                     </Grid>
-                ))}
+                    );
+                })}
             </Grid>
         </Box>
     );